@@ -50,8 +50,13 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Aktywny tylko przy QUERY_PROFILER (inaczej zgłasza MiddlewareNotUsed)
+    'sender.profiling.QueryProfilerMiddleware',
 ]
 
+# Profiler zapytań SQL per żądanie: nagłówki Server-Timing i raport pod /query-profile/
+QUERY_PROFILER = os.getenv('QUERY_PROFILER') == '1'
+
 ROOT_URLCONF = 'marketing.urls'
 
 TEMPLATES = [
@@ -71,17 +76,54 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'marketing.wsgi.application'
 
+# Pod ASGI (np. uvicorn marketing.asgi:application) widoki async (lista kampanii, API statusu)
+# nie zajmują wątku na żądanie
+ASGI_APPLICATION = 'marketing.asgi.application'
+
+# Ile wiadomości kampanii wysyłać równocześnie (ProviderPool.asend); 1 = po kolei
+DISPATCH_CONCURRENCY = int(os.getenv('DISPATCH_CONCURRENCY', '1'))
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Profil SQLite: WAL (czytelnicy nie blokują zapisującego i odwrotnie), fsync tylko
+# przy checkpointach, większy cache stron i mmap - ustawiane na każdym nowym połączeniu.
+# Czekanie na blokadę zamiast natychmiastowego "database is locked" ustawia tylko
+# OPTIONS['timeout'] - PRAGMA busy_timeout w init_command by je nadpisał
+SQLITE_PRAGMAS = {
+    # Miejsce po usuniętych wierszach oddawane porcjami (archive_message_logs --vacuum);
+    # musi być przed journal_mode, a na istniejącej bazie zaczyna działać po pierwszym pełnym VACUUM
+    'auto_vacuum': 'INCREMENTAL',
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,  # w KiB, ok. 20 MB na połączenie
+    'mmap_size': 134217728,  # 128 MB
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'timeout': 20,  # s
+        },
     }
 }
 
+# Opcjonalne osobne połączenie do zapisu (np. dla procesu wysyłki): transakcje
+# BEGIN IMMEDIATE biorą blokadę zapisu od razu, więc nie kończą się błędem
+# "database is locked" przy próbie podniesienia blokady w środku transakcji
+if os.getenv('SQLITE_DEDICATED_WRITER') == '1':
+    DATABASES['writer'] = {
+        **DATABASES['default'],
+        'OPTIONS': {**DATABASES['default']['OPTIONS'], 'transaction_mode': 'IMMEDIATE'},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['sender.routers.WriterRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -113,6 +155,9 @@ USE_I18N = True
 
 USE_TZ = True
 
+# Strefa czasowa okien wysyłki kampanii planowanych (godziny odbiorców)
+CAMPAIGN_TIMEZONE = 'Europe/Warsaw'
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
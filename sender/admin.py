@@ -1,64 +1,123 @@
+from django import forms
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
-from django.db.models import Count
-from .models import Campaign, Recipient, MessageLog, SMSProvider, EmailProvider
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Q
+from .models import Campaign, Contact, Recipient, MessageLog, MessageLogArchive, Suppression, SMSProvider, EmailProvider
+from .contacts import CONTACT_FIELDS, contact_digest, contact_key, contact_sort_name, invalidate_renders
+from .rendering import schedule_estimate, schedule_render
+from .search import search_recipients
+
+
+class CampaignFilter(admin.SimpleListFilter):
+    """
+    Filtr odbiorców po ID kampanii.
+    
+    Zamiast listy wszystkich kampanii (DISTINCT po całej tabeli) pokazuje tylko
+    aktualnie wybraną - kampanię wybiera się linkiem z listy kampanii.
+    """
+    title = 'Kampania'
+    parameter_name = 'campaign'
+    
+    def lookups(self, request, model_admin):
+        value = self.value()
+        if not value:
+            return []
+        try:
+            campaign = Campaign.objects.only('uid', 'name', 'message_type').get(uid=value)
+        except (Campaign.DoesNotExist, ValidationError):
+            return []
+        return [(str(campaign.uid), str(campaign))]
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            try:
+                return queryset.filter(campaign_id=self.value())
+            except ValidationError:
+                return queryset.none()
+        return queryset
 
 
 @admin.register(Campaign)
 class CampaignAdmin(admin.ModelAdmin):
-    list_display = ['name', 'message_type', 'recipients_count', 'sent_count', 'failed_count', 'is_completed', 'created_at']
-    list_filter = ['message_type', 'is_completed', 'created_at']
+    list_display = ['name', 'message_type', 'recipients_count', 'sent_count', 'failed_count', 'status', 'created_at']
+    list_filter = ['message_type', 'status', 'created_at', 'scheduled_at']
     search_fields = ['name', 'message_content']
-    readonly_fields = ['uid', 'created_at', 'excel_columns']
+    # Status zmienia wyłącznie maszyna stanów na ścieżce wysyłki
+    readonly_fields = ['uid', 'created_at', 'status', 'excel_columns', 'sms_estimate', 'delivery_stats']
     
     fieldsets = (
         ('Podstawowe Informacje', {
-            'fields': ('uid', 'name', 'message_type', 'message_content')
+            'fields': ('uid', 'name', 'message_type', 'message_content', 'sms_transliterate')
         }),
         ('Status', {
-            'fields': ('is_completed', 'created_at', 'sent_at')
+            'fields': ('status', 'created_at', 'sent_at')
+        }),
+        ('Planowanie', {
+            'fields': ('scheduled_at', 'send_window_start', 'send_window_end', 'spread_minutes'),
+            'description': 'Okno wysyłki w strefie CAMPAIGN_TIMEZONE; odbiorców wypuszcza komenda run_scheduler'
         }),
         ('Dane z Excel', {
             'fields': ('excel_columns',),
             'classes': ('collapse',)
         }),
+        ('Telemetria wysyłki', {
+            'fields': ('sms_estimate', 'delivery_stats'),
+            'classes': ('collapse',)
+        }),
     )
     
+    # Liczniki czytane z adnotacji get_queryset - jedno zapytanie na całą stronę listy
+    
     def recipients_count(self, obj):
-        count = obj.recipients.count()
-        url = reverse('admin:sender_recipient_changelist') + f'?campaign__uid__exact={obj.uid}'
-        return format_html('<a href="{}">{}</a>', url, count)
+        url = reverse('admin:sender_recipient_changelist') + f'?{CampaignFilter.parameter_name}={obj.uid}'
+        return format_html('<a href="{}">{}</a>', url, obj.recipients_total)
     recipients_count.short_description = 'Odbiorcy'
+    recipients_count.admin_order_field = 'recipients_total'
     
     def sent_count(self, obj):
-        count = obj.recipients.filter(status='sent').count()
-        return format_html('<span style="color: green;">{}</span>', count)
+        return format_html('<span style="color: green;">{}</span>', obj.sent_total)
     sent_count.short_description = 'Wysłane'
+    sent_count.admin_order_field = 'sent_total'
     
     def failed_count(self, obj):
-        count = obj.recipients.filter(status='failed').count()
-        if count > 0:
-            return format_html('<span style="color: red;">{}</span>', count)
-        return count
+        if obj.failed_total > 0:
+            return format_html('<span style="color: red;">{}</span>', obj.failed_total)
+        return obj.failed_total
     failed_count.short_description = 'Błędy'
+    failed_count.admin_order_field = 'failed_total'
     
     def get_queryset(self, request):
         return super().get_queryset(request).annotate(
-            recipients_total=Count('recipients')
+            recipients_total=Count('recipients'),
+            sent_total=Count('recipients', filter=Q(recipients__status='sent')),
+            failed_total=Count('recipients', filter=Q(recipients__status='failed')),
         )
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Jak przy edycji w aplikacji: nowa treść - renderowanie i szacunek w tle
+        if change and 'message_content' in form.changed_data:
+            schedule_render(obj)
+        elif change and {'message_type', 'sms_transliterate'} & set(form.changed_data):
+            schedule_estimate(obj)
 
 
 @admin.register(Recipient)
 class RecipientAdmin(admin.ModelAdmin):
     list_display = ['full_name', 'email', 'phone', 'campaign', 'status', 'sent_at']
-    list_filter = ['status', 'campaign__name', 'sent_at']
-    search_fields = ['first_name', 'last_name', 'email', 'phone']
-    readonly_fields = ['uid']
+    list_filter = ['status', CampaignFilter, 'sent_at']
+    search_fields = ['contact__first_name', 'contact__last_name', 'contact__email', 'contact__phone']
+    # Imię, nazwisko, email i telefon należą do kontaktu - edycja w kontakcie
+    readonly_fields = ['uid', 'first_name', 'last_name', 'email', 'phone']
+    autocomplete_fields = ['campaign']
+    raw_id_fields = ['contact']
+    show_full_result_count = False
     
     fieldsets = (
         ('Podstawowe Dane', {
-            'fields': ('uid', 'campaign', 'first_name', 'last_name', 'email', 'phone')
+            'fields': ('uid', 'campaign', 'contact', 'first_name', 'last_name', 'email', 'phone')
         }),
         ('Status Wysyłki', {
             'fields': ('status', 'sent_at', 'error_message')
@@ -73,23 +132,90 @@ class RecipientAdmin(admin.ModelAdmin):
         return f"{obj.first_name} {obj.last_name}"
     full_name.short_description = 'Imię i Nazwisko'
     
+    def get_search_results(self, request, queryset, search_term):
+        # Wyszukiwanie przez indeks (FTS5 / pg_trgm) zamiast czterech icontains
+        return search_recipients(queryset, search_term), False
+    
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('campaign')
+        return super().get_queryset(request).select_related('campaign', 'contact')
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Inne dane odbiorcy - inny szacunek SMS kampanii
+        schedule_estimate(obj.campaign)
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        schedule_estimate(obj.campaign)
+    
+    def delete_queryset(self, request, queryset):
+        campaigns = list(Campaign.objects.filter(recipients__in=queryset).distinct())
+        super().delete_queryset(request, queryset)
+        for campaign in campaigns:
+            schedule_estimate(campaign)
+
+
+class ContactAdminForm(forms.ModelForm):
+    """Klucz i skrót kontaktu liczone jak przy imporcie - kolizja to błąd formularza, nie IntegrityError"""
+    
+    class Meta:
+        model = Contact
+        fields = CONTACT_FIELDS
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        values = {
+            field: cleaned_data.get(field, getattr(self.instance, field)) or (None if field in ('email', 'phone') else '')
+            for field in CONTACT_FIELDS
+        }
+        key = contact_key(values['email'], values['phone'])
+        if not key:
+            raise forms.ValidationError('Kontakt musi mieć poprawny email albo telefon.')
+        digest = contact_digest(key, values)
+        if Contact.objects.filter(digest=digest).exclude(pk=self.instance.pk).exists():
+            raise forms.ValidationError('Kontakt z tymi samymi danymi już istnieje.')
+        self.instance.key, self.instance.digest = key, digest
+        return cleaned_data
+
+
+@admin.register(Contact)
+class ContactAdmin(admin.ModelAdmin):
+    form = ContactAdminForm
+    list_display = ['key', 'first_name', 'last_name', 'email', 'phone', 'updated_at']
+    search_fields = ['key', 'first_name', 'last_name', 'email', 'phone']
+    readonly_fields = ['key', 'digest', 'created_at', 'updated_at']
+    show_full_result_count = False
+    
+    def get_readonly_fields(self, request, obj=None):
+        # Dane, na które już wysłano, zostają bez zmian - poprawka to nowy kontakt przy imporcie
+        if obj is not None and obj.recipients.exclude(status='pending').exists():
+            return CONTACT_FIELDS + self.readonly_fields
+        return self.readonly_fields
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and form.changed_data:
+            # Nowe dane trafią do listy i treści oczekujących odbiorców tego kontaktu
+            obj.recipients.update(sort_name=contact_sort_name({'first_name': obj.first_name, 'last_name': obj.last_name}))
+            invalidate_renders([obj.pk])
 
 
 @admin.register(MessageLog)
 class MessageLogAdmin(admin.ModelAdmin):
     list_display = ['recipient', 'message_type', 'success', 'sent_at']
     list_filter = ['message_type', 'success', 'sent_at']
-    search_fields = ['recipient__first_name', 'recipient__last_name', 'recipient__email']
-    readonly_fields = ['uid', 'sent_at']
+    # Pola wyszukiwania tylko włączają pole szukania - samo wyszukiwanie w get_search_results
+    search_fields = ['recipient__contact__first_name', 'recipient__contact__last_name', 'recipient__contact__email']
+    readonly_fields = ['uid', 'sent_at', 'final_message', 'body']
+    autocomplete_fields = ['recipient']
+    show_full_result_count = False
     
     fieldsets = (
         ('Podstawowe Informacje', {
             'fields': ('uid', 'recipient', 'message_type', 'success', 'sent_at')
         }),
         ('Treść Wiadomości', {
-            'fields': ('final_message',)
+            'fields': ('final_message', 'body')
         }),
         ('Szczegóły', {
             'fields': ('error_details', 'provider_response'),
@@ -97,40 +223,76 @@ class MessageLogAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_search_results(self, request, queryset, search_term):
+        # Odbiorcy z indeksu wyszukiwania, a ich logi po indeksie (recipient, sent_at) -
+        # zamiast icontains przez dwa złączenia na największej tabeli
+        if not search_term:
+            return queryset, False
+        recipients = search_recipients(Recipient.objects.all(), search_term)
+        return queryset.filter(recipient__in=recipients.values('uid')), False
+    
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('recipient', 'recipient__campaign')
+        return super().get_queryset(request).select_related('recipient__contact', 'recipient__campaign', 'body')
+
+
+@admin.register(MessageLogArchive)
+class MessageLogArchiveAdmin(admin.ModelAdmin):
+    list_display = ['campaign', 'format', 'log_count', 'created_at']
+    list_filter = ['format', 'created_at']
+    list_select_related = ['campaign']
+    readonly_fields = ['campaign', 'path', 'format', 'log_count', 'summary', 'created_at']
+    
+    def has_add_permission(self, request):
+        # Archiwa tworzy wyłącznie komenda archive_message_logs
+        return False
+
+
+@admin.register(Suppression)
+class SuppressionAdmin(admin.ModelAdmin):
+    list_display = ['value', 'kind', 'reason', 'source', 'created_at']
+    list_filter = ['kind', 'reason', 'created_at']
+    search_fields = ['value', 'source']
+    readonly_fields = ['created_at']
+    
+    def save_model(self, request, obj, form, change):
+        # Ta sama postać co przy sprawdzaniu odbiorców (email małymi literami, telefon E.164)
+        from .suppression import NORMALIZERS
+        obj.value = NORMALIZERS[obj.kind](obj.value) or obj.value
+        super().save_model(request, obj, form, change)
 
 
 @admin.register(SMSProvider)
 class SMSProviderAdmin(admin.ModelAdmin):
-    list_display = ['name', 'class_name', 'is_active']
+    list_display = ['name', 'class_name', 'is_active', 'updated_at']
+    readonly_fields = ['updated_at']
     list_filter = ['is_active']
     search_fields = ['name', 'class_name']
     
     fieldsets = (
         ('Podstawowe Informacje', {
-            'fields': ('name', 'class_name', 'is_active')
+            'fields': ('name', 'class_name', 'is_active', 'updated_at')
         }),
         ('Konfiguracja', {
             'fields': ('config',),
-            'description': 'Konfiguracja w formacie JSON (klucze API, URLs, etc.)'
+            'description': 'Konfiguracja w formacie JSON (klucze API, URLs, etc.); opcjonalnie weight, timeout, failure_threshold, reset_timeout'
         }),
     )
 
 
 @admin.register(EmailProvider)
 class EmailProviderAdmin(admin.ModelAdmin):
-    list_display = ['name', 'class_name', 'is_active']
+    list_display = ['name', 'class_name', 'is_active', 'updated_at']
+    readonly_fields = ['updated_at']
     list_filter = ['is_active']
     search_fields = ['name', 'class_name']
     
     fieldsets = (
         ('Podstawowe Informacje', {
-            'fields': ('name', 'class_name', 'is_active')
+            'fields': ('name', 'class_name', 'is_active', 'updated_at')
         }),
         ('Konfiguracja', {
             'fields': ('config',),
-            'description': 'Konfiguracja w formacie JSON (SMTP settings, API keys, etc.)'
+            'description': 'Konfiguracja w formacie JSON (SMTP settings, API keys, etc.); opcjonalnie weight, timeout, failure_threshold, reset_timeout'
         }),
     )
 
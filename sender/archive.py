@@ -0,0 +1,307 @@
+import gzip
+import json
+import logging
+import os
+import struct
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .models import MessageLogArchive
+
+logger = logging.getLogger(__name__)
+
+# Archiwum JSONL to ciąg niezależnych członów gzip (bloków) po ok. tylu bajtach rekordów;
+# odczyt logów kilku odbiorców rozpakowuje tylko ich bloki
+ARCHIVE_BLOCK_SIZE = getattr(settings, 'MESSAGE_LOG_ARCHIVE_BLOCK_SIZE', 16 * 1024)
+
+# Wpis indeksu bloków (plik .idx obok archiwum): UUID odbiorcy, przesunięcie i długość bloku
+INDEX_ENTRY = struct.Struct('>16sQI')
+
+def get_archive_dir():
+    return Path(getattr(settings, 'MESSAGE_LOG_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'archive'))
+
+
+def log_to_record(log):
+    """Zamienia MessageLog (z select_related('body')) na płaski rekord archiwum"""
+    return {
+        'uid': str(log.uid),
+        'recipient_id': str(log.recipient_id),
+        'message_type': log.message_type,
+        'success': log.success,
+        'sent_at': log.sent_at.isoformat() if log.sent_at else None,
+        'error_details': log.error_details,
+        'provider_response': json.dumps(log.provider_response, ensure_ascii=False),
+        'body_id': log.body_id,
+        'final_message': log.body.text,
+    }
+
+
+def index_path(path):
+    return Path(f'{path}.idx')
+
+
+class ArchiveWriter:
+    """
+    Zapisuje rekordy logów kampanii do pliku archiwum partiami.
+
+    Rekordy powinny przychodzić pogrupowane po odbiorcy. JSONL jest zapisywany
+    blokami (osobny człon gzip na ok. ARCHIVE_BLOCK_SIZE bajtów, granica zawsze
+    między odbiorcami), a obok powstaje posortowany indeks odbiorca → blok.
+    Parquet dostaje grupę wierszy na partię - statystyki min/max recipient_id
+    pozwalają czytnikowi pominąć pozostałe grupy.
+
+    Pliki powstają pod tymczasowymi nazwami i są przemianowywane dopiero w close(),
+    więc przerwany zapis nigdy nie zostawia "połówki" archiwum pod docelową nazwą.
+    """
+
+    def __init__(self, campaign, fmt='jsonl', directory=None):
+        self.campaign = campaign
+        self.format = fmt
+        directory = Path(directory or get_archive_dir())
+        directory.mkdir(parents=True, exist_ok=True)
+
+        suffix = 'jsonl.gz' if fmt == 'jsonl' else 'parquet'
+        stamp = timezone.now().strftime('%Y%m%d%H%M%S')
+        self.path = directory / f'{campaign.uid}-{stamp}.{suffix}'
+        self.tmp_path = self.path.with_name(self.path.name + '.tmp')
+        self.index_path = index_path(self.path)
+        self.count = 0
+        self._summary = {}
+
+        if fmt == 'jsonl':
+            self._file = open(self.tmp_path, 'wb')
+            self._block = []
+            self._block_size = 0
+            self._block_recipients = []
+            self._index = []
+        elif fmt == 'parquet':
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                logger.error("pyarrow not installed. Run: pip install pyarrow")
+                raise
+            self._pa = pa
+            self._schema = pa.schema([
+                ('uid', pa.string()), ('recipient_id', pa.string()), ('message_type', pa.string()),
+                ('success', pa.bool_()), ('sent_at', pa.string()), ('error_details', pa.string()),
+                ('provider_response', pa.string()), ('body_id', pa.string()), ('final_message', pa.string()),
+            ])
+            self._file = pq.ParquetWriter(str(self.tmp_path), self._schema, compression='zstd')
+        else:
+            raise ValueError(f'Nieznany format archiwum: {fmt}')
+
+    def write(self, records):
+        if self.format == 'jsonl':
+            for record in records:
+                recipient_id = record['recipient_id']
+                if self._block_size >= ARCHIVE_BLOCK_SIZE and recipient_id != self._block_recipients[-1]:
+                    self._flush_block()
+                line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+                self._block.append(line)
+                self._block_size += len(line)
+                if not self._block_recipients or self._block_recipients[-1] != recipient_id:
+                    self._block_recipients.append(recipient_id)
+        else:
+            self._file.write_table(self._pa.Table.from_pylist(records, schema=self._schema))
+
+        for record in records:
+            self._summarize(record)
+        self.count += len(records)
+
+    def _summarize(self, record):
+        stats = self._summary.setdefault(record['message_type'], {
+            'sent': 0, 'failed': 0, 'first_sent_at': None, 'last_sent_at': None,
+        })
+        stats['sent' if record['success'] else 'failed'] += 1
+        sent_at = record['sent_at']
+        if sent_at:
+            if not stats['first_sent_at'] or sent_at < stats['first_sent_at']:
+                stats['first_sent_at'] = sent_at
+            if not stats['last_sent_at'] or sent_at > stats['last_sent_at']:
+                stats['last_sent_at'] = sent_at
+
+    def _flush_block(self):
+        if not self._block:
+            return
+        offset = self._file.tell()
+        self._file.write(gzip.compress(b''.join(self._block)))
+        length = self._file.tell() - offset
+        # Odbiorca rozdzielony między partie może mieć kilka wpisów - czytnik bierze wszystkie
+        for recipient_id in set(self._block_recipients):
+            self._index.append(INDEX_ENTRY.pack(uuid.UUID(recipient_id).bytes, offset, length))
+        self._block = []
+        self._block_size = 0
+        self._block_recipients = []
+
+    @property
+    def summary(self):
+        return self._summary
+
+    def close(self):
+        if self.format == 'jsonl':
+            self._flush_block()
+            self._index.sort()
+            index_tmp = self.index_path.with_name(self.index_path.name + '.tmp')
+            with open(index_tmp, 'wb') as index:
+                index.write(b''.join(self._index))
+                index.flush()
+                os.fsync(index.fileno())
+            os.replace(index_tmp, self.index_path)
+        self._file.close()
+        with open(self.tmp_path, 'rb') as written:
+            os.fsync(written.fileno())
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        try:
+            self._file.close()
+        finally:
+            for path in (self.tmp_path, self.index_path.with_name(self.index_path.name + '.tmp')):
+                if path.exists():
+                    path.unlink()
+
+
+def _lookup_blocks(index, recipient_id):
+    """Bloki odbiorcy z posortowanego indeksu - wyszukiwanie binarne bez wczytywania całego pliku"""
+    key = uuid.UUID(recipient_id).bytes
+    index.seek(0, os.SEEK_END)
+    low, high = 0, index.tell() // INDEX_ENTRY.size
+    while low < high:
+        middle = (low + high) // 2
+        index.seek(middle * INDEX_ENTRY.size)
+        if index.read(16) < key:
+            low = middle + 1
+        else:
+            high = middle
+
+    blocks = []
+    index.seek(low * INDEX_ENTRY.size)
+    while True:
+        entry = index.read(INDEX_ENTRY.size)
+        if len(entry) < INDEX_ENTRY.size:
+            break
+        entry_key, offset, length = INDEX_ENTRY.unpack(entry)
+        if entry_key != key:
+            break
+        blocks.append((offset, length))
+    return blocks
+
+
+def _read_jsonl(path, recipient_ids):
+    index_file = index_path(path)
+    if not index_file.exists():
+        # Archiwum bez indeksu - przegląd całego pliku
+        with gzip.open(path, 'rt', encoding='utf-8') as archive:
+            for line in archive:
+                record = json.loads(line)
+                if record['recipient_id'] in recipient_ids:
+                    yield record
+        return
+
+    with open(index_file, 'rb') as index:
+        blocks = sorted({block for recipient_id in recipient_ids for block in _lookup_blocks(index, recipient_id)})
+    with open(path, 'rb') as archive:
+        for offset, length in blocks:
+            archive.seek(offset)
+            for line in gzip.decompress(archive.read(length)).splitlines():
+                record = json.loads(line)
+                if record['recipient_id'] in recipient_ids:
+                    yield record
+
+
+def _read_parquet(path, recipient_ids):
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(
+        path,
+        columns=['recipient_id', 'sent_at', 'final_message'],
+        filters=[('recipient_id', 'in', list(recipient_ids))],
+    )
+    yield from table.to_pylist()
+
+
+def read_archived_messages(campaign, recipient_ids):
+    """
+    Zwraca {recipient_id: treść} z archiwów kampanii - ostatnia wysłana wiadomość odbiorcy.
+
+    Czyta tylko bloki (JSONL z indeksem) lub grupy wierszy (Parquet) podanych
+    odbiorców, więc koszt zależy od liczby odbiorców, a nie od rozmiaru archiwum.
+    """
+    recipient_ids = {str(uid) for uid in recipient_ids}
+    if not recipient_ids:
+        return {}
+
+    latest = {}
+    for archive in campaign.log_archives.order_by('created_at'):
+        if not os.path.exists(archive.path):
+            logger.warning(f"Archive file missing: {archive.path}")
+            continue
+        reader = _read_parquet if archive.format == 'parquet' else _read_jsonl
+        for record in reader(Path(archive.path), recipient_ids):
+            current = latest.get(record['recipient_id'])
+            if current is None or (record['sent_at'] or '') >= (current['sent_at'] or ''):
+                latest[record['recipient_id']] = record
+
+    return {recipient_id: record['final_message'] for recipient_id, record in latest.items()}
+
+
+def register_archive(writer, include_summary=False):
+    """Zapisuje w bazie informację o zamkniętym pliku archiwum"""
+    return MessageLogArchive.objects.create(
+        campaign=writer.campaign,
+        path=str(writer.path),
+        format=writer.format,
+        log_count=writer.count,
+        summary=writer.summary if include_summary else {},
+    )
+
+
+def reclaim_space(using='default', pages=1000, pause=0.05):
+    """
+    Oddaje systemowi miejsce po usuniętych logach.
+
+    SQLite z auto_vacuum=INCREMENTAL zwalnia wolne strony porcjami
+    (incremental_vacuum), z przerwami, żeby nie blokować zapisów wysyłki.
+    Bez tego trybu wykonuje pełny VACUUM (blokuje bazę na czas przepisania
+    pliku i włącza tryb przyrostowy na przyszłość). PostgreSQL: VACUUM ANALYZE
+    tabeli logów.
+
+    Returns:
+        dict: wolne strony przed i po (SQLite) albo {}
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM (ANALYZE) sender_messagelog')
+        return {}
+    if connection.vendor != 'sqlite':
+        return {}
+
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA freelist_count')
+        before = cursor.fetchone()[0]
+        cursor.execute('PRAGMA auto_vacuum')
+        incremental = cursor.fetchone()[0] == 2
+        if incremental:
+            while True:
+                cursor.execute('PRAGMA freelist_count')
+                if not cursor.fetchone()[0]:
+                    break
+                # incremental_vacuum zwalnia strony przy kolejnych krokach wyniku - trzeba go przeczytać
+                cursor.execute(f'PRAGMA incremental_vacuum({int(pages)})')
+                cursor.fetchall()
+                if pause:
+                    time.sleep(pause)
+        else:
+            cursor.execute('VACUUM')
+        cursor.execute('PRAGMA freelist_count')
+        after = cursor.fetchone()[0]
+
+    # Indeks FTS opiera się na id kontaktów (alias rowid) - VACUUM go nie zmienia
+    return {'free_pages_before': before, 'free_pages_after': after, 'incremental': incremental}
@@ -0,0 +1,410 @@
+import asyncio
+import inspect
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+
+from .metrics import PROVIDER_REQUEST_SECONDS, PROVIDER_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Waga EWMA najnowszej próbki (większa = szybsza reakcja na zmiany)
+HEALTH_ALPHA = getattr(settings, 'PROVIDER_HEALTH_ALPHA', 0.2)
+
+# Powyżej tego udziału błędów provider dostaje tylko ruch próbny
+FAILOVER_ERROR_RATE = getattr(settings, 'PROVIDER_FAILOVER_ERROR_RATE', 0.5)
+
+# Udział ruchu próbnego dla niezdrowego providera (żeby jego statystyki mogły się poprawić)
+PROBE_SHARE = 0.02
+
+# Ile providerów łącznie spróbować dla jednej wiadomości
+FAILOVER_ATTEMPTS = getattr(settings, 'PROVIDER_FAILOVER_ATTEMPTS', 2)
+
+# Circuit breaker: tyle kolejnych błędów otwiera obwód, po tylu sekundach przepuszczana jest próba
+CIRCUIT_FAILURE_THRESHOLD = getattr(settings, 'PROVIDER_CIRCUIT_FAILURE_THRESHOLD', 5)
+CIRCUIT_RESET_TIMEOUT = getattr(settings, 'PROVIDER_CIRCUIT_RESET_TIMEOUT', 30)
+
+# Twardy limit czasu jednego wywołania send() providera (s)
+CALL_TIMEOUT = getattr(settings, 'PROVIDER_CALL_TIMEOUT', 15)
+
+# Providery bez własnego limitu czasu gniazda (bez set_timeout) są wywoływane we wspólnej
+# puli wątków procesu; po przekroczeniu limitu wątek zostaje zajęty do końca wywołania,
+# więc provider z tyloma zawieszonymi wywołaniami jest pomijany, zanim zajmie całą pulę
+CALL_THREADS = getattr(settings, 'PROVIDER_CALL_THREADS', 16)
+MAX_HUNG_CALLS = getattr(settings, 'PROVIDER_MAX_HUNG_CALLS', 2)
+
+_call_executor = ThreadPoolExecutor(max_workers=CALL_THREADS, thread_name_prefix='provider')
+
+
+class ProvidersUnavailable(Exception):
+    """Wszystkie obwody providerów danego typu są otwarte - wysyłkę trzeba wstrzymać"""
+
+
+class CircuitBreaker:
+    """
+    Obwód providera: closed (normalna praca) → open po CIRCUIT_FAILURE_THRESHOLD
+    kolejnych błędach (wywołania odrzucane bez czekania na timeout) → half-open
+    po CIRCUIT_RESET_TIMEOUT (jedno wywołanie próbne) → closed albo znowu open.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        self.failure_threshold = CIRCUIT_FAILURE_THRESHOLD if failure_threshold is None else failure_threshold
+        self.reset_timeout = CIRCUIT_RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_running = False
+        return self._state
+
+    def allow(self):
+        """Czy można teraz wywołać providera (w half-open tylko jedno wywołanie naraz)"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def is_available(self):
+        with self._lock:
+            state = self._current_state()
+            return state == self.CLOSED or (state == self.HALF_OPEN and not self._trial_running)
+
+    def record(self, success):
+        with self._lock:
+            if success:
+                self._state = self.CLOSED
+                self.failures = 0
+            else:
+                self.failures += 1
+                if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                    if self._state != self.OPEN:
+                        logger.warning(f"Circuit opened after {self.failures} consecutive failures")
+                    self._state = self.OPEN
+                    self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class ProviderHealth:
+    """Średnie kroczące (EWMA) udziału błędów i czasu odpowiedzi providera"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.error_rate = 0.0
+        self.latency = None
+        self.attempts = 0
+
+    def record(self, success, elapsed):
+        with self._lock:
+            self.attempts += 1
+            self.error_rate += HEALTH_ALPHA * ((0.0 if success else 1.0) - self.error_rate)
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency += HEALTH_ALPHA * (elapsed - self.latency)
+
+    @property
+    def is_healthy(self):
+        return self.error_rate < FAILOVER_ERROR_RATE
+
+
+class PooledProvider:
+    """
+    Provider w puli: waga, kondycja, obwód i limit czasu wywołania.
+
+    Provider z metodą set_timeout(sekundy) sam przerywa wywołanie po limicie
+    (timeout gniazda SMTP/HTTP) i rzuca wtedy TimeoutError - jest wywoływany
+    bezpośrednio w wątku wysyłki. Pozostałe działają we wspólnej puli wątków,
+    a limit jest pilnowany przez oczekiwanie na wynik.
+    """
+
+    def __init__(self, name, provider, weight=1, timeout=None, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.provider = provider
+        self.weight = max(float(weight), 0.0)
+        self.timeout = CALL_TIMEOUT if timeout is None else timeout
+        self.health = ProviderHealth()
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        # Provider z async def send (np. AsyncSMTPEmailProvider) albo klasyczny synchroniczny
+        self.is_async = inspect.iscoroutinefunction(provider.send)
+        self.own_timeout = hasattr(provider, 'set_timeout')
+        if self.own_timeout:
+            provider.set_timeout(self.timeout)
+        # Wywołania porzucone po limicie czasu, które wciąż zajmują wątek wspólnej puli
+        self._hung = 0
+        self._hung_lock = threading.Lock()
+
+    def is_available(self):
+        return self._hung < MAX_HUNG_CALLS and self.breaker.is_available()
+
+    def call(self, *args):
+        if self.is_async:
+            # Każde wywołanie z kodu synchronicznego ma własną pętlę zdarzeń - jej połączenia
+            # trzeba zamknąć od razu (współdzielone są tylko w wysyłce równoległej)
+            return async_to_sync(self._call_once)(*args)
+        return self.provider.send(*args)
+
+    async def _call_once(self, *args):
+        try:
+            return await self.provider.send(*args)
+        finally:
+            await self.aclose()
+
+    async def acall(self, *args):
+        if self.is_async:
+            return await self.provider.send(*args)
+        # Synchroniczny provider w wątku - nie blokuje pętli zdarzeń, a timeout gniazda kończy wywołanie
+        return await sync_to_async(self.provider.send, thread_sensitive=False)(*args)
+
+    def abandon(self, future):
+        """Wywołanie po limicie czasu - wątek puli wraca, gdy provider w końcu odpowie"""
+        with self._hung_lock:
+            self._hung += 1
+
+        def release(_):
+            with self._hung_lock:
+                self._hung -= 1
+
+        future.add_done_callback(release)
+
+    async def aclose(self):
+        """Zamyka połączenia providera asynchronicznego otwarte w bieżącej pętli zdarzeń"""
+        if hasattr(self.provider, 'aclose'):
+            await self.provider.aclose()
+
+
+class ProviderPool:
+    """
+    Rozkłada wysyłkę na aktywnych providerów danego typu.
+
+    Provider jest losowany proporcjonalnie do wagi z konfiguracji, pomnożonej
+    przez bieżącą kondycję: udział sukcesów (EWMA) i czas odpowiedzi względem
+    najszybszego providera. Provider z udziałem błędów powyżej
+    FAILOVER_ERROR_RATE dostaje tylko ruch próbny, a nieudana wiadomość jest
+    ponawiana u innego providera. send() przyjmuje argumenty jak provider i
+    zwraca jego wynik uzupełniony o telemetrię wysyłki; asend() to samo
+    dla kodu asynchronicznego (providery synchroniczne działają wtedy w wątkach).
+
+    Każde wywołanie ma limit czasu, a provider z otwartym obwodem (albo z
+    MAX_HUNG_CALLS zawieszonymi wywołaniami) jest pomijany; gdy żaden nie jest
+    dostępny, send() rzuca ProvidersUnavailable. Pula nie ma własnych wątków,
+    więc przebudowa puli przez rejestr niczego nie zostawia.
+    """
+
+    def __init__(self, members):
+        self.members = [member for member in members if member.weight > 0]
+
+    def __len__(self):
+        return len(self.members)
+
+    def effective_weights(self, members):
+        latencies = [member.health.latency for member in members if member.health.latency]
+        fastest = min(latencies) if latencies else None
+        healthy = any(member.health.is_healthy for member in members)
+
+        weights = []
+        for member in members:
+            health = member.health
+            if healthy and not health.is_healthy:
+                weights.append(member.weight * PROBE_SHARE)
+                continue
+            weight = member.weight * (1.0 - health.error_rate) ** 2
+            if fastest and health.latency:
+                weight *= fastest / health.latency
+            weights.append(max(weight, member.weight * PROBE_SHARE))
+        return weights
+
+    def is_available(self):
+        return any(member.is_available() for member in self.members)
+
+    def choose(self, exclude=()):
+        candidates = [
+            member for member in self.members
+            if member not in exclude and member.is_available()
+        ]
+        while candidates:
+            if len(candidates) == 1:
+                member = candidates[0]
+            else:
+                member = random.choices(candidates, weights=self.effective_weights(candidates))[0]
+            # allow() rezerwuje jedyne wywołanie próbne w half-open - inny wątek mógł być pierwszy
+            if member.breaker.allow():
+                return member
+            candidates.remove(member)
+        return None
+
+    def _call(self, member, args):
+        try:
+            if member.own_timeout:
+                return tuple(member.call(*args)), False
+            future = _call_executor.submit(member.call, *args)
+            try:
+                return tuple(future.result(timeout=member.timeout)), False
+            except FutureTimeoutError:
+                member.abandon(future)
+                raise TimeoutError
+        except TimeoutError:
+            return self._timed_out(member), True
+        except Exception as e:
+            logger.error(f"Provider {member.name} raised: {str(e)}")
+            return (False, f"Błąd: {str(e)}", {}), False
+
+    async def _acall(self, member, args):
+        try:
+            if member.is_async:
+                # Korutynę da się przerwać - anulowanie zamyka połączenie
+                return tuple(await asyncio.wait_for(member.acall(*args), member.timeout)), False
+            if member.own_timeout:
+                return tuple(await member.acall(*args)), False
+            future = _call_executor.submit(member.call, *args)
+            try:
+                return tuple(await asyncio.wait_for(asyncio.wrap_future(future), member.timeout)), False
+            except asyncio.TimeoutError:
+                member.abandon(future)
+                raise
+        except (TimeoutError, asyncio.TimeoutError):
+            return self._timed_out(member), True
+        except Exception as e:
+            logger.error(f"Provider {member.name} raised: {str(e)}")
+            return (False, f"Błąd: {str(e)}", {}), False
+
+    def _timed_out(self, member):
+        logger.error(f"Provider {member.name} did not answer within {member.timeout}s")
+        return False, f"Przekroczono limit czasu ({member.timeout} s) - wynik wysyłki nieznany", {}
+
+    def _record(self, member, result, timed_out, elapsed, attempt):
+        """
+        Zapisuje wynik próby w kondycji, obwodzie i metrykach providera.
+
+        Returns:
+            tuple: (telemetry: dict, final: bool - czy nie próbować u kolejnego providera)
+        """
+        success, error, details = result
+        # Trwały błąd odbiorcy (np. nieistniejący numer) nie świadczy o awarii providera
+        permanent = bool(details.get('permanent'))
+        member.health.record(success or permanent, elapsed)
+        member.breaker.record(success or permanent)
+        PROVIDER_REQUEST_SECONDS.observe(elapsed, provider=member.name)
+        PROVIDER_REQUESTS.inc(
+            provider=member.name, result='success' if success else 'timeout' if timed_out else 'failure'
+        )
+        telemetry = {
+            'provider': member.name,
+            'latency_ms': round(elapsed * 1000, 1),
+            'attempt': attempt,
+            **details,
+        }
+        if timed_out:
+            telemetry['timed_out'] = True
+
+        # Po przekroczeniu limitu wiadomość mogła jednak wyjść - ponowienie groziłoby duplikatem;
+        # trwały błąd odbiorcy powtórzyłby się u każdego providera
+        final = bool(success or timed_out or permanent)
+        if not final and attempt < len(self.members):
+            logger.warning(f"Provider {member.name} failed ({error}), failing over")
+        return telemetry, final
+
+    def _unavailable(self):
+        return ProvidersUnavailable(f"Wszyscy providerzy niedostępni (otwarte obwody lub zawieszone wywołania: {', '.join(m.name for m in self.members)})")
+
+    def send(self, *args):
+        """
+        Wyślij przez wybranego providera, a w razie błędu spróbuj u następnego.
+
+        Provider zawsze zwraca (success, error, details), gdzie details to np.
+        {'message_id': ..., 'points': ...} z bramki, {'permanent': True} przy
+        trwałym błędzie odbiorcy albo pusty słownik.
+
+        Returns:
+            tuple: (success: bool, error_message: str or None, telemetry: dict) -
+                telemetry: provider, latency_ms (ostatniej próby), attempt (numer
+                próby, > 1 po failoverze) i details providera
+
+        Raises:
+            ProvidersUnavailable: gdy żaden provider nie ma zamkniętego (lub próbnego) obwodu
+        """
+        tried = []
+        result = None
+        telemetry = {}
+        for _ in range(min(FAILOVER_ATTEMPTS, len(self.members))):
+            member = self.choose(exclude=tried)
+            if member is None:
+                break
+            tried.append(member)
+
+            started = time.monotonic()
+            result, timed_out = self._call(member, args)
+            telemetry, final = self._record(member, result, timed_out, time.monotonic() - started, len(tried))
+            if final:
+                break
+
+        if result is None:
+            raise self._unavailable()
+        return result[0], result[1], telemetry
+
+    async def asend(self, *args):
+        """Jak send(), dla kodu asynchronicznego - limit czasu przez asyncio.wait_for"""
+        tried = []
+        result = None
+        telemetry = {}
+        for _ in range(min(FAILOVER_ATTEMPTS, len(self.members))):
+            member = self.choose(exclude=tried)
+            if member is None:
+                break
+            tried.append(member)
+
+            started = time.monotonic()
+            result, timed_out = await self._acall(member, args)
+            telemetry, final = self._record(member, result, timed_out, time.monotonic() - started, len(tried))
+            if final:
+                break
+
+        if result is None:
+            raise self._unavailable()
+        return result[0], result[1], telemetry
+
+    async def aclose(self):
+        """Koniec wysyłki w pętli zdarzeń - zamyka jej połączenia (klienty httpx, połączenia SMTP)"""
+        results = await asyncio.gather(*(member.aclose() for member in self.members), return_exceptions=True)
+        for member, result in zip(self.members, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Closing provider {member.name} failed: {result}")
+
+    def stats(self):
+        """Bieżąca kondycja providerów (np. do podglądu w adminie lub logach)"""
+        weights = self.effective_weights(self.members) if self.members else []
+        return [
+            {
+                'name': member.name,
+                'weight': member.weight,
+                'effective_weight': round(weight, 4),
+                'error_rate': round(member.health.error_rate, 4),
+                'latency': member.health.latency,
+                'attempts': member.health.attempts,
+                'healthy': member.health.is_healthy,
+                'circuit': member.breaker.state,
+            }
+            for member, weight in zip(self.members, weights)
+        ]
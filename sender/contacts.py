@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+from collections import Counter
+
+from django.conf import settings
+
+from .models import Contact, Recipient
+from .suppression import normalize_email, normalize_phone
+
+logger = logging.getLogger(__name__)
+
+# Ilu kontaktów szukać jednym zapytaniem (limit parametrów SQLite to 32766)
+CONTACT_BATCH_SIZE = getattr(settings, 'CONTACT_BATCH_SIZE', 1000)
+
+CONTACT_FIELDS = ['email', 'phone', 'first_name', 'last_name']
+
+
+def contact_key(email, phone):
+    """
+    Klucz kontaktu: para znormalizowanych kanałów "email|telefon E.164".
+
+    Odbiorca ma dokładnie te kanały, które wskazuje kontakt, więc kluczem jest
+    para - ten sam email z innym numerem to inny kontakt. None bez żadnego kanału.
+    """
+    email, phone = normalize_email(email), normalize_phone(phone)
+    if not email and not phone:
+        return None
+    return f"{email or ''}|{phone or ''}"
+
+
+def contact_digest(key, values):
+    """
+    Tożsamość migawki kontaktu: skrót klucza i wszystkich pól w postaci z pliku.
+
+    Zmiana imienia, nazwiska czy zapisu numeru daje inny skrót, a więc nowy
+    kontakt - kontakty wskazywane przez wcześniejsze kampanie się nie zmieniają.
+    """
+    payload = json.dumps([key] + [values[field] for field in CONTACT_FIELDS], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def contact_sort_name(values):
+    """Klucz sortowania odbiorcy po nazwisku i imieniu (Recipient.sort_name)"""
+    return f"{values['last_name']} {values['first_name']}"[:101]
+
+
+def _contact_values(data):
+    return {
+        'email': data.get('email') or None,
+        'phone': data.get('phone') or None,
+        'first_name': data.get('first_name') or '',
+        'last_name': data.get('last_name') or '',
+    }
+
+
+def upsert_contacts(rows):
+    """
+    Hurtowe dopasowanie kontaktów (migawek) do porcji wierszy odbiorców.
+
+    Istniejące kontakty są wyszukiwane po skrócie danych jednym zapytaniem na
+    porcję, brakujące dodawane przez bulk_create. Kontaktów nic tu nie zmienia -
+    ponowny import zmienionej listy tworzy nowe migawki zamiast przepisywać dane
+    odbiorców innych (także zakończonych) kampanii.
+
+    Returns:
+        tuple: ({skrót: contact_id}, Counter z liczbą created / reused)
+    """
+    incoming = {}
+    for data in rows:
+        key = contact_key(data.get('email'), data.get('phone'))
+        if key:
+            values = _contact_values(data)
+            incoming[contact_digest(key, values)] = (key, values)
+
+    stats = Counter()
+    contact_ids = {}
+    digests = list(incoming)
+    for start in range(0, len(digests), CONTACT_BATCH_SIZE):
+        chunk = digests[start:start + CONTACT_BATCH_SIZE]
+        contact_ids.update(Contact.objects.filter(digest__in=chunk).values_list('digest', 'pk'))
+        stats['reused'] += len(contact_ids.keys() & set(chunk))
+
+        to_create = [
+            Contact(key=incoming[digest][0], digest=digest, **incoming[digest][1])
+            for digest in chunk if digest not in contact_ids
+        ]
+        if to_create:
+            # ignore_conflicts: równoległy import mógł już dodać ten kontakt - identyfikatory
+            # i tak trzeba doczytać, bo przy ignore_conflicts bulk_create ich nie zwraca
+            Contact.objects.bulk_create(to_create, ignore_conflicts=True)
+            created = [contact.digest for contact in to_create]
+            contact_ids.update(Contact.objects.filter(digest__in=created).values_list('digest', 'pk'))
+            stats['created'] += len(to_create)
+
+    return contact_ids, stats
+
+
+def invalidate_renders(contact_ids):
+    """
+    Poprawione w adminie dane kontaktów - treści ich oczekujących odbiorców
+    będą podstawione od nowa przy wysyłce albo kolejnym renderowaniu
+    """
+    for start in range(0, len(contact_ids), CONTACT_BATCH_SIZE):
+        Recipient.objects.filter(
+            contact_id__in=contact_ids[start:start + CONTACT_BATCH_SIZE], status='pending',
+        ).exclude(rendered_digest='').update(rendered_digest='')
+
+
+def link_recipients(recipients, rows):
+    """
+    Przypisuje kontakty i klucz sortowania odbiorcom (obiektom Recipient przed zapisem lub do bulk_update).
+
+    Args:
+        recipients: odbiorcy
+        rows: dane z pliku w tej samej kolejności - first_name, last_name, email, phone
+    """
+    rows = list(rows)
+    contact_ids, stats = upsert_contacts(rows)
+    for recipient, data in zip(recipients, rows):
+        key = contact_key(data.get('email'), data.get('phone'))
+        values = _contact_values(data)
+        recipient.contact_id = contact_ids.get(contact_digest(key, values)) if key else None
+        recipient.sort_name = contact_sort_name(values)
+    return stats
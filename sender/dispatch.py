@@ -0,0 +1,328 @@
+import asyncio
+import logging
+import time
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .balancing import ProvidersUnavailable
+from .metrics import STAGE_SECONDS, RECIPIENTS_PROCESSED
+from .models import MessageLog, MessageBody
+from .rendering import content_digest, get_message
+from .segmentation import transliterate
+from .suppression import index as suppressions
+from .telemetry import DeliveryStats, save_delivery_stats
+
+logger = logging.getLogger(__name__)
+
+# Ile wiadomości wysyłać równocześnie (przez ProviderPool.asend); 1 = po kolei, jak dotąd
+DISPATCH_CONCURRENCY = getattr(settings, 'DISPATCH_CONCURRENCY', 1)
+
+
+def finish_sending(campaign):
+    """Przejście sending → completed / partially_failed (albo z powrotem do kolejki)"""
+    recipients = campaign.recipients.all()
+    if recipients.filter(status='pending').exists():
+        campaign.transition_to('queued')
+    elif recipients.filter(status='failed').exists():
+        campaign.transition_to('partially_failed', sent_at=timezone.now())
+    else:
+        campaign.transition_to('completed', sent_at=timezone.now())
+
+
+def dispatch_recipients(campaign, recipients, sender):
+    """
+    Wysyła wiadomości do podanych odbiorców kampanii (kampania musi być w stanie sending).
+    
+    Używane przez natychmiastową wysyłkę z widoku i przez scheduler, który
+    wypuszcza odbiorców porcjami.
+    
+    Returns:
+        tuple: (results: dict z licznikami sent/failed/skipped, paused: str or None -
+            powód wstrzymania, gdy żaden provider nie był dostępny)
+    """
+    results = {
+        'sent': 0,
+        'failed': 0,
+        'skipped': 0
+    }
+    # Telemetria porcji - scalana z rollupem kampanii raz, na końcu
+    stats = DeliveryStats()
+    try:
+        if DISPATCH_CONCURRENCY > 1:
+            paused = _dispatch_concurrent(campaign, recipients, sender, results, stats)
+        else:
+            paused = _dispatch(campaign, recipients, sender, results, stats)
+    finally:
+        save_delivery_stats(campaign, stats)
+    return results, paused
+
+
+def _prepare(campaign, recipient, digest, results):
+    """
+    Kanały i treści wiadomości odbiorcy.
+    
+    Returns:
+        dict or None: email, phone, texts (typ → treść), sends (typ → (metoda
+            MessageSender, argumenty)) i done (typ → success kanałów wysłanych
+            przed wstrzymaniem) albo None, gdy odbiorcę pominięto
+    """
+    # Lista wykluczeń (mogła się zmienić od importu): wykluczony kanał nie jest używany,
+    # a odbiorca bez żadnego kanału dla typu kampanii jest pomijany
+    suppressed = suppressions.screen(email=recipient.email, phone=recipient.phone)
+    email = None if 'email' in suppressed else recipient.email
+    phone = None if 'phone' in suppressed else recipient.phone
+    if suppressed and not {'email': email, 'sms': phone, 'both': email or phone}[campaign.message_type]:
+        recipient.status = 'skipped'
+        recipient.error_message = 'Odbiorca na liście wykluczeń'
+        recipient.save(update_fields=['status', 'error_message'])
+        results['skipped'] += 1
+        RECIPIENTS_PROCESSED.inc(status='skipped')
+        return None
+    
+    # Treść wyrenderowana z góry (sender.rendering), a gdy nieaktualna - podstaw zmienne teraz
+    started = time.perf_counter()
+    message = get_message(recipient, campaign, digest)
+    # Transliteracja dotyczy tylko SMS - email zachowuje polskie znaki
+    sms_message = transliterate(message) if campaign.sms_transliterate else message
+    STAGE_SECONDS.observe(time.perf_counter() - started, stage='render')
+    
+    # Odbiorca wstrzymany w połowie (pending z sent_at): kanały z logiem już wyszły,
+    # wznowienie wysyła tylko brakujące
+    done = {}
+    if recipient.sent_at is not None:
+        done = dict(recipient.message_logs.values_list('message_type', 'success'))
+    
+    sends = {}
+    if campaign.message_type in ('email', 'both') and email and 'email' not in done:
+        sends['email'] = ('send_email', (email, campaign.name, message))
+    if campaign.message_type in ('sms', 'both') and phone and 'sms' not in done:
+        sends['sms'] = ('send_sms', (phone, sms_message))
+    return {
+        'email': email, 'phone': phone, 'texts': {'email': message, 'sms': sms_message}, 'sends': sends, 'done': done,
+    }
+
+
+def _send(sender, plan):
+    """Wynik każdej wiadomości: typ → (success, error, telemetry) albo wyjątek tego kanału"""
+    outcomes = {}
+    for message_type, (method, args) in plan['sends'].items():
+        try:
+            outcomes[message_type] = getattr(sender, method)(*args)
+        except Exception as e:
+            outcomes[message_type] = e
+    return outcomes
+
+
+async def _asend(sender, plan):
+    """Jak _send(); email i SMS odbiorcy kampanii 'both' wychodzą równocześnie"""
+    outcomes = await asyncio.gather(*(
+        getattr(sender, f'a{method}')(*args) for method, args in plan['sends'].values()
+    ), return_exceptions=True)
+    return dict(zip(plan['sends'], outcomes))
+
+
+def _save(campaign, recipient, plan, outcomes, results, stats):
+    """
+    Status odbiorcy, logi wiadomości, telemetria i trwałe błędy na listę wykluczeń.
+    
+    Gdy dla któregoś kanału żaden provider nie był dostępny, zapisywane są tylko
+    logi kanałów, które wyszły, a odbiorca zostaje pending - wznowienie wyśle
+    wyłącznie brakujący kanał.
+    
+    Returns:
+        str or None: powód wstrzymania kampanii
+    """
+    paused = None
+    completed = {}
+    for message_type, outcome in outcomes.items():
+        if isinstance(outcome, ProvidersUnavailable):
+            paused = str(outcome)
+        elif isinstance(outcome, Exception):
+            logger.error(f"Error sending {message_type} to recipient {recipient.uid}: {str(outcome)}")
+            completed[message_type] = (False, f'Błąd serwera: {str(outcome)}', {})
+        else:
+            completed[message_type] = outcome
+    outcomes = completed
+    
+    if paused:
+        if outcomes:
+            # sent_at przy statusie pending - znacznik częściowej wysyłki dla _prepare()
+            recipient.sent_at = timezone.now()
+            recipient.save(update_fields=['sent_at'])
+            _log(campaign, recipient, plan, outcomes, stats)
+        return paused
+    
+    if campaign.message_type == 'both':
+        # Kanał wysłany przed wstrzymaniem też się liczy
+        success = any(outcome[0] for outcome in outcomes.values()) or any(plan['done'].values())
+        errors = [
+            f"{'Email' if message_type == 'email' else 'SMS'}: {error}"
+            for message_type, (message_success, error, _) in outcomes.items()
+            if not message_success and error
+        ]
+        error_message = '; '.join(errors) if errors else None
+    elif outcomes:
+        success, error_message, _ = next(iter(outcomes.values()))
+    else:
+        success, error_message = False, None
+    
+    # Aktualizuj status odbiorcy
+    if success:
+        recipient.status = 'sent'
+        recipient.sent_at = timezone.now()
+        recipient.error_message = None
+        results['sent'] += 1
+    else:
+        recipient.status = 'failed'
+        recipient.error_message = error_message or 'Nieznany błąd'
+        results['failed'] += 1
+    
+    started = time.perf_counter()
+    recipient.save()
+    _log(campaign, recipient, plan, outcomes, stats)
+    STAGE_SECONDS.observe(time.perf_counter() - started, stage='db_flush')
+    RECIPIENTS_PROCESSED.inc(status=recipient.status)
+    return None
+
+
+def _log(campaign, recipient, plan, outcomes, stats):
+    # Utwórz log wiadomości - treść zapisywana raz, współdzielona przez logi;
+    # provider_response: provider, latencja, numer próby, ID wiadomości i koszt
+    texts = plan['texts']
+    bodies = {}
+    for message_type in outcomes:
+        if texts[message_type] not in bodies:
+            bodies[texts[message_type]] = MessageBody.store(texts[message_type])
+    sent_at = timezone.now()
+    
+    for message_type, (message_success, message_error, telemetry) in outcomes.items():
+        MessageLog.objects.create(
+            recipient=recipient,
+            message_type=message_type,
+            body=bodies[texts[message_type]],
+            success=message_success,
+            error_details=message_error,
+            provider_response=telemetry,
+        )
+        stats.record(sent_at, message_success, telemetry)
+        # Trwały błąd odbiorcy (nieistniejący numer/skrzynka) - kolejne kampanie go pominą
+        if telemetry.get('permanent'):
+            if message_type == 'email':
+                suppressions.add('email', plan['email'], reason='bounce', source=f'Kampania: {campaign.name}')
+            else:
+                suppressions.add('phone', plan['phone'], reason='bounce', source=f'Kampania: {campaign.name}')
+
+
+def _fail(recipient, error, results):
+    logger.error(f"Error sending to recipient {recipient.uid}: {str(error)}")
+    recipient.status = 'failed'
+    recipient.error_message = f'Błąd serwera: {str(error)}'
+    recipient.save()
+    results['failed'] += 1
+    RECIPIENTS_PROCESSED.inc(status='failed')
+
+
+def _dispatch(campaign, recipients, sender, results, stats):
+    digest = content_digest(campaign.message_content)
+    # Filtr listy wykluczeń przebudowywany tylko, jeśli lista zmieniła się od poprzedniej porcji
+    suppressions.refresh()
+    for recipient in recipients:
+        try:
+            # Otwarty obwód providera - przerwij zamiast "przepalać" odbiorców na błędach;
+            # pozostali zostają pending, a kampania wraca do kolejki
+            sender.ensure_available(campaign.message_type)
+            
+            plan = _prepare(campaign, recipient, digest, results)
+            if plan is None:
+                continue
+            paused = _save(campaign, recipient, plan, _send(sender, plan), results, stats)
+            if paused:
+                logger.warning(f"Campaign {campaign.uid} paused: {paused}")
+                return paused
+        
+        except ProvidersUnavailable as e:
+            logger.warning(f"Campaign {campaign.uid} paused: {str(e)}")
+            return str(e)
+        except Exception as e:
+            _fail(recipient, e, results)
+    
+    return None
+
+
+def _dispatch_concurrent(campaign, recipients, sender, results, stats):
+    """
+    Jak _dispatch(), ale wiadomości porcji odbiorców wychodzą równocześnie (DISPATCH_CONCURRENCY).
+    
+    Cała wysyłka działa w jednej pętli zdarzeń, więc połączenia providerów
+    asynchronicznych (httpx, aiosmtplib) służą wszystkim porcjom i są zamykane
+    na końcu. Przygotowanie i zapis do bazy idą przez sync_to_async w wątku
+    wywołującym (to samo połączenie z bazą co poza pętlą).
+    """
+    return async_to_sync(_adispatch)(campaign, iter(recipients), sender, results, stats)
+
+
+async def _adispatch(campaign, recipients, sender, results, stats):
+    digest = content_digest(campaign.message_content)
+    chunk_size = DISPATCH_CONCURRENCY * 4
+    try:
+        await sync_to_async(suppressions.refresh)()
+        while True:
+            chunk = await sync_to_async(_next_chunk)(recipients, chunk_size)
+            if not chunk:
+                return None
+            try:
+                sender.ensure_available(campaign.message_type)
+            except ProvidersUnavailable as e:
+                logger.warning(f"Campaign {campaign.uid} paused: {str(e)}")
+                return str(e)
+            
+            plans = await sync_to_async(_prepare_chunk)(campaign, chunk, digest, results)
+            outcomes = await _send_all(sender, [plan for _, plan in plans])
+            paused = await sync_to_async(_save_chunk)(campaign, plans, outcomes, results, stats)
+            if paused:
+                logger.warning(f"Campaign {campaign.uid} paused: {paused}")
+                return paused
+    finally:
+        await sender.aclose()
+
+
+def _next_chunk(recipients, size):
+    return [recipient for _, recipient in zip(range(size), recipients)]
+
+
+def _prepare_chunk(campaign, chunk, digest, results):
+    plans = []
+    for recipient in chunk:
+        try:
+            plan = _prepare(campaign, recipient, digest, results)
+            if plan is not None:
+                plans.append((recipient, plan))
+        except Exception as e:
+            _fail(recipient, e, results)
+    return plans
+
+
+def _save_chunk(campaign, plans, outcomes, results, stats):
+    """Zapis wyników porcji; zwraca powód wstrzymania, gdy żaden provider nie był dostępny"""
+    paused = None
+    for (recipient, plan), outcome in zip(plans, outcomes):
+        try:
+            if isinstance(outcome, Exception):
+                raise outcome
+            # Kanał bez providera zostaje pending - kampania wróci do kolejki
+            paused = _save(campaign, recipient, plan, outcome, results, stats) or paused
+        except Exception as e:
+            _fail(recipient, e, results)
+    return paused
+
+
+async def _send_all(sender, plans):
+    semaphore = asyncio.Semaphore(DISPATCH_CONCURRENCY)
+    
+    async def send(plan):
+        async with semaphore:
+            return await _asend(sender, plan)
+    
+    return await asyncio.gather(*(send(plan) for plan in plans), return_exceptions=True)
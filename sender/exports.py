@@ -0,0 +1,217 @@
+import csv
+import json
+import zipfile
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .models import Recipient
+
+EXPORT_HEADER = ['Imię', 'Nazwisko', 'Email', 'Telefon', 'Status', 'Wysłano', 'Błąd', 'Dodatkowe dane']
+EXPORT_FIELDS = [
+    'contact__first_name', 'contact__last_name', 'contact__email', 'contact__phone',
+    'status', 'sent_at', 'error_message', 'extra_data',
+]
+
+EXPORT_CHUNK_SIZE = 2000
+
+STATUS_LABELS = dict(Recipient.STATUS_CHOICES)
+
+
+class Echo:
+    """Pseudo-bufor dla csv.writer - zwraca zapisany wiersz zamiast go przechowywać"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(campaign, status=None):
+    """
+    Generator wierszy eksportu (bez nagłówka).
+
+    values_list() + iterator() - odbiorcy nie są zamieniani na obiekty modelu
+    ani trzymani w pamięci, baza oddaje ich porcjami po EXPORT_CHUNK_SIZE.
+    Kolejność po nazwisku i imieniu z indeksu recipient_campaign_name_idx -
+    bez złączenia z kontaktami przy sortowaniu.
+    """
+    recipients = campaign.recipients.all()
+    if status:
+        recipients = recipients.filter(status=status)
+
+    rows = recipients.order_by('sort_name', 'uid').values_list(*EXPORT_FIELDS)
+    for first_name, last_name, email, phone, status, sent_at, error_message, extra_data in rows.iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        yield [
+            first_name,
+            last_name,
+            email or '',
+            phone or '',
+            STATUS_LABELS.get(status, status),
+            # Excel nie obsługuje stref czasowych - czas lokalny bez strefy
+            timezone.localtime(sent_at).replace(tzinfo=None) if sent_at else None,
+            error_message or '',
+            json.dumps(extra_data, ensure_ascii=False) if extra_data else '',
+        ]
+
+
+async def aiter_chunks(chunks):
+    """
+    Asynchroniczny strumień kawałków generatora stream_csv / stream_xlsx - dla ASGI.
+
+    Pod ASGI Django przed wysłaniem czyta synchroniczny iterator odpowiedzi
+    w całości; tu każdy kawałek (porcja z bazy, kompresja) jest liczony w wątku
+    przez sync_to_async i wysyłany od razu.
+    """
+    chunks = iter(chunks)
+    done = object()
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(chunks, done)) is not done:
+        yield chunk
+
+
+def stream_csv(rows):
+    """Strumień linii CSV - BOM na początku, żeby Excel poprawnie odczytał polskie znaki"""
+    writer = csv.writer(Echo())
+    yield '\ufeff'
+    yield writer.writerow(EXPORT_HEADER)
+    for row in rows:
+        if row[5]:
+            row[5] = row[5].strftime('%Y-%m-%d %H:%M:%S')
+        yield writer.writerow(row)
+
+
+# Stałe części pliku XLSX (SpreadsheetML) - jeden arkusz z wierszami zapisanymi inline,
+# styl 1 to format daty dla kolumny "Wysłano"
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Odbiorcy" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '<Relationship Id="rId2" Target="styles.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+        '</Relationships>'
+    ),
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd h:mm:ss"/></numFmts>'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+XLSX_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+XLSX_SHEET_TAIL = '</sheetData></worksheet>'
+
+# Ile wierszy arkusza kompresować przed oddaniem kolejnego kawałka odpowiedzi
+XLSX_ROWS_PER_CHUNK = 500
+
+
+class ChunkBuffer:
+    """Bufor bez seek() dla zipfile - zapisane bajty są odbierane i czyszczone przez take()"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _xlsx_row_writer():
+    """Funkcja zamieniająca wiersz eksportu na XML wiersza arkusza (openpyxl importowany leniwie)"""
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+    from openpyxl.utils.datetime import to_excel
+
+    def cell(value):
+        if value is None or value == '':
+            return '<c/>'
+        if hasattr(value, 'hour'):
+            return f'<c s="1"><v>{to_excel(value)}</v></c>'
+        text = escape(ILLEGAL_CHARACTERS_RE.sub('', str(value)))
+        return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+    def row(values):
+        return '<row>' + ''.join(cell(value) for value in values) + '</row>'
+
+    return row
+
+
+def stream_xlsx(rows):
+    """
+    Strumień pliku XLSX generowany w locie.
+
+    Arkusz jest pisany jako XML wierszami prosto do archiwum ZIP otwartego na
+    buforze bez seek() (zipfile używa wtedy deskryptorów danych), a skompresowane
+    bajty są oddawane co XLSX_ROWS_PER_CHUNK wierszy - ani plik, ani wiersze nie są
+    trzymane w pamięci czy na dysku, a pierwszy bajt wychodzi od razu.
+    Daty zamieniane są na liczby Excela narzędziami openpyxl.
+    """
+    xlsx_row = _xlsx_row_writer()
+    buffer = ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        yield buffer.take()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((XLSX_SHEET_HEAD + xlsx_row(EXPORT_HEADER)).encode('utf-8'))
+            pending = []
+            for row in rows:
+                pending.append(xlsx_row(row))
+                if len(pending) >= XLSX_ROWS_PER_CHUNK:
+                    sheet.write(''.join(pending).encode('utf-8'))
+                    pending = []
+                    chunk = buffer.take()
+                    if chunk:
+                        yield chunk
+            sheet.write((''.join(pending) + XLSX_SHEET_TAIL).encode('utf-8'))
+    yield buffer.take()
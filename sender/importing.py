@@ -0,0 +1,334 @@
+import hashlib
+import json
+import logging
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+
+from .contacts import CONTACT_FIELDS, contact_key, link_recipients
+from .models import Campaign, Recipient
+from .rendering import schedule_render
+from .spreadsheets import is_missing
+from .suppression import index as suppressions, normalize_email, normalize_phone
+
+logger = logging.getLogger(__name__)
+
+EMAIL_PATTERN = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+
+# Ilu odbiorców zapisywać jednym bulk_create (i upsertem kontaktów)
+INGEST_BATCH_SIZE = getattr(settings, 'INGEST_BATCH_SIZE', 1000)
+
+# Kanały, które muszą być dostępne dla typu kampanii
+CAMPAIGN_CHANNELS = {'email': ['email'], 'sms': ['phone'], 'both': ['email', 'phone']}
+
+SUPPRESSED_MESSAGE = 'Odbiorca na liście wykluczeń'
+
+
+def map_columns(columns):
+    """
+    Mapuje kolumny arkusza na pola odbiorcy.
+
+    Returns:
+        tuple: (mapped_columns: {pole: kolumna}, extra_columns: [pozostałe kolumny])
+    """
+    mapped_columns = {}
+
+    for col in columns:
+        col_lower = col.lower().strip()
+        if any(keyword in col_lower for keyword in ['imię', 'imie', 'first', 'name', 'first_name']):
+            if 'first_name' not in mapped_columns:
+                mapped_columns['first_name'] = col
+        elif any(keyword in col_lower for keyword in ['nazwisko', 'last', 'surname', 'last_name']):
+            if 'last_name' not in mapped_columns:
+                mapped_columns['last_name'] = col
+        elif any(keyword in col_lower for keyword in ['email', 'e-mail', 'mail']):
+            if 'email' not in mapped_columns:
+                mapped_columns['email'] = col
+        elif any(keyword in col_lower for keyword in ['telefon', 'phone', 'tel', 'mobile', 'komórka', 'komórki', 'gsm', 'numer']):
+            if 'phone' not in mapped_columns:
+                mapped_columns['phone'] = col
+
+    # Ustawienia domyślne jeśli nie znaleziono
+    if 'first_name' not in mapped_columns and len(columns) > 0:
+        mapped_columns['first_name'] = columns[0]
+    if 'last_name' not in mapped_columns and len(columns) > 1:
+        mapped_columns['last_name'] = columns[1]
+
+    # Dodatkowe kolumny
+    basic_columns = set(mapped_columns.values())
+    extra_columns = [col for col in columns if col not in basic_columns]
+
+    return mapped_columns, extra_columns
+
+
+def clean_recipient_row(row, mapped_columns, extra_columns, message_type):
+    """
+    Waliduje wiersz arkusza.
+
+    Returns:
+        dict or None: pola odbiorcy albo None, gdy wiersz trzeba pominąć
+    """
+    # Podstawowe dane
+    first_name = str(row.get(mapped_columns.get('first_name', ''), '')).strip()
+    last_name = str(row.get(mapped_columns.get('last_name', ''), '')).strip()
+    email = str(row.get(mapped_columns.get('email', ''), '')).strip()
+    phone = str(row.get(mapped_columns.get('phone', ''), '')).strip()
+
+    # Sprawdź czy mamy minimum dane
+    if not first_name and not last_name:
+        return None
+
+    # Walidacja email
+    if email and email != 'nan':
+        if not re.match(EMAIL_PATTERN, email):
+            email = None
+    else:
+        email = None
+
+    # Walidacja telefonu
+    if phone and phone != 'nan':
+        # Usuń wszystko oprócz cyfr, + i spacji
+        phone = re.sub(r'[^\d\+\s\-\(\)]', '', phone)
+        if len(phone.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')) < 9:
+            phone = None
+    else:
+        phone = None
+
+    # Sprawdź czy mamy przynajmniej email lub telefon dla danego typu kampanii
+    if message_type == 'email' and not email:
+        return None
+    elif message_type == 'sms' and not phone:
+        return None
+    elif message_type == 'both' and not email and not phone:
+        return None
+
+    # Dodatkowe dane
+    extra_data = {}
+    for col in extra_columns:
+        value = row.get(col, '')
+        if not is_missing(value):
+            extra_data[col] = str(value).strip()
+
+    return {
+        'first_name': first_name or 'Brak',
+        'last_name': last_name or 'Danych',
+        'email': email,
+        'phone': phone,
+        'extra_data': extra_data,
+    }
+
+
+def iter_recipient_rows(df, mapped_columns, extra_columns, message_type):
+    """Generator zwalidowanych wierszy (None dla wierszy do pominięcia)"""
+    for _, row in df.iterrows():
+        try:
+            yield clean_recipient_row(row, mapped_columns, extra_columns, message_type)
+        except Exception as e:
+            logger.error(f"Error creating recipient: {str(e)}")
+            yield None
+
+
+def row_hash(data):
+    """Skrót znormalizowanej treści wiersza (zmiana formatu numeru czy wielkości liter w emailu to nie zmiana)"""
+    payload = json.dumps([
+        data['first_name'],
+        data['last_name'],
+        normalize_email(data['email']),
+        normalize_phone(data['phone']),
+        data['extra_data'],
+    ], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _recipient_fields(data):
+    """Pola odbiorcy z wiersza - imię, nazwisko, email i telefon trafiają do kontaktu"""
+    return {name: value for name, value in data.items() if name not in CONTACT_FIELDS}
+
+
+def _screen(data, channels):
+    """Odbiorca ze wszystkimi kanałami kampanii na liście wykluczeń zapisywany jest jako pominięty"""
+    suppressed = suppressions.screen(email=data['email'], phone=data['phone'])
+    if suppressed and all(not data[channel] or channel in suppressed for channel in channels):
+        return {**data, 'status': 'skipped', 'error_message': SUPPRESSED_MESSAGE}, True
+    return data, False
+
+
+def ingest_recipients(campaign, rows):
+    """
+    Zapisuje odbiorców kampanii porcjami (bulk_create) i łączy ich z kontaktami.
+
+    Odbiorcy, których wszystkie kanały dla typu kampanii są na liście wykluczeń,
+    zapisywani są jako pominięci (skipped). Kontakty są dopasowywane hurtowo
+    (sender.contacts) - ponowny import znanej listy korzysta z istniejących.
+
+    Returns:
+        tuple: (recipients_created: int, skipped_recipients: int, suppressed_recipients: int)
+    """
+    recipients_created = 0
+    skipped_recipients = 0
+    suppressed_recipients = 0
+    contact_stats = Counter()
+    channels = CAMPAIGN_CHANNELS[campaign.message_type]
+    suppressions.refresh()
+
+    # Kontakt (para email + telefon) jest unikalny w kampanii
+    seen = set()
+    batch = []
+    batch_rows = []
+
+    def flush():
+        nonlocal recipients_created, skipped_recipients
+        contact_stats.update(link_recipients(batch, batch_rows))
+        using = router.db_for_write(Recipient)
+        try:
+            with transaction.atomic(using=using):
+                Recipient.objects.bulk_create(batch)
+            recipients_created += len(batch)
+        except IntegrityError:
+            # Konflikt z odbiorcą zapisanym wcześniej - zapis pojedynczo, jak przy imporcie bez porcji
+            for recipient in batch:
+                try:
+                    with transaction.atomic(using=using):
+                        recipient.save(force_insert=True)
+                    recipients_created += 1
+                except IntegrityError as e:
+                    logger.error(f"Error creating recipient: {str(e)}")
+                    skipped_recipients += 1
+        batch.clear()
+        batch_rows.clear()
+
+    for data in rows:
+        if data is None:
+            skipped_recipients += 1
+            continue
+        key = contact_key(data['email'], data['phone'])
+        if key in seen:
+            logger.error(f"Error creating recipient: duplicate {data['email']} / {data['phone']}")
+            skipped_recipients += 1
+            continue
+        seen.add(key)
+        try:
+            digest = row_hash(data)
+            data, suppressed = _screen(data, channels)
+            suppressed_recipients += suppressed
+            batch.append(Recipient(campaign=campaign, row_hash=digest, **_recipient_fields(data)))
+            batch_rows.append(data)
+        except Exception as e:
+            logger.error(f"Error creating recipient: {str(e)}")
+            skipped_recipients += 1
+            continue
+        if len(batch) >= INGEST_BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+
+    logger.info(
+        f"Campaign {campaign.uid}: {recipients_created} recipients, contacts "
+        f"{contact_stats['created']} created, {contact_stats['reused']} reused"
+    )
+    return recipients_created, skipped_recipients, suppressed_recipients
+
+
+def _stored_row_hashes(campaign):
+    """Skróty odbiorców zapisanych przed wprowadzeniem row_hash - liczone z pól"""
+    hashes = {}
+    legacy = campaign.recipients.filter(row_hash='').values_list(
+        'uid', 'contact__first_name', 'contact__last_name', 'contact__email', 'contact__phone', 'extra_data',
+    )
+    for uid, first_name, last_name, email, phone, extra_data in legacy.iterator(chunk_size=INGEST_BATCH_SIZE):
+        hashes[uid] = row_hash({
+            'first_name': first_name, 'last_name': last_name, 'email': email, 'phone': phone, 'extra_data': extra_data,
+        })
+    return hashes
+
+
+def reimport_recipients(campaign, rows):
+    """
+    Aktualizuje odbiorców niewysłanej kampanii z nowej wersji pliku - różnicowo.
+
+    Wiersze pliku są dopasowywane do odbiorców po kluczu kontaktu (para
+    email + telefon), a skrót treści wiersza porównywany z zapisanym
+    row_hash. Zapisywane są tylko różnice: nowe wiersze (ingest_recipients),
+    zmienione (bulk_update) i nieobecne w pliku (delete). Wysłanych odbiorców
+    nic nie zmienia ani nie usuwa. Wywoływać w transakcji.
+
+    Returns:
+        dict: inserted, updated, deleted, unchanged, sent_kept, skipped, suppressed
+    """
+    stats = Counter()
+    channels = CAMPAIGN_CHANNELS[campaign.message_type]
+    suppressions.refresh()
+
+    # Indeks kampanii: klucz kontaktu -> (uid, status, row_hash)
+    legacy_hashes = _stored_row_hashes(campaign)
+    existing = {}
+    stored = campaign.recipients.values_list('uid', 'contact__key', 'status', 'row_hash')
+    for uid, key, status, digest in stored.iterator(chunk_size=INGEST_BATCH_SIZE):
+        existing[key] = (uid, status, digest or legacy_hashes[uid])
+
+    inserts = []
+    updates = []
+    seen = set()
+    for data in rows:
+        if data is None:
+            stats['skipped'] += 1
+            continue
+        key = contact_key(data['email'], data['phone'])
+        if key in seen:
+            stats['skipped'] += 1
+            continue
+        seen.add(key)
+
+        digest = row_hash(data)
+        match = existing.pop(key, None)
+        if match is None:
+            inserts.append(data)
+            continue
+        uid, status, stored_digest = match
+        if status == 'sent':
+            stats['sent_kept'] += 1
+        elif digest == stored_digest:
+            stats['unchanged'] += 1
+        else:
+            updates.append((uid, digest, data))
+
+    # Odbiorcy nieobecni w nowym pliku
+    removed = [uid for uid, status, _ in existing.values() if status != 'sent']
+    stats['sent_kept'] += sum(1 for _, status, _ in existing.values() if status == 'sent')
+    for start in range(0, len(removed), INGEST_BATCH_SIZE):
+        Recipient.objects.filter(uid__in=removed[start:start + INGEST_BATCH_SIZE]).delete()
+    stats['deleted'] = len(removed)
+
+    fields = ['extra_data', 'row_hash', 'contact', 'sort_name', 'status', 'sent_at', 'error_message',
+              'rendered_message', 'rendered_digest']
+    for start in range(0, len(updates), INGEST_BATCH_SIZE):
+        batch = []
+        batch_rows = []
+        for uid, digest, data in updates[start:start + INGEST_BATCH_SIZE]:
+            data, suppressed = _screen(data, channels)
+            stats['suppressed'] += suppressed
+            # Wiersz wraca do wysyłki od nowa; treść wyrenderuje schedule_render
+            batch.append(Recipient(uid=uid, campaign=campaign, row_hash=digest, sent_at=None, **{
+                'status': 'pending', 'error_message': None, **_recipient_fields(data),
+            }))
+            batch_rows.append(data)
+        # Zmienione imię czy nazwisko to nowy kontakt - kontakt innych kampanii zostaje bez zmian
+        link_recipients(batch, batch_rows)
+        Recipient.objects.bulk_update(batch, fields)
+    stats['updated'] = len(updates)
+
+    created, skipped, suppressed = ingest_recipients(campaign, inserts)
+    stats['inserted'] = created
+    stats['skipped'] += skipped
+    stats['suppressed'] += suppressed
+
+    if stats['inserted'] or stats['updated'] or stats['deleted']:
+        # Szacunek SMS i wyrenderowane treści dotyczą poprzedniej listy
+        campaign.sms_estimate = {}
+        Campaign.objects.filter(pk=campaign.pk).update(sms_estimate={})
+        schedule_render(campaign)
+
+    logger.info(f"Campaign {campaign.uid} re-imported: {dict(stats)}")
+    return {name: stats[name] for name in ('inserted', 'updated', 'deleted', 'unchanged', 'sent_kept', 'skipped', 'suppressed')}
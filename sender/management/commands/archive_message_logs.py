@@ -0,0 +1,95 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+from django.utils import timezone
+
+from sender.archive import ArchiveWriter, log_to_record, reclaim_space, register_archive
+from sender.models import Campaign, MessageLog, MessageBody
+
+
+class Command(BaseCommand):
+    help = (
+        'Przenosi logi wiadomości kampanii zakończonych ponad N dni temu do plików archiwum '
+        '(JSONL gzip lub Parquet) i usuwa je z tabeli MessageLog partiami; z --vacuum '
+        'oddaje też zwolnione miejsce w pliku bazy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Archiwizuj kampanie zakończone ponad N dni temu')
+        parser.add_argument('--format', choices=['jsonl', 'parquet'], default='jsonl')
+        parser.add_argument('--archive-dir', help='Katalog archiwum (domyślnie MESSAGE_LOG_ARCHIVE_DIR)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Liczba logów usuwanych w jednej transakcji')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Przerwa (s) między partiami usuwania, żeby nie blokować zapisów wysyłki')
+        parser.add_argument('--summaries', action='store_true', help='Zapisz podsumowanie logów kampanii')
+        parser.add_argument('--vacuum', action='store_true',
+                            help='Po usunięciu logów odzyskaj miejsce (SQLite: incremental_vacuum albo VACUUM)')
+        parser.add_argument('--dry-run', action='store_true', help='Tylko pokaż, co zostałoby zarchiwizowane')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size musi być większe od zera')
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        campaigns = Campaign.objects.filter(
+            status__in=Campaign.FINISHED_STATUSES,
+            sent_at__lt=cutoff,
+            recipients__message_logs__isnull=False,
+        ).distinct()
+
+        total = 0
+        for campaign in campaigns:
+            logs = MessageLog.objects.filter(recipient__campaign=campaign)
+            if options['dry_run']:
+                self.stdout.write(f'{campaign.name}: {logs.count()} logów')
+                continue
+            total += self._archive_campaign(campaign, logs, options)
+
+        if not options['dry_run']:
+            purged = MessageBody.purge_orphans()
+            self.stdout.write(self.style.SUCCESS(
+                f'Zarchiwizowano {total} logów, usunięto {purged} nieużywanych treści'
+            ))
+            if options['vacuum']:
+                reclaimed = reclaim_space(router.db_for_write(MessageLog), pause=options['pause'])
+                if reclaimed:
+                    self.stdout.write(
+                        f"Wolne strony bazy: {reclaimed['free_pages_before']} → {reclaimed['free_pages_after']}"
+                        f"{'' if reclaimed['incremental'] else ' (pełny VACUUM)'}"
+                    )
+
+    def _archive_campaign(self, campaign, logs, options):
+        writer = ArchiveWriter(campaign, options['format'], options['archive_dir'])
+        archived_uids = []
+        try:
+            # Plik zapisujemy w całości, zanim cokolwiek zniknie z bazy; logi pogrupowane
+            # po odbiorcy (indeks recipient, sent_at), żeby każdy trafił do jednego bloku
+            batch = []
+            logs = logs.select_related('body').order_by('recipient_id', 'sent_at')
+            for log in logs.iterator(chunk_size=options['batch_size']):
+                batch.append(log_to_record(log))
+                archived_uids.append(log.uid)
+                if len(batch) >= options['batch_size']:
+                    writer.write(batch)
+                    batch = []
+            if batch:
+                writer.write(batch)
+            writer.close()
+        except Exception:
+            writer.abort()
+            raise
+
+        register_archive(writer, include_summary=options['summaries'])
+
+        # Usuwanie krótkimi transakcjami - wysyłka może pisać między partiami
+        batch_size = options['batch_size']
+        for start in range(0, len(archived_uids), batch_size):
+            with transaction.atomic(using=router.db_for_write(MessageLog)):
+                MessageLog.objects.filter(uid__in=archived_uids[start:start + batch_size]).delete()
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(f'{campaign.name}: {writer.count} logów → {writer.path}')
+        return writer.count
@@ -0,0 +1,198 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+
+from sender.contacts import contact_digest, contact_key, contact_sort_name
+from sender.models import Campaign, Contact, Recipient, MessageLog, MessageBody
+
+
+FIRST_NAMES = ['Anna', 'Piotr', 'Katarzyna', 'Tomasz', 'Magdalena', 'Krzysztof', 'Agnieszka', 'Paweł']
+LAST_NAMES = ['Nowak', 'Kowalski', 'Wiśniewski', 'Wójcik', 'Kowalczyk', 'Kamiński', 'Lewandowski', 'Zieliński']
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark indeksów złożonych Recipient/MessageLog na syntetycznych danych. '
+        'Wszystko dzieje się w jednej transakcji, która jest na końcu wycofywana - '
+        'uruchamiaj na bazie deweloperskiej, bo transakcja blokuje zapisy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=1_000_000, help='Łączna liczba odbiorców')
+        parser.add_argument('--campaigns', type=int, default=10, help='Liczba kampanii, między które dzielimy odbiorców')
+        parser.add_argument('--repeat', type=int, default=5, help='Liczba powtórzeń każdego zapytania')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--keep', action='store_true', help='Nie wycofuj wygenerowanych danych')
+
+    def handle(self, *args, **options):
+        self.using = options['database']
+        self.connection = connections[self.using]
+        self.repeat = options['repeat']
+
+        with transaction.atomic(using=self.using):
+            started = time.perf_counter()
+            campaign = self._generate(options)
+            self.stdout.write(f"Wygenerowano dane w {time.perf_counter() - started:.1f}s")
+
+            self._drop_indexes()
+            before = self._measure(campaign)
+            self._create_indexes()
+            after = self._measure(campaign)
+
+            self._report(before, after)
+
+            if not options['keep']:
+                transaction.set_rollback(True, using=self.using)
+
+    # Generowanie danych
+
+    def _generate(self, options):
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+        per_campaign = max(1, options['recipients'] // options['campaigns'])
+        batch_size = options['batch_size']
+        target = None
+        bodies = {name: MessageBody.store(f'Dzień dobry {name}!') for name in FIRST_NAMES}
+        # Te same osoby w każdej kampanii - jak kolejne wysyłki do jednej listy
+        contacts = self._generate_contacts(rng, per_campaign, batch_size)
+
+        for c in range(options['campaigns']):
+            campaign = Campaign.objects.using(self.using).create(
+                name=f'[benchmark] Kampania {c + 1}',
+                message_type='both',
+                message_content='Dzień dobry {{first_name}}!',
+            )
+            target = target or campaign
+
+            for start in range(0, per_campaign, batch_size):
+                recipients = []
+                for i in range(start, min(start + batch_size, per_campaign)):
+                    roll = rng.random()
+                    status = 'sent' if roll < 0.7 else 'failed' if roll < 0.8 else 'pending'
+                    recipients.append(Recipient(
+                        campaign=campaign,
+                        contact_id=contacts[i][0],
+                        sort_name=contacts[i][2],
+                        status=status,
+                        sent_at=now - timedelta(seconds=rng.randint(0, 86400)) if status == 'sent' else None,
+                    ))
+                Recipient.objects.using(self.using).bulk_create(recipients, batch_size=batch_size)
+
+                logs = [
+                    MessageLog(
+                        recipient=r, message_type='sms', body=bodies[contacts[i][1]], success=r.status == 'sent',
+                    )
+                    for i, r in enumerate(recipients, start) if r.status != 'pending'
+                ]
+                MessageLog.objects.using(self.using).bulk_create(logs, batch_size=batch_size)
+
+        return target
+
+    def _generate_contacts(self, rng, count, batch_size):
+        """Kontakty user0..userN - lista (id, imię, klucz sortowania)"""
+        contacts = []
+        for start in range(0, count, batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, count)):
+                values = {
+                    'email': f'user{i}@example.com',
+                    'phone': f'+48{500000000 + i}',
+                    'first_name': rng.choice(FIRST_NAMES),
+                    'last_name': rng.choice(LAST_NAMES),
+                }
+                key = contact_key(values['email'], values['phone'])
+                batch.append(Contact(key=key, digest=contact_digest(key, values), **values))
+            Contact.objects.using(self.using).bulk_create(batch, batch_size=batch_size, ignore_conflicts=True)
+            ids = dict(Contact.objects.using(self.using).filter(
+                digest__in=[contact.digest for contact in batch],
+            ).values_list('digest', 'pk'))
+            contacts.extend(
+                (ids[contact.digest], contact.first_name, contact_sort_name({
+                    'first_name': contact.first_name, 'last_name': contact.last_name,
+                }))
+                for contact in batch
+            )
+        return contacts
+
+    # Indeksy
+
+    def _indexes(self):
+        for model in (Recipient, MessageLog):
+            for index in model._meta.indexes:
+                yield model, index
+
+    def _execute_statements(self, statements):
+        with self.connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(str(statement))
+
+    def _drop_indexes(self):
+        editor = self.connection.schema_editor(collect_sql=True)
+        quote = editor.quote_name
+        self._execute_statements(
+            editor.sql_delete_index % {'table': quote(model._meta.db_table), 'name': quote(index.name)}
+            for model, index in self._indexes()
+        )
+        self._analyze()
+
+    def _create_indexes(self):
+        editor = self.connection.schema_editor(collect_sql=True)
+        self._execute_statements(index.create_sql(model, editor) for model, index in self._indexes())
+        self._analyze()
+
+    def _analyze(self):
+        # Świeże statystyki, żeby planer wybierał indeksy tak jak na produkcji
+        if self.connection.vendor in ('sqlite', 'postgresql'):
+            with self.connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    # Pomiary
+
+    def _queries(self, campaign):
+        recipients = Recipient.objects.using(self.using).filter(campaign=campaign)
+        ordered = recipients.order_by('-sent_at', 'sort_name', 'uid')
+        deep_offset = recipients.count() // 2
+        sample = list(recipients.exclude(status='pending').values_list('uid', flat=True)[:200])
+
+        def log_lookups():
+            for uid in sample:
+                MessageLog.objects.using(self.using).filter(recipient_id=uid).order_by('-sent_at').first()
+
+        return [
+            ('Licznik statusu', recipients.filter(status='pending'), lambda: recipients.filter(status='pending').count()),
+            ('Pierwsza strona', ordered[:50], lambda: list(ordered[:50])),
+            ('Głęboka strona', ordered[deep_offset:deep_offset + 50], lambda: list(ordered[deep_offset:deep_offset + 50])),
+            ('Strona z filtrem statusu', ordered.filter(status='failed')[:50],
+             lambda: list(ordered.filter(status='failed')[:50])),
+            (f'Ostatni log x{len(sample)}',
+             MessageLog.objects.using(self.using).filter(recipient_id=sample[0] if sample else None).order_by('-sent_at')[:1],
+             log_lookups),
+        ]
+
+    def _measure(self, campaign):
+        results = {}
+        for name, queryset, run in self._queries(campaign):
+            timings = []
+            for _ in range(self.repeat):
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = {'plan': queryset.explain(), 'ms': statistics.median(timings)}
+        return results
+
+    def _report(self, before, after):
+        for name in before:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{name}'))
+            self.stdout.write(f"  bez indeksów: {before[name]['ms']:.2f} ms")
+            for line in before[name]['plan'].splitlines():
+                self.stdout.write(f'    {line}')
+            self.stdout.write(f"  z indeksami:  {after[name]['ms']:.2f} ms")
+            for line in after[name]['plan'].splitlines():
+                self.stdout.write(f'    {line}')
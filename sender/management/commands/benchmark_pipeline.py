@@ -0,0 +1,223 @@
+import io
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import time
+
+import django
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, router, transaction
+from django.db.models import Count, Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from sender.balancing import PooledProvider, ProviderPool
+from sender.dispatch import dispatch_recipients, finish_sending
+from sender.importing import map_columns, iter_recipient_rows, ingest_recipients
+from sender.models import Campaign
+from sender.rendering import render_campaign
+from sender.services import MessageSender, DjangoEmailProvider
+from sender.smtp_sink import SMTPSink
+
+
+FIRST_NAMES = ['Anna', 'Piotr', 'Katarzyna', 'Tomasz', 'Magdalena', 'Krzysztof', 'Agnieszka', 'Paweł']
+LAST_NAMES = ['Nowak', 'Kowalski', 'Wiśniewski', 'Wójcik', 'Kowalczyk', 'Kamiński', 'Lewandowski', 'Zieliński']
+MESSAGE = 'Dzień dobry {{first_name}} {{last_name}}! Przypominamy o wizycie {{Data wizyty}} w {{Poradnia}}.'
+
+
+class NullProvider:
+    """Provider bez opóźnień i błędów - mierzymy koszt aplikacji, nie bramki"""
+
+    def send(self, *args):
+        return True, None, {}
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark całej ścieżki kampanii na syntetycznych danych: parsowanie Excela, mapowanie, '
+        'walidacja, zapis odbiorców, renderowanie treści, wysyłka przez provider bez opóźnień, '
+        'agregacja statusów i liczba zapytań widoków. Wynik w JSON do porównywania przebiegów. '
+        'Dane są tworzone w transakcji wycofywanej na końcu.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,100000,1000000',
+                            help='Liczby odbiorców oddzielone przecinkami')
+        parser.add_argument('--max-dispatch', type=int, default=10_000,
+                            help='Limit odbiorców w etapie wysyłki (0 = wszyscy)')
+        parser.add_argument('--no-excel', action='store_true',
+                            help='Pomiń zapis/odczyt pliku XLSX (DataFrame trafia prosto do mapowania)')
+        parser.add_argument('--smtp-sink', action='store_true',
+                            help='Emaile przez DjangoEmailProvider do lokalnego SMTP sinka zamiast providera bez opóźnień')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Plik wynikowy JSON (domyślnie stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--sizes musi być listą liczb, np. 1000,100000')
+
+        report = {'environment': self._environment(), 'runs': []}
+        # Bez DEBUG Django nie zapisuje każdego zapytania w pamięci - to fałszowałoby pomiary
+        with override_settings(DEBUG=False):
+            for size in sizes:
+                self.stderr.write(f'Benchmark dla {size} odbiorców...')
+                report['runs'].append(self._run(size, options))
+
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                handle.write(output)
+            self.stderr.write(self.style.SUCCESS(f"Zapisano {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def _environment(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            ).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {
+            'commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'pandas': pd.__version__,
+            'database': connection.vendor,
+            'sqlite': sqlite3.sqlite_version if connection.vendor == 'sqlite' else None,
+            'machine': platform.machine(),
+        }
+
+    def _run(self, size, options):
+        stages = {}
+
+        def timed(name, func, *args, rows=None):
+            started = time.perf_counter()
+            result = func(*args)
+            seconds = time.perf_counter() - started
+            stages[name] = {'seconds': round(seconds, 4)}
+            if rows:
+                stages[name]['rows_per_s'] = round(rows / seconds, 1) if seconds else None
+            return result
+
+        df = self._workbook(size, options['seed'])
+
+        # Cały przebieg w jednej transakcji na aliasie zapisu, wycofywanej na końcu
+        using = router.db_for_write(Campaign)
+        with transaction.atomic(using=using):
+            if not options['no_excel']:
+                buffer = timed('excel_write', self._to_xlsx, df)
+                df = timed('excel_parse', pd.read_excel, buffer, rows=size)
+
+            mapped_columns, extra_columns = timed('mapping', map_columns, df.columns.tolist())
+            rows = timed('validation', lambda: list(
+                iter_recipient_rows(df, mapped_columns, extra_columns, 'both')
+            ), rows=size)
+
+            campaign = Campaign.objects.create(
+                name=f'[benchmark] {size}', message_type='both', message_content=MESSAGE,
+                excel_columns=mapped_columns,
+            )
+            created, skipped, suppressed = timed('ingestion', ingest_recipients, campaign, rows, rows=size)
+
+            # Materializacja treści wszystkich odbiorców, jak po utworzeniu kampanii
+            timed('render', render_campaign, campaign, rows=size)
+
+            recipients = list(campaign.recipients.select_related('contact')[:options['max_dispatch'] or None])
+
+            timed('dispatch', self._dispatch, campaign, recipients, options['smtp_sink'], rows=len(recipients))
+
+            timed('status_aggregation', lambda: campaign.recipients.aggregate(
+                total=Count('pk'),
+                sent=Count('pk', filter=Q(status='sent')),
+                failed=Count('pk', filter=Q(status='failed')),
+                pending=Count('pk', filter=Q(status='pending')),
+            ))
+
+            views = self._views(campaign)
+            transaction.set_rollback(True, using=using)
+
+        return {
+            'recipients': size,
+            'created': created,
+            'skipped': skipped,
+            'suppressed': suppressed,
+            'dispatched': len(recipients),
+            'stages': stages,
+            'views': views,
+        }
+
+    def _workbook(self, size, seed):
+        rng = random.Random(seed)
+        return pd.DataFrame({
+            'Imię': [rng.choice(FIRST_NAMES) for _ in range(size)],
+            'Nazwisko': [rng.choice(LAST_NAMES) for _ in range(size)],
+            'Email': [f'pacjent{i}@example.com' for i in range(size)],
+            'Telefon': [f'+48 6{i:08d}' for i in range(size)],
+            'Data wizyty': [f'2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}' for _ in range(size)],
+            'Poradnia': [rng.choice(['POZ', 'Kardiologia', 'Okulistyka', 'Ortopedia']) for _ in range(size)],
+        })
+
+    def _to_xlsx(self, df):
+        buffer = io.BytesIO()
+        df.to_excel(buffer, index=False, engine='openpyxl')
+        buffer.seek(0)
+        return buffer
+
+    def _dispatch(self, campaign, recipients, smtp_sink=False):
+        sink = None
+        email_provider = NullProvider()
+        if smtp_sink:
+            sink = SMTPSink(port=0)
+            sink.start()
+            email_provider = DjangoEmailProvider(
+                backend='django.core.mail.backends.smtp.EmailBackend',
+                host='127.0.0.1', port=sink.port, use_tls=False, username='', password='',
+            )
+
+        sender = MessageSender(
+            sms_provider=ProviderPool([PooledProvider('null', NullProvider())]),
+            email_provider=ProviderPool([PooledProvider('email', email_provider)]),
+        )
+        campaign.transition_to('queued')
+        campaign.transition_to('sending')
+        try:
+            return dispatch_recipients(campaign, recipients, sender)
+        finally:
+            finish_sending(campaign)
+            if sink:
+                sink.shutdown()
+                sink.server_close()
+
+    def _views(self, campaign):
+        """Czas i liczba zapytań widoków na wygenerowanej kampanii"""
+        client = Client()
+        urls = {
+            'campaigns': reverse('campaigns'),
+            'campaign_status': reverse('campaign_status', args=[campaign.uid]),
+            'campaign_status_search': reverse('campaign_status', args=[campaign.uid]) + '?search=Nowak',
+            'campaign_status_failed': reverse('campaign_status', args=[campaign.uid]) + '?status=failed',
+            'api_campaign_status': reverse('api_campaign_status', args=[campaign.uid]),
+        }
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['*']):
+            for name, url in urls.items():
+                # W transakcji przebiegu wszystkie zapytania idą połączeniem zapisu
+                with CaptureQueriesContext(connections[router.db_for_write(Campaign)]) as queries:
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    seconds = time.perf_counter() - started
+                results[name] = {
+                    'status_code': response.status_code,
+                    'queries': len(queries),
+                    'seconds': round(seconds, 4),
+                }
+        return results
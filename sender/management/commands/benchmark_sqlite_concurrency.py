@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Domyślne zachowanie SQLite / Django przed wprowadzeniem profilu WAL
+DEFAULT_PROFILE = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+SCHEMA = [
+    """CREATE TABLE recipient (
+        id INTEGER PRIMARY KEY, campaign_id INTEGER NOT NULL, status TEXT NOT NULL,
+        sent_at TEXT, error_message TEXT
+    )""",
+    'CREATE INDEX recipient_campaign_status ON recipient (campaign_id, status)',
+    """CREATE TABLE message_log (
+        id INTEGER PRIMARY KEY, recipient_id INTEGER NOT NULL, success INTEGER NOT NULL, sent_at TEXT
+    )""",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark współbieżności SQLite: jeden wątek wysyłki (zapisy odbiorców i logów) '
+        'i N wątków odpytujących status kampanii - domyślny profil vs SQLITE_PRAGMAS z ustawień.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Liczba wątków czytających')
+        parser.add_argument('--duration', type=float, default=5.0, help='Czas trwania pomiaru na profil (s)')
+        parser.add_argument('--rows', type=int, default=100_000, help='Liczba odbiorców w bazie testowej')
+        parser.add_argument('--timeout', type=float, default=settings.DATABASES['default']['OPTIONS']['timeout'],
+                            help='Timeout połączenia (s), domyślnie jak w DATABASES')
+
+    def handle(self, *args, **options):
+        profiles = [
+            ('domyślny (journal DELETE)', DEFAULT_PROFILE),
+            ('WAL (SQLITE_PRAGMAS)', settings.SQLITE_PRAGMAS),
+        ]
+        for label, pragmas in profiles:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self._prepare(path, pragmas, options['rows'])
+                result = self._run(path, pragmas, options)
+            self._report(label, result)
+
+    def _connect(self, path, pragmas, timeout):
+        connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        for name, value in pragmas.items():
+            connection.execute(f'PRAGMA {name}={value}')
+        return connection
+
+    def _prepare(self, path, pragmas, rows):
+        connection = self._connect(path, pragmas, 5)
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.execute('BEGIN')
+        connection.executemany(
+            'INSERT INTO recipient (id, campaign_id, status) VALUES (?, ?, ?)',
+            ((i, i % 10, 'pending') for i in range(rows)),
+        )
+        connection.execute('COMMIT')
+        connection.close()
+
+    def _run(self, path, pragmas, options):
+        stop = threading.Event()
+        result = {'reads': [], 'writes': [], 'read_errors': 0, 'write_errors': 0}
+        lock = threading.Lock()
+
+        def writer():
+            connection = self._connect(path, pragmas, options['timeout'])
+            recipient_id = 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    # Jak pętla wysyłki: aktualizacja odbiorcy + log w jednej transakcji
+                    connection.execute('BEGIN IMMEDIATE')
+                    connection.execute(
+                        "UPDATE recipient SET status = 'sent', sent_at = datetime('now') WHERE id = ?",
+                        (recipient_id,),
+                    )
+                    connection.execute(
+                        "INSERT INTO message_log (recipient_id, success, sent_at) VALUES (?, 1, datetime('now'))",
+                        (recipient_id,),
+                    )
+                    connection.execute('COMMIT')
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        result['writes'].append(elapsed)
+                except sqlite3.OperationalError:
+                    if connection.in_transaction:
+                        connection.execute('ROLLBACK')
+                    with lock:
+                        result['write_errors'] += 1
+                recipient_id = (recipient_id + 1) % options['rows']
+            connection.close()
+
+        def reader(campaign_id):
+            connection = self._connect(path, pragmas, options['timeout'])
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    # Jak api_campaign_status: liczniki statusów kampanii
+                    connection.execute(
+                        'SELECT status, COUNT(*) FROM recipient WHERE campaign_id = ? GROUP BY status',
+                        (campaign_id,),
+                    ).fetchall()
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        result['reads'].append(elapsed)
+                except sqlite3.OperationalError:
+                    with lock:
+                        result['read_errors'] += 1
+            connection.close()
+
+        threads = [threading.Thread(target=writer)]
+        threads += [threading.Thread(target=reader, args=(i % 10,)) for i in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        result['duration'] = options['duration']
+        return result
+
+    def _report(self, label, result):
+        def percentile(values, fraction):
+            if not values:
+                return 0.0
+            return sorted(values)[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+        duration = result['duration']
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n{label}'))
+        for kind in ('writes', 'reads'):
+            values = result[kind]
+            self.stdout.write(
+                f"  {'zapisy ' if kind == 'writes' else 'odczyty'}: {len(values) / duration:8.0f}/s  "
+                f"p50 {statistics.median(values) * 1000 if values else 0:7.2f} ms  "
+                f"p99 {percentile(values, 0.99):7.2f} ms  "
+                f"błędy 'database is locked': {result['write_errors' if kind == 'writes' else 'read_errors']}"
+            )
@@ -0,0 +1,140 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Biblioteki, których start procesu nie powinien importować (ładowane przy pierwszym użyciu)
+HEAVY_MODULES = ['pandas', 'numpy', 'openpyxl', 'pyarrow', 'smsapi', 'httpx', 'aiosmtplib']
+
+# Etapy mierzone w świeżym interpreterze: kod wypisuje listę załadowanych ciężkich modułów
+STAGE_SCRIPTS = {
+    'django_setup': 'import django; django.setup()',
+    # Start workera: aplikacja WSGI/ASGI + załadowanie URLi (importuje widoki) i admina
+    'wsgi_worker': (
+        'from django.core.wsgi import get_wsgi_application; get_wsgi_application(); '
+        'from django.urls import resolve; resolve("/")'
+    ),
+    'asgi_worker': (
+        'from django.core.asgi import get_asgi_application; get_asgi_application(); '
+        'from django.urls import resolve; resolve("/")'
+    ),
+}
+STAGE_FOOTER = 'import sys, json; print(json.dumps([m for m in {modules!r} if m in sys.modules]))'
+
+# Komendy manage.py mierzone jako cały proces (z kontrolami systemowymi)
+MANAGE_COMMANDS = {
+    'manage_check': ['check'],
+    'manage_showmigrations': ['showmigrations', 'sender'],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark startu procesu: django.setup(), start workera WSGI/ASGI (z URLami i widokami) '
+        'i czas komend manage.py, każdy w świeżym interpreterze. Sprawdza też, czy start nie '
+        'importuje ciężkich bibliotek (pandas, numpy...) i wypisuje najwolniejsze importy. Wynik w JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Liczba uruchomień każdego etapu (mediana)')
+        parser.add_argument('--budget-ms', type=float,
+                            help='Limit mediany startu workera WSGI (ms) - przekroczenie kończy komendę błędem')
+        parser.add_argument('--top-imports', type=int, default=10,
+                            help='Ile najwolniejszych importów startu workera pokazać (-X importtime)')
+        parser.add_argument('--output', help='Plik wynikowy JSON (domyślnie stdout)')
+
+    def handle(self, *args, **options):
+        repeat = max(options['repeat'], 1)
+        report = {'environment': self._environment(), 'stages': {}}
+        problems = []
+
+        for name, script in STAGE_SCRIPTS.items():
+            self.stderr.write(f'Etap {name}...')
+            code = f'{script}\n{STAGE_FOOTER.format(modules=HEAVY_MODULES)}'
+            times = []
+            heavy = []
+            for _ in range(repeat):
+                seconds, stdout, _ = self._python(['-c', code])
+                times.append(seconds)
+                heavy = json.loads(stdout.strip().splitlines()[-1])
+            report['stages'][name] = {**self._summary(times), 'heavy_modules': heavy}
+            if heavy:
+                problems.append(f"{name} importuje przy starcie: {', '.join(heavy)}")
+
+        for name, arguments in MANAGE_COMMANDS.items():
+            self.stderr.write(f'Etap {name}...')
+            times = [self._python(['manage.py', *arguments])[0] for _ in range(repeat)]
+            report['stages'][name] = self._summary(times)
+
+        if options['top_imports']:
+            report['slowest_imports'] = self._slowest_imports(options['top_imports'])
+
+        budget = options['budget_ms']
+        worker_ms = report['stages']['wsgi_worker']['median_ms']
+        if budget and worker_ms > budget:
+            problems.append(f'start workera WSGI {worker_ms} ms > budżet {budget} ms')
+
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                handle.write(output)
+            self.stderr.write(self.style.SUCCESS(f"Zapisano {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+        if problems:
+            raise CommandError('; '.join(problems))
+
+    def _python(self, arguments, extra=()):
+        """Uruchamia świeży interpreter w katalogu projektu; zwraca (sekundy, stdout, stderr)"""
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'marketing.settings')}
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, *extra, *arguments], capture_output=True, text=True, cwd=settings.BASE_DIR, env=env,
+        )
+        seconds = time.perf_counter() - started
+        if result.returncode:
+            raise CommandError(f"Błąd uruchomienia {' '.join(arguments)}:\n{result.stderr[-2000:]}")
+        return seconds, result.stdout, result.stderr
+
+    def _summary(self, times):
+        return {
+            'median_ms': round(statistics.median(times) * 1000, 1),
+            'min_ms': round(min(times) * 1000, 1),
+            'max_ms': round(max(times) * 1000, 1),
+        }
+
+    def _slowest_imports(self, limit):
+        """Pakiety najwyższego poziomu z największym łącznym czasem importu przy starcie workera"""
+        _, _, stderr = self._python(['-c', STAGE_SCRIPTS['wsgi_worker']], extra=['-X', 'importtime'])
+        packages = []
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            # Wcięcie nazwy to głębokość importu - pomijamy importy zagnieżdżone
+            if name.startswith('   '):
+                continue
+            packages.append({'module': name.strip(), 'cumulative_ms': round(int(cumulative) / 1000, 1)})
+        return sorted(packages, key=lambda item: item['cumulative_ms'], reverse=True)[:limit]
+
+    def _environment(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            ).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {
+            'commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'machine': platform.machine(),
+        }
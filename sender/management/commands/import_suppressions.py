@@ -0,0 +1,52 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sender.models import Suppression
+from sender.spreadsheets import read_values
+from sender.suppression import normalize_email, normalize_phone
+
+
+class Command(BaseCommand):
+    help = (
+        'Importuje listę wykluczeń z pliku (XLSX, CSV albo tekst - jedna wartość w wierszu). '
+        'Każda komórka z adresem email lub numerem telefonu trafia na listę po normalizacji '
+        '(email małymi literami, telefon w E.164); istniejące wpisy zostają bez zmian.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Plik z adresami i numerami')
+        parser.add_argument('--reason', choices=[choice for choice, _ in Suppression.REASON_CHOICES], default='manual')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Brak pliku {path}')
+
+        values = read_values(path)
+        entries = {}
+        invalid = 0
+        for value in values:
+            value = str(value).strip()
+            if not value or value == 'nan':
+                continue
+            if '@' in value:
+                kind, normalized = 'email', normalize_email(value)
+            else:
+                kind, normalized = 'phone', normalize_phone(value)
+            if normalized:
+                entries[(kind, normalized)] = Suppression(
+                    kind=kind, value=normalized, reason=options['reason'], source=f'Import: {path.name}'[:200],
+                )
+            else:
+                invalid += 1
+
+        before = Suppression.objects.count()
+        Suppression.objects.bulk_create(
+            list(entries.values()), batch_size=options['batch_size'], ignore_conflicts=True,
+        )
+        added = Suppression.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f'Dodano {added} wpisów ({len(entries) - added} już na liście, {invalid} nierozpoznanych wartości)'
+        ))
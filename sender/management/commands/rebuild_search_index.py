@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sender.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Przebudowuje indeks wyszukiwania kontaktów odbiorców (FTS5 na SQLite)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=options['database']):
+            indexed = rebuild_search_index(options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Zaindeksowano kontaktów: {indexed}'))
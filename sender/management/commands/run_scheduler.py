@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sender.rendering import render_stale_campaigns
+from sender.scheduling import run_scheduler_tick
+from sender.services import MessageSender
+
+
+class Command(BaseCommand):
+    help = (
+        'Scheduler kampanii planowanych: co --interval sekund wypuszcza należną porcję odbiorców '
+        '(scheduled_at, okno wysyłki, rozłożenie w czasie).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=10.0, help='Odstęp między przebiegami (s)')
+        parser.add_argument('--batch-size', type=int, help='Limit odbiorców kampanii na przebieg '
+                                                           '(domyślnie CAMPAIGN_SCHEDULER_BATCH_SIZE)')
+        parser.add_argument('--render-interval', type=float, default=60.0,
+                            help='Co ile sekund szukać kampanii z zaległym renderowaniem treści')
+        parser.add_argument('--once', action='store_true', help='Wykonaj jeden przebieg i zakończ')
+
+    def handle(self, *args, **options):
+        if options['interval'] <= 0:
+            raise CommandError('--interval musi być większy od zera')
+        if options['render_interval'] <= 0:
+            raise CommandError('--render-interval musi być większy od zera')
+
+        last_render_sweep = None
+        while True:
+            started = time.monotonic()
+            # Zaległe renderowanie treści (np. przerwane wraz z procesem serwera po edycji kampanii) -
+            # czyta wszystkie niezakończone kampanie, więc rzadziej niż co przebieg
+            if last_render_sweep is None or started - last_render_sweep >= options['render_interval']:
+                last_render_sweep = started
+                for campaign_uid in render_stale_campaigns():
+                    self.stdout.write(f"{campaign_uid}: wyrenderowano treści odbiorców")
+            # Nowa instancja co przebieg - rejestr providerów i tak zwraca pule z cache
+            released = run_scheduler_tick(MessageSender(), batch_size=options['batch_size'])
+            for campaign_uid, results in released.items():
+                self.stdout.write(
+                    f"{campaign_uid}: wysłano {results['sent']}, błędy {results['failed']}"
+                )
+
+            if options['once']:
+                break
+            time.sleep(max(0.0, options['interval'] - (time.monotonic() - started)))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from sender.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = (
+        'Lokalny serwer SMTP, który przyjmuje i wyrzuca wszystkie wiadomości - do testów obciążenia '
+        'DjangoEmailProvider bez prawdziwego serwera poczty. Skieruj na niego EmailProvider z config '
+        '{"backend": "django.core.mail.backends.smtp.EmailBackend", "host": "127.0.0.1", "port": 2525, "use_tls": false}.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=2525)
+        parser.add_argument('--latency', type=float, default=0.0, help='Sztuczne opóźnienie odpowiedzi na DATA (s)')
+        parser.add_argument('--stats-interval', type=float, default=10.0, help='Co ile sekund wypisywać liczniki')
+
+    def handle(self, *args, **options):
+        sink = SMTPSink(options['host'], options['port'], options['latency'])
+        sink.start()
+        self.stdout.write(self.style.SUCCESS(f"SMTP sink nasłuchuje na {options['host']}:{sink.port}"))
+
+        try:
+            while True:
+                time.sleep(options['stats_interval'])
+                self.stdout.write(f'Wiadomości: {sink.messages}, odbiorców: {sink.recipients}, bajtów: {sink.bytes}')
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sink.shutdown()
+            sink.server_close()
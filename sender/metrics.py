@@ -0,0 +1,256 @@
+import bisect
+import math
+import threading
+import weakref
+
+# Domyślne przedziały histogramów czasu (s) - od pojedynczych operacji w pamięci po wolne bramki
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _ShardOwner:
+    """Obiekt trzymany tylko przez threading.local wątku - znika razem z wątkiem"""
+
+    __slots__ = ('shard', '__weakref__')
+
+    def __init__(self):
+        self.shard = {}
+
+
+class Metric:
+    """
+    Metryka z etykietami w formacie Prometheusa.
+
+    Każdy wątek zapisuje do własnego słownika (shard), więc zapis nie bierze
+    żadnej blokady i nie gubi inkrementacji z innych wątków; blokada jest tylko
+    przy pierwszym zapisie wątku i przy odczycie (scrape), który sumuje shardy.
+    Shard zakończonego wątku jest doliczany do wspólnej bazy i usuwany, więc
+    liczba shardów nie rośnie z każdym nowym wątkiem (pule wątków, serwer).
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        # {id(shard): shard} - usuwanie po tożsamości, nie po równości słowników
+        self._shards = {}
+        # Wartości zakończonych wątków
+        self._base = {}
+        # RLock - finalizer shardu może zadziałać w wątku, który już trzyma blokadę
+        self._lock = threading.RLock()
+
+    def _shard(self):
+        try:
+            return self._local.owner.shard
+        except AttributeError:
+            owner = self._local.owner = _ShardOwner()
+            with self._lock:
+                self._shards[id(owner.shard)] = owner.shard
+            weakref.finalize(owner, self._retire, owner.shard)
+            return owner.shard
+
+    def _retire(self, shard):
+        """Dolicza shard zakończonego wątku do bazy"""
+        with self._lock:
+            for key, value in shard.items():
+                self._base[key] = self._merge(self._base[key], value) if key in self._base else value
+            del self._shards[id(shard)]
+
+    def _merge(self, total, value):
+        """Suma dwóch wartości jednej serii (nowy obiekt - snapshot może trzymać stary)"""
+        raise NotImplementedError
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name}: oczekiwane etykiety {self.labelnames}, podano {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _snapshot(self):
+        # dict(shard) kopiuje słownik atomowo względem zapisów innych wątków (GIL);
+        # pod blokadą, żeby shard przeniesiony właśnie do bazy nie został policzony dwa razy
+        with self._lock:
+            return [dict(self._base)] + [dict(shard) for shard in self._shards.values()]
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (
+            '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for name, value in pairs
+        )
+        return '{' + ','.join(escaped) + '}'
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def _merge(self, total, value):
+        return total + value
+
+    def value(self, **labels):
+        key = self._key(labels)
+        return sum(shard.get(key, 0) for shard in self._snapshot())
+
+    def _samples(self):
+        totals = {}
+        for shard in self._snapshot():
+            for key, value in shard.items():
+                totals[key] = totals.get(key, 0) + value
+        return [f'{self.name}{self._format_labels(key)} {_format_value(value)}' for key, value in sorted(totals.items())]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        state = shard.get(key)
+        if state is None:
+            # [liczniki przedziałów..., +Inf, suma]
+            state = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def _merge(self, total, value):
+        return [a + b for a, b in zip(total, value)]
+
+    def _samples(self):
+        totals = {}
+        for shard in self._snapshot():
+            for key, state in shard.items():
+                state = list(state)
+                total = totals.setdefault(key, [0] * len(state))
+                for index, value in enumerate(state):
+                    total[index] += value
+
+        lines = []
+        for key, state in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), state[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else _format_value(bound)
+                lines.append(f'{self.name}_bucket{self._format_labels(key, [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{self._format_labels(key)} {_format_value(state[-1])}')
+            lines.append(f'{self.name}_count{self._format_labels(key)} {cumulative}')
+        return lines
+
+
+class Gauge(Metric):
+    """Wartość liczona w chwili odczytu przez funkcję (np. zapytanie o długość kolejki)"""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, function, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _samples(self):
+        values = self.function()
+        if not self.labelnames:
+            values = {(): values}
+        return [
+            f'{self.name}{self._format_labels(key)} {_format_value(value)}'
+            for key, value in sorted(values.items())
+        ]
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def expose(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'sender_stage_seconds', 'Czas etapów przetwarzania kampanii (parse, render, db_flush)', ['stage'],
+))
+PROVIDER_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'sender_provider_request_seconds', 'Czas wywołania send() providera', ['provider'],
+))
+PROVIDER_REQUESTS = REGISTRY.register(Counter(
+    'sender_provider_requests_total', 'Wywołania providerów według wyniku (success, failure, timeout)',
+    ['provider', 'result'],
+))
+RECIPIENTS_PROCESSED = REGISTRY.register(Counter(
+    'sender_recipients_processed_total', 'Obsłużeni odbiorcy według statusu', ['status'],
+))
+ROWS_PARSED = REGISTRY.register(Counter(
+    'sender_rows_parsed_total', 'Wiersze wczytane z plików Excel',
+))
+
+
+def _queue_depth():
+    from .models import Recipient
+
+    return Recipient.objects.filter(campaign__status__in=['queued', 'sending'], status='pending').count()
+
+
+def _campaigns_by_status():
+    from django.db.models import Count
+
+    from .models import Campaign
+
+    counts = {(status,): 0 for status, _ in Campaign.STATUS_CHOICES}
+    for row in Campaign.objects.values('status').annotate(total=Count('pk')).order_by():
+        counts[(row['status'],)] = row['total']
+    return counts
+
+
+def _circuits_open():
+    from .registry import registry
+
+    return {
+        (member.name,): int(member.breaker.state == 'open')
+        for pool in registry.pools()
+        for member in pool.members
+    }
+
+
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'sender_queue_depth', 'Odbiorcy oczekujący w kampaniach w kolejce lub w trakcie wysyłki', _queue_depth,
+))
+CAMPAIGNS = REGISTRY.register(Gauge(
+    'sender_campaigns', 'Kampanie według statusu', _campaigns_by_status, ['status'],
+))
+CIRCUIT_OPEN = REGISTRY.register(Gauge(
+    'sender_provider_circuit_open', 'Czy obwód providera jest otwarty (1) w tym procesie', _circuits_open, ['provider'],
+))
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='messagelog',
+            index=models.Index(fields=['recipient', 'sent_at'], name='messagelog_recipient_sent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipient',
+            index=models.Index(fields=['campaign', 'status'], name='recipient_campaign_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipient',
+            index=models.Index(fields=['campaign', '-sent_at', 'last_name', 'first_name'], name='recipient_campaign_order_idx'),
+        ),
+    ]
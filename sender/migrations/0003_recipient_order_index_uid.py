@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0002_recipient_messagelog_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='recipient',
+            name='recipient_campaign_order_idx',
+        ),
+        migrations.AddIndex(
+            model_name='recipient',
+            index=models.Index(fields=['campaign', '-sent_at', 'last_name', 'first_name', 'uid'], name='recipient_campaign_order_idx'),
+        ),
+    ]
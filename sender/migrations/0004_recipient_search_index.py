@@ -0,0 +1,74 @@
+from django.db import migrations
+
+
+SEARCH_COLUMNS = ['first_name', 'last_name', 'email', 'phone']
+
+SQLITE_FORWARD = [
+    # Tabela FTS5 z tokenizerem trigramowym - wyszukiwanie podciągów jak icontains.
+    # rowid odpowiada rowid odbiorcy, uid służy do filtrowania po kluczu głównym.
+    """
+    CREATE VIRTUAL TABLE sender_recipient_fts USING fts5(
+        uid UNINDEXED, first_name, last_name, email, phone, tokenize = 'trigram'
+    )
+    """,
+    """
+    INSERT INTO sender_recipient_fts (rowid, uid, first_name, last_name, email, phone)
+    SELECT rowid, uid, first_name, last_name, email, phone FROM sender_recipient
+    """,
+    """
+    CREATE TRIGGER sender_recipient_fts_insert AFTER INSERT ON sender_recipient BEGIN
+        INSERT INTO sender_recipient_fts (rowid, uid, first_name, last_name, email, phone)
+        VALUES (NEW.rowid, NEW.uid, NEW.first_name, NEW.last_name, NEW.email, NEW.phone);
+    END
+    """,
+    """
+    CREATE TRIGGER sender_recipient_fts_update
+    AFTER UPDATE OF uid, first_name, last_name, email, phone ON sender_recipient BEGIN
+        DELETE FROM sender_recipient_fts WHERE rowid = OLD.rowid;
+        INSERT INTO sender_recipient_fts (rowid, uid, first_name, last_name, email, phone)
+        VALUES (NEW.rowid, NEW.uid, NEW.first_name, NEW.last_name, NEW.email, NEW.phone);
+    END
+    """,
+    """
+    CREATE TRIGGER sender_recipient_fts_delete AFTER DELETE ON sender_recipient BEGIN
+        DELETE FROM sender_recipient_fts WHERE rowid = OLD.rowid;
+    END
+    """,
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS sender_recipient_fts_delete',
+    'DROP TRIGGER IF EXISTS sender_recipient_fts_update',
+    'DROP TRIGGER IF EXISTS sender_recipient_fts_insert',
+    'DROP TABLE IF EXISTS sender_recipient_fts',
+]
+
+# Indeksy trigramowe na tych samych wyrażeniach, które Django generuje dla icontains
+POSTGRESQL_FORWARD = ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+    f'CREATE INDEX IF NOT EXISTS sender_recipient_{column}_trgm '
+    f'ON sender_recipient USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+    for column in SEARCH_COLUMNS
+]
+
+POSTGRESQL_BACKWARD = [f'DROP INDEX IF EXISTS sender_recipient_{column}_trgm' for column in SEARCH_COLUMNS]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0003_recipient_order_index_uid'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRESQL_BACKWARD}),
+        ),
+    ]
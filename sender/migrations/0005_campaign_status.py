@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:34
+
+from django.db import migrations, models
+
+
+def forwards(apps, schema_editor):
+    Campaign = apps.get_model('sender', 'Campaign')
+    for campaign in Campaign.objects.all():
+        recipients = campaign.recipients.all()
+        if campaign.is_completed:
+            status = 'partially_failed' if recipients.filter(status='failed').exists() else 'completed'
+        elif recipients.exclude(status='pending').exists():
+            # Przerwana wysyłka - wraca do kolejki, żeby można ją było dokończyć
+            status = 'queued'
+        else:
+            status = 'draft'
+        Campaign.objects.filter(pk=campaign.pk).update(status=status)
+
+
+def backwards(apps, schema_editor):
+    Campaign = apps.get_model('sender', 'Campaign')
+    Campaign.objects.filter(status__in=['completed', 'partially_failed']).update(is_completed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0004_recipient_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Szkic'), ('queued', 'W kolejce'), ('sending', 'Wysyłanie'), ('completed', 'Zakończona'), ('partially_failed', 'Zakończona z błędami')], default='draft', max_length=20, verbose_name='Status'),
+        ),
+        migrations.RunPython(forwards, backwards),
+        migrations.RemoveField(
+            model_name='campaign',
+            name='is_completed',
+        ),
+    ]
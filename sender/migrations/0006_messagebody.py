@@ -0,0 +1,98 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:35
+
+import hashlib
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+COMPRESSION_THRESHOLD = 256
+
+
+def forwards(apps, schema_editor):
+    MessageBody = apps.get_model('sender', 'MessageBody')
+    MessageLog = apps.get_model('sender', 'MessageLog')
+
+    known = set()
+    batch = []
+    for log in MessageLog.objects.only('uid', 'final_message').iterator(chunk_size=2000):
+        raw = (log.final_message or '').encode('utf-8')
+        digest = hashlib.sha256(raw).hexdigest()
+
+        if digest not in known:
+            data, compressed = raw, False
+            if len(raw) >= COMPRESSION_THRESHOLD:
+                packed = zlib.compress(raw, 6)
+                if len(packed) < len(raw):
+                    data, compressed = packed, True
+            MessageBody.objects.bulk_create(
+                [MessageBody(digest=digest, compressed=compressed, data=data, size=len(raw))],
+                ignore_conflicts=True,
+            )
+            known.add(digest)
+
+        log.body_id = digest
+        batch.append(log)
+        if len(batch) >= 2000:
+            MessageLog.objects.bulk_update(batch, ['body'])
+            batch = []
+
+    if batch:
+        MessageLog.objects.bulk_update(batch, ['body'])
+
+
+def backwards(apps, schema_editor):
+    MessageLog = apps.get_model('sender', 'MessageLog')
+
+    batch = []
+    for log in MessageLog.objects.select_related('body').iterator(chunk_size=2000):
+        data = bytes(log.body.data)
+        log.final_message = (zlib.decompress(data) if log.body.compressed else data).decode('utf-8')
+        batch.append(log)
+        if len(batch) >= 2000:
+            MessageLog.objects.bulk_update(batch, ['final_message'])
+            batch = []
+
+    if batch:
+        MessageLog.objects.bulk_update(batch, ['final_message'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0005_campaign_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageBody',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('compressed', models.BooleanField(default=False)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='messagelog',
+            name='body',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='logs', to='sender.messagebody'),
+        ),
+        migrations.AlterField(
+            model_name='messagelog',
+            name='final_message',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(forwards, backwards),
+        migrations.RemoveField(
+            model_name='messagelog',
+            name='final_message',
+        ),
+        migrations.AlterField(
+            model_name='messagelog',
+            name='body',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='logs', to='sender.messagebody'),
+        ),
+    ]
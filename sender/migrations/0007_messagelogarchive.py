@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0006_messagebody'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageLogArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500)),
+                ('format', models.CharField(choices=[('jsonl', 'JSONL (gzip)'), ('parquet', 'Parquet')], default='jsonl', max_length=10)),
+                ('log_count', models.PositiveIntegerField(default=0)),
+                ('summary', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_archives', to='sender.campaign')),
+            ],
+        ),
+    ]
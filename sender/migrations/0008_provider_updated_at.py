@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0007_messagelogarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailprovider',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='smsprovider',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0008_provider_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='scheduled_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Zaplanowana wysyłka'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='send_window_end',
+            field=models.TimeField(blank=True, null=True, verbose_name='Okno wysyłki do'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='send_window_start',
+            field=models.TimeField(blank=True, null=True, verbose_name='Okno wysyłki od'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='spread_minutes',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Rozłożenie wysyłki (minuty)'),
+        ),
+    ]
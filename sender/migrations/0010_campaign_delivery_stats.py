@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0009_campaign_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='delivery_stats',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
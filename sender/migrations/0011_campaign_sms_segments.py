@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0010_campaign_delivery_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='sms_estimate',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='sms_transliterate',
+            field=models.BooleanField(default=False, verbose_name='Transliteracja SMS'),
+        ),
+    ]
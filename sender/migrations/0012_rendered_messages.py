@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0011_campaign_sms_segments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='render_summary',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipient',
+            name='rendered_digest',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='recipient',
+            name='rendered_message',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0012_rendered_messages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Suppression',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('email', 'Email'), ('phone', 'Telefon')], max_length=5)),
+                ('value', models.CharField(max_length=254)),
+                ('reason', models.CharField(choices=[('unsubscribed', 'Rezygnacja'), ('bounce', 'Trwały błąd doręczenia'), ('manual', 'Dodane ręcznie')], default='manual', max_length=20)),
+                ('source', models.CharField(blank=True, default='', max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'value'), name='suppression_kind_value_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0014_contact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipient',
+            name='row_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+    ]
@@ -0,0 +1,46 @@
+import importlib
+
+from django.db import migrations, models
+
+
+# Indeks wyszukiwania odbiorców z 0004 - zastępuje go indeks kontaktów (0018)
+recipient_search = importlib.import_module('sender.migrations.0004_recipient_search_index')
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0015_recipient_row_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contact',
+            name='key',
+            field=models.CharField(max_length=280, unique=True),
+        ),
+        # Indeks wyszukiwania na kolumnach odbiorcy znika razem z nimi
+        migrations.RunPython(
+            _run({'sqlite': recipient_search.SQLITE_BACKWARD, 'postgresql': recipient_search.POSTGRESQL_BACKWARD}),
+            _run({'sqlite': recipient_search.SQLITE_FORWARD, 'postgresql': recipient_search.POSTGRESQL_FORWARD}),
+        ),
+        # Domyślne wartości tylko na czas cofania 0018 - kolumny wracają wtedy do wypełnionej
+        # tabeli. Po indeksie FTS, bo przebudowa tabeli przy cofaniu usuwa jego wyzwalacze
+        migrations.AlterField(
+            model_name='recipient',
+            name='first_name',
+            field=models.CharField(default='', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='recipient',
+            name='last_name',
+            field=models.CharField(default='', max_length=50),
+        ),
+    ]
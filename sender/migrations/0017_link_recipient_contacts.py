@@ -0,0 +1,149 @@
+import re
+
+from django.conf import settings
+from django.db import migrations
+
+
+BATCH_SIZE = 1000
+
+IDENTITY_FIELDS = ['first_name', 'last_name', 'email', 'phone']
+
+DEFAULT_COUNTRY_CODE = getattr(settings, 'SUPPRESSION_DEFAULT_COUNTRY_CODE', '48')
+
+
+# Zamrożona kopia normalizacji i klucza z sender.suppression / sender.contacts z chwili
+# tej migracji - późniejsze zmiany tamtych funkcji nie mogą zmienić jej wyniku
+
+
+def _normalize_email(email):
+    if not email:
+        return None
+    email = str(email).strip().lower()
+    return email if '@' in email else None
+
+
+def _normalize_phone(phone):
+    if not phone:
+        return None
+    phone = str(phone).strip()
+    digits = re.sub(r'\D', '', phone)
+    if phone.startswith('00'):
+        digits = digits[2:]
+    elif not phone.startswith('+'):
+        if digits.startswith('0') and len(digits) == 10:
+            digits = DEFAULT_COUNTRY_CODE + digits[1:]
+        elif len(digits) <= 9:
+            digits = DEFAULT_COUNTRY_CODE + digits
+    if len(digits) < 9:
+        return None
+    return f'+{digits}'
+
+
+def _contact_key(email, phone):
+    email, phone = _normalize_email(email), _normalize_phone(phone)
+    if not email and not phone:
+        return None
+    return f"{email or ''}|{phone or ''}"
+
+
+def link_contacts(apps, schema_editor):
+    """
+    Każdy odbiorca dostaje kontakt swojej pary (email, telefon).
+
+    Kontakty z kluczem po samym emailu lub telefonie dostają klucz pary.
+    Odbiorcy są czytani kampaniami od najstarszej, więc dane kontaktu
+    (imię, nazwisko, zapis numeru) pochodzą z ostatniego importu.
+    """
+    Contact = apps.get_model('sender', 'Contact')
+    Recipient = apps.get_model('sender', 'Recipient')
+    using = schema_editor.connection.alias
+    contacts = Contact.objects.using(using)
+
+    batch = []
+    for contact in contacts.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        contact.key = _contact_key(contact.email, contact.phone) or contact.key
+        batch.append(contact)
+        if len(batch) >= BATCH_SIZE:
+            contacts.bulk_update(batch, ['key'])
+            batch = []
+    contacts.bulk_update(batch, ['key'])
+
+    recipients = Recipient.objects.using(using).order_by('campaign__created_at', 'campaign_id', 'uid').values_list(
+        'uid', 'campaign_id', *IDENTITY_FIELDS,
+    )
+    campaign_id = None
+    seen = set()
+    rows = []
+    for uid, campaign, *identity in recipients.iterator(chunk_size=BATCH_SIZE):
+        if campaign != campaign_id:
+            campaign_id, seen = campaign, set()
+        values = dict(zip(IDENTITY_FIELDS, identity))
+        key = _contact_key(values['email'], values['phone']) or f'#{uid}'
+        if key in seen:
+            # Ta sama para dwa razy w kampanii (dawny unique_together nie łapał NULL) - osobny kontakt
+            key = f'{key}#{uid}'
+        seen.add(key)
+        rows.append((uid, key, values))
+        if len(rows) >= BATCH_SIZE:
+            _link_batch(Contact, Recipient, using, rows)
+            rows = []
+    if rows:
+        _link_batch(Contact, Recipient, using, rows)
+
+
+def _link_batch(Contact, Recipient, using, rows):
+    contacts = Contact.objects.using(using)
+    incoming = {}
+    for _, key, values in rows:
+        incoming[key] = values
+    existing = {contact.key: contact for contact in contacts.filter(key__in=list(incoming))}
+
+    to_update = []
+    for key, values in incoming.items():
+        contact = existing.get(key)
+        if contact is None:
+            continue
+        changed = False
+        for field in IDENTITY_FIELDS:
+            if values[field] and values[field] != getattr(contact, field):
+                setattr(contact, field, values[field])
+                changed = True
+        if changed:
+            to_update.append(contact)
+    contacts.bulk_update(to_update, IDENTITY_FIELDS)
+
+    missing = [Contact(key=key, **values) for key, values in incoming.items() if key not in existing]
+    contacts.bulk_create(missing)
+    ids = {contact.key: contact.pk for contact in existing.values()}
+    ids.update(contacts.filter(key__in=[contact.key for contact in missing]).values_list('key', 'pk'))
+
+    Recipient.objects.using(using).bulk_update(
+        [Recipient(uid=uid, contact_id=ids[key]) for uid, key, _ in rows], ['contact'],
+    )
+
+
+def copy_identity_back(apps, schema_editor):
+    """Cofnięcie: odbiorcy znów trzymają kopię danych kontaktu"""
+    Recipient = apps.get_model('sender', 'Recipient')
+    using = schema_editor.connection.alias
+    batch = []
+    for recipient in Recipient.objects.using(using).select_related('contact').iterator(chunk_size=BATCH_SIZE):
+        for field in IDENTITY_FIELDS:
+            value = getattr(recipient.contact, field)
+            setattr(recipient, field, value if value is not None or field in ('email', 'phone') else '')
+        batch.append(recipient)
+        if len(batch) >= BATCH_SIZE:
+            Recipient.objects.using(using).bulk_update(batch, IDENTITY_FIELDS)
+            batch = []
+    Recipient.objects.using(using).bulk_update(batch, IDENTITY_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0016_recipient_identity_in_contact'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_contacts, copy_identity_back),
+    ]
@@ -0,0 +1,110 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SEARCH_COLUMNS = ['first_name', 'last_name', 'email', 'phone']
+
+SQLITE_FORWARD = [
+    # rowid indeksu to id kontaktu (alias rowid - VACUUM go nie zmienia)
+    """
+    CREATE VIRTUAL TABLE sender_contact_fts USING fts5(
+        first_name, last_name, email, phone, tokenize = 'trigram'
+    )
+    """,
+    """
+    INSERT INTO sender_contact_fts (rowid, first_name, last_name, email, phone)
+    SELECT id, first_name, last_name, email, phone FROM sender_contact
+    """,
+    """
+    CREATE TRIGGER sender_contact_fts_insert AFTER INSERT ON sender_contact BEGIN
+        INSERT INTO sender_contact_fts (rowid, first_name, last_name, email, phone)
+        VALUES (NEW.id, NEW.first_name, NEW.last_name, NEW.email, NEW.phone);
+    END
+    """,
+    """
+    CREATE TRIGGER sender_contact_fts_update
+    AFTER UPDATE OF first_name, last_name, email, phone ON sender_contact BEGIN
+        DELETE FROM sender_contact_fts WHERE rowid = OLD.id;
+        INSERT INTO sender_contact_fts (rowid, first_name, last_name, email, phone)
+        VALUES (NEW.id, NEW.first_name, NEW.last_name, NEW.email, NEW.phone);
+    END
+    """,
+    """
+    CREATE TRIGGER sender_contact_fts_delete AFTER DELETE ON sender_contact BEGIN
+        DELETE FROM sender_contact_fts WHERE rowid = OLD.id;
+    END
+    """,
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS sender_contact_fts_delete',
+    'DROP TRIGGER IF EXISTS sender_contact_fts_update',
+    'DROP TRIGGER IF EXISTS sender_contact_fts_insert',
+    'DROP TABLE IF EXISTS sender_contact_fts',
+]
+
+POSTGRESQL_FORWARD = ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+    f'CREATE INDEX IF NOT EXISTS sender_contact_{column}_trgm '
+    f'ON sender_contact USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+    for column in SEARCH_COLUMNS
+]
+
+POSTGRESQL_BACKWARD = [f'DROP INDEX IF EXISTS sender_contact_{column}_trgm' for column in SEARCH_COLUMNS]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0017_link_recipient_contacts'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='recipient',
+            unique_together=set(),
+        ),
+        migrations.RemoveIndex(
+            model_name='recipient',
+            name='recipient_campaign_order_idx',
+        ),
+        migrations.RemoveField(
+            model_name='recipient',
+            name='first_name',
+        ),
+        migrations.RemoveField(
+            model_name='recipient',
+            name='last_name',
+        ),
+        migrations.RemoveField(
+            model_name='recipient',
+            name='email',
+        ),
+        migrations.RemoveField(
+            model_name='recipient',
+            name='phone',
+        ),
+        migrations.AlterField(
+            model_name='recipient',
+            name='contact',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='recipients', to='sender.contact'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipient',
+            constraint=models.UniqueConstraint(fields=('campaign', 'contact'), name='recipient_campaign_contact_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='recipient',
+            index=models.Index(fields=['campaign', '-sent_at', 'contact', 'uid'], name='recipient_campaign_order_idx'),
+        ),
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRESQL_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,44 @@
+import importlib
+
+from django.db import migrations, models
+
+
+# SQLite przebudowuje sender_contact przy tych zmianach, a razem ze starą tabelą
+# znikają wyzwalacze indeksu FTS kontaktów z 0018 - indeks trzeba zbudować od nowa
+contact_search = importlib.import_module('sender.migrations.0018_remove_recipient_identity')
+
+
+def rebuild_contact_search(apps, schema_editor):
+    statements = {
+        'sqlite': contact_search.SQLITE_BACKWARD + contact_search.SQLITE_FORWARD,
+    }
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0018_remove_recipient_identity'),
+    ]
+
+    operations = [
+        # Przy cofaniu wykonuje się na końcu - po przebudowach tabeli
+        migrations.RunPython(migrations.RunPython.noop, rebuild_contact_search),
+        migrations.AlterField(
+            model_name='contact',
+            name='key',
+            field=models.CharField(db_index=True, max_length=280),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='digest',
+            field=models.CharField(default='', max_length=40),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipient',
+            name='sort_name',
+            field=models.CharField(blank=True, default='', max_length=101),
+        ),
+    ]
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import re
+
+from django.conf import settings
+from django.db import migrations
+
+
+BATCH_SIZE = 1000
+
+CONTACT_FIELDS = ['email', 'phone', 'first_name', 'last_name']
+
+DEFAULT_COUNTRY_CODE = getattr(settings, 'SUPPRESSION_DEFAULT_COUNTRY_CODE', '48')
+
+
+# Zamrożona kopia normalizacji, klucza, skrótu i klucza sortowania z sender.suppression /
+# sender.contacts z chwili tej migracji
+
+
+def _normalize_email(email):
+    if not email:
+        return None
+    email = str(email).strip().lower()
+    return email if '@' in email else None
+
+
+def _normalize_phone(phone):
+    if not phone:
+        return None
+    phone = str(phone).strip()
+    digits = re.sub(r'\D', '', phone)
+    if phone.startswith('00'):
+        digits = digits[2:]
+    elif not phone.startswith('+'):
+        if digits.startswith('0') and len(digits) == 10:
+            digits = DEFAULT_COUNTRY_CODE + digits[1:]
+        elif len(digits) <= 9:
+            digits = DEFAULT_COUNTRY_CODE + digits
+    if len(digits) < 9:
+        return None
+    return f'+{digits}'
+
+
+def _contact_key(email, phone):
+    email, phone = _normalize_email(email), _normalize_phone(phone)
+    if not email and not phone:
+        return None
+    return f"{email or ''}|{phone or ''}"
+
+
+def _contact_digest(key, values):
+    payload = json.dumps([key] + [values[field] for field in CONTACT_FIELDS], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _sort_name(first_name, last_name):
+    return f"{last_name} {first_name}"[:101]
+
+
+def fill(apps, schema_editor):
+    """
+    Kontakty dostają klucz pary i skrót danych, odbiorcy klucz sortowania.
+
+    Kontakty rozdzielone w 0017 przez dopisek "#uid" wracają do klucza pary;
+    gdyby dwa miały identyczne dane, drugi dostaje skrót z domieszką id, żeby
+    zachować unikalność (import po prostu utworzy przy nim nową migawkę).
+    """
+    Contact = apps.get_model('sender', 'Contact')
+    Recipient = apps.get_model('sender', 'Recipient')
+    using = schema_editor.connection.alias
+
+    seen = set()
+    batch = []
+    for contact in Contact.objects.using(using).order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        contact.key = _contact_key(contact.email, contact.phone) or contact.key
+        values = {
+            'email': contact.email or None,
+            'phone': contact.phone or None,
+            'first_name': contact.first_name or '',
+            'last_name': contact.last_name or '',
+        }
+        digest = _contact_digest(contact.key, values)
+        if digest in seen:
+            digest = hashlib.sha1(f'{digest}#{contact.pk}'.encode('utf-8')).hexdigest()
+        seen.add(digest)
+        contact.digest = digest
+        batch.append(contact)
+        if len(batch) >= BATCH_SIZE:
+            Contact.objects.using(using).bulk_update(batch, ['key', 'digest'])
+            batch = []
+    Contact.objects.using(using).bulk_update(batch, ['key', 'digest'])
+
+    batch = []
+    recipients = Recipient.objects.using(using).values_list('uid', 'contact__first_name', 'contact__last_name')
+    for uid, first_name, last_name in recipients.iterator(chunk_size=BATCH_SIZE):
+        batch.append(Recipient(uid=uid, sort_name=_sort_name(first_name, last_name)))
+        if len(batch) >= BATCH_SIZE:
+            Recipient.objects.using(using).bulk_update(batch, ['sort_name'])
+            batch = []
+    Recipient.objects.using(using).bulk_update(batch, ['sort_name'])
+
+
+def unfill(apps, schema_editor):
+    """Cofnięcie: klucz kontaktu znów unikalny - kontakty z tą samą parą dostają dopisek "#id\""""
+    Contact = apps.get_model('sender', 'Contact')
+    using = schema_editor.connection.alias
+
+    seen = set()
+    batch = []
+    for contact in Contact.objects.using(using).order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        if contact.key in seen:
+            contact.key = f'{contact.key}#{contact.pk}'
+            batch.append(contact)
+        seen.add(contact.key)
+        if len(batch) >= BATCH_SIZE:
+            Contact.objects.using(using).bulk_update(batch, ['key'])
+            batch = []
+    Contact.objects.using(using).bulk_update(batch, ['key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0019_contact_digest_recipient_sort_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill, unfill),
+    ]
@@ -0,0 +1,39 @@
+import importlib
+
+from django.db import migrations, models
+
+
+# Przebudowa sender_contact w 0019 i tutaj usuwa wyzwalacze indeksu FTS kontaktów z 0018
+contact_search = importlib.import_module('sender.migrations.0018_remove_recipient_identity')
+
+
+def rebuild_contact_search(apps, schema_editor):
+    statements = {
+        'sqlite': contact_search.SQLITE_BACKWARD + contact_search.SQLITE_FORWARD,
+    }
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0020_fill_contact_digest_sort_name'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contact',
+            name='digest',
+            field=models.CharField(max_length=40, unique=True),
+        ),
+        migrations.RemoveIndex(
+            model_name='recipient',
+            name='recipient_campaign_order_idx',
+        ),
+        migrations.AddIndex(
+            model_name='recipient',
+            index=models.Index(fields=['campaign', '-sent_at', 'sort_name', 'uid'], name='recipient_campaign_order_idx'),
+        ),
+        migrations.RunPython(rebuild_contact_search, migrations.RunPython.noop),
+    ]
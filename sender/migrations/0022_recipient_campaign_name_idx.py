@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sender', '0021_contact_digest_unique_recipient_order_by_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipient',
+            index=models.Index(fields=['campaign', 'sort_name', 'uid'], name='recipient_campaign_name_idx'),
+        ),
+    ]
@@ -1,10 +1,32 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, IntegrityError, router, transaction
+from django.conf import settings
+import hashlib
 import uuid
 import json
+import zlib
 
 
 class Campaign(models.Model):
     """Model reprezentujący pojedynczą kampanię wysyłki"""
+    STATUS_CHOICES = [
+        ('draft', 'Szkic'),
+        ('queued', 'W kolejce'),
+        ('sending', 'Wysyłanie'),
+        ('completed', 'Zakończona'),
+        ('partially_failed', 'Zakończona z błędami'),
+    ]
+    FINISHED_STATUSES = ['completed', 'partially_failed']
+    
+    # Dozwolone przejścia stanów - wykonywane wyłącznie na ścieżce zapisu (wysyłka)
+    TRANSITIONS = {
+        'draft': ['queued'],
+        'queued': ['sending', 'draft'],
+        'sending': ['completed', 'partially_failed', 'queued'],
+        'completed': [],
+        'partially_failed': [],
+    }
+    
     uid = models.UUIDField(default=uuid.uuid4, primary_key=True)
     name = models.CharField(max_length=100, verbose_name="Nazwa kampanii")
     message_content = models.TextField(verbose_name="Treść wiadomości")
@@ -15,13 +37,102 @@ class Campaign(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     sent_at = models.DateTimeField(null=True, blank=True)
-    is_completed = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft', verbose_name="Status")
+    
+    # Planowanie: start wysyłki, dozwolone okno godzinowe (czas lokalny CAMPAIGN_TIMEZONE)
+    # i czas, na jaki rozłożyć wysyłkę - odbiorców wypuszcza scheduler (run_scheduler)
+    scheduled_at = models.DateTimeField(null=True, blank=True, verbose_name="Zaplanowana wysyłka")
+    send_window_start = models.TimeField(null=True, blank=True, verbose_name="Okno wysyłki od")
+    send_window_end = models.TimeField(null=True, blank=True, verbose_name="Okno wysyłki do")
+    spread_minutes = models.PositiveIntegerField(null=True, blank=True, verbose_name="Rozłożenie wysyłki (minuty)")
+    
+    # SMS bez polskich znaków (GSM-7 zamiast UCS-2: 160 zamiast 70 znaków na część)
+    sms_transliterate = models.BooleanField(default=False, verbose_name="Transliteracja SMS")
     
     # Metadata z Excela - dodatkowe kolumny jako JSON
     excel_columns = models.JSONField(default=dict, blank=True)
     
+    # Szacunek części i kosztu SMS przed wysyłką - patrz sender.segmentation
+    sms_estimate = models.JSONField(default=dict, blank=True, editable=False)
+    
+    # Stan renderowania treści odbiorców (skrót treści, liczba, brakujące zmienne) - patrz sender.rendering
+    render_summary = models.JSONField(default=dict, blank=True, editable=False)
+    
+    # Rollup telemetrii wysyłki (percentyle latencji, koszt, oś czasu) - patrz sender.telemetry
+    delivery_stats = models.JSONField(default=dict, blank=True, editable=False)
+    
     def __str__(self):
         return f"{self.name} ({self.get_message_type_display()})"
+    
+    @property
+    def is_completed(self):
+        return self.status in self.FINISHED_STATUSES
+    
+    @property
+    def is_scheduled(self):
+        """Czy wysyłkę prowadzi scheduler zamiast natychmiastowej wysyłki z widoku"""
+        return bool(self.scheduled_at or self.send_window_start or self.spread_minutes)
+    
+    def clean(self):
+        if bool(self.send_window_start) != bool(self.send_window_end):
+            raise ValidationError('Okno wysyłki wymaga podania godziny początku i końca')
+        if self.send_window_start and self.send_window_start == self.send_window_end:
+            raise ValidationError('Początek i koniec okna wysyłki muszą się różnić')
+    
+    def transition_to(self, new_status, **fields):
+        """
+        Zmienia status kampanii, jeśli przejście jest dozwolone.
+        
+        Zapis to warunkowy UPDATE tylko kolumn statusu (compare-and-set), więc
+        dwie równoległe wysyłki nie przestawią tej samej kampanii dwa razy.
+        
+        Returns:
+            bool: czy przejście zostało wykonane
+        """
+        allowed_from = [status for status, targets in self.TRANSITIONS.items() if new_status in targets]
+        if self.status not in allowed_from:
+            return False
+        
+        updated = Campaign.objects.filter(pk=self.pk, status=self.status).update(status=new_status, **fields)
+        if not updated:
+            return False
+        
+        self.status = new_status
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return True
+
+
+class Contact(models.Model):
+    """
+    Adresat wspólny dla wszystkich kampanii: imię, nazwisko, email i telefon.
+    
+    Kontakt to niezmienna migawka danych z pliku: odbiorcy kolejnych importów
+    z tymi samymi danymi wskazują ten sam kontakt (sender.contacts), a inne
+    imię czy zapis numeru to nowy kontakt - import nigdy nie zmienia danych,
+    na które wysłano już wcześniejsze kampanie. Dane kontaktu są jedynym
+    źródłem tych pól - odbiorca trzyma tylko dane swojej kampanii.
+    """
+    # Para znormalizowanych kanałów "email|telefon E.164" (sender.contacts.contact_key) -
+    # po niej ponowny import dopasowuje wiersze do odbiorców
+    key = models.CharField(max_length=280, db_index=True)
+    # Skrót klucza i wszystkich pól (sender.contacts.contact_digest) - tożsamość migawki
+    digest = models.CharField(max_length=40, unique=True)
+    # Email i telefon w postaci z pliku - na nie idzie wysyłka
+    email = models.CharField(max_length=254, blank=True, null=True)
+    phone = models.CharField(max_length=20, blank=True, null=True)
+    first_name = models.CharField(max_length=50)
+    last_name = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['phone'], name='contact_phone_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.first_name} {self.last_name} ({self.key})"
 
 
 class Recipient(models.Model):
@@ -35,28 +146,62 @@ class Recipient(models.Model):
     
     uid = models.UUIDField(default=uuid.uuid4, primary_key=True)
     campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='recipients')
+    # Imię, nazwisko, email i telefon - w kontakcie (czytać z select_related('contact'))
+    contact = models.ForeignKey(Contact, on_delete=models.PROTECT, related_name='recipients')
+    # "Nazwisko Imię" kontaktu - klucz sortowania listy odbiorców (ustawiany razem z kontaktem)
+    sort_name = models.CharField(max_length=101, blank=True, default='')
     
-    # Podstawowe dane
-    first_name = models.CharField(max_length=50)
-    last_name = models.CharField(max_length=50)
-    email = models.EmailField(max_length=254, blank=True, null=True)
-    phone = models.CharField(max_length=20, blank=True, null=True)  # Zwiększone dla numerów międzynarodowych
-    
-    # Dodatkowe dane z Excela jako JSON
+    # Dodatkowe dane z Excela jako JSON - dane tej kampanii; klucz o nazwie pola
+    # kontaktu (np. first_name) nadpisuje w treści wartość z kontaktu
     extra_data = models.JSONField(default=dict, blank=True)
     
+    # Skrót znormalizowanej treści wiersza pliku - ponowny import zapisuje tylko zmienione wiersze
+    row_hash = models.CharField(max_length=40, blank=True, default='')
+    
     # Status wysyłki
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     sent_at = models.DateTimeField(null=True, blank=True)
     error_message = models.TextField(blank=True, null=True)
     
+    # Treść po podstawieniu zmiennych, wyrenderowana z góry (sender.rendering);
+    # aktualna, gdy rendered_digest zgadza się ze skrótem bieżącej treści kampanii
+    rendered_message = models.TextField(blank=True, null=True)
+    rendered_digest = models.CharField(max_length=40, blank=True, default='')
+    
     class Meta:
-        unique_together = ['campaign', 'email', 'phone']  # Zapobiega duplikatom w ramach kampanii
+        constraints = [
+            # Zapobiega duplikatom w ramach kampanii (kontakt to para email + telefon)
+            models.UniqueConstraint(fields=['campaign', 'contact'], name='recipient_campaign_contact_uniq'),
+        ]
+        indexes = [
+            # Statystyki i filtr statusu: WHERE campaign_id = ? AND status = ?
+            models.Index(fields=['campaign', 'status'], name='recipient_campaign_status_idx'),
+            # Sortowanie (i paginacja kursorowa) listy odbiorców na stronie statusu kampanii
+            models.Index(fields=['campaign', '-sent_at', 'sort_name', 'uid'], name='recipient_campaign_order_idx'),
+            # Eksport wyników po nazwisku i imieniu (sender.exports)
+            models.Index(fields=['campaign', 'sort_name', 'uid'], name='recipient_campaign_name_idx'),
+        ]
     
     def __str__(self):
         contact = self.email or self.phone or "Brak kontaktu"
         return f"{self.first_name} {self.last_name} ({contact})"
     
+    @property
+    def first_name(self):
+        return self.contact.first_name
+    
+    @property
+    def last_name(self):
+        return self.contact.last_name
+    
+    @property
+    def email(self):
+        return self.contact.email
+    
+    @property
+    def phone(self):
+        return self.contact.phone
+    
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
@@ -75,6 +220,59 @@ class Recipient(models.Model):
         return variables
 
 
+class MessageBody(models.Model):
+    """
+    Treść wysłanej wiadomości adresowana skrótem SHA-256.
+    
+    Ta sama treść (np. kampania bez personalizacji albo email i SMS dla jednego
+    odbiorcy) jest zapisywana tylko raz, a dłuższe treści są kompresowane zlib.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    compressed = models.BooleanField(default=False)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField()  # Rozmiar treści w bajtach przed kompresją
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.digest[:12]
+    
+    @property
+    def text(self):
+        data = bytes(self.data)
+        if self.compressed:
+            data = zlib.decompress(data)
+        return data.decode('utf-8')
+    
+    @classmethod
+    def store(cls, text):
+        """Zwraca istniejącą treść o tym samym skrócie albo zapisuje nową"""
+        raw = text.encode('utf-8')
+        digest = hashlib.sha256(raw).hexdigest()
+        
+        body = cls.objects.filter(digest=digest).first()
+        if body:
+            return body
+        
+        data, compressed = raw, False
+        if len(raw) >= getattr(settings, 'MESSAGE_BODY_COMPRESSION_THRESHOLD', 256):
+            packed = zlib.compress(raw, 6)
+            if len(packed) < len(raw):
+                data, compressed = packed, True
+        
+        try:
+            with transaction.atomic(using=router.db_for_write(cls)):
+                return cls.objects.create(digest=digest, compressed=compressed, data=data, size=len(raw))
+        except IntegrityError:
+            # Ktoś równolegle zapisał tę samą treść
+            return cls.objects.get(digest=digest)
+    
+    @classmethod
+    def purge_orphans(cls):
+        """Usuwa treści, do których nie odwołuje się już żaden log"""
+        deleted, _ = cls.objects.filter(logs__isnull=True).delete()
+        return deleted
+
+
 class MessageLog(models.Model):
     """Log szczegółowy dla każdej próby wysłania wiadomości"""
     MESSAGE_TYPES = [
@@ -86,8 +284,8 @@ class MessageLog(models.Model):
     recipient = models.ForeignKey(Recipient, on_delete=models.CASCADE, related_name='message_logs')
     message_type = models.CharField(max_length=5, choices=MESSAGE_TYPES)
     
-    # Treść wiadomości po podstawieniu zmiennych
-    final_message = models.TextField()
+    # Treść wiadomości po podstawieniu zmiennych (współdzielona między logami)
+    body = models.ForeignKey(MessageBody, on_delete=models.PROTECT, related_name='logs')
     
     # Status
     success = models.BooleanField()
@@ -97,30 +295,109 @@ class MessageLog(models.Model):
     # Metadata providera (np. message ID z SMS gateway)
     provider_response = models.JSONField(default=dict, blank=True)
     
+    class Meta:
+        indexes = [
+            # Logi odbiorcy w kolejności wysyłki
+            models.Index(fields=['recipient', 'sent_at'], name='messagelog_recipient_sent_idx'),
+        ]
+    
     def __str__(self):
         status = "✓" if self.success else "✗"
         return f"{status} {self.get_message_type_display()} → {self.recipient}"
+    
+    @property
+    def final_message(self):
+        return self.body.text
 
 
-# Pomocnicze modele dla konfiguracji providerów
+class MessageLogArchive(models.Model):
+    """Plik archiwum z logami wiadomości zakończonej kampanii (przeniesionymi z tabeli MessageLog)"""
+    FORMAT_CHOICES = [
+        ('jsonl', 'JSONL (gzip)'),
+        ('parquet', 'Parquet'),
+    ]
+    
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='log_archives')
+    path = models.CharField(max_length=500)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='jsonl')
+    log_count = models.PositiveIntegerField(default=0)
+    
+    # Opcjonalne podsumowanie logów (liczniki per typ, pierwsza/ostatnia wysyłka)
+    summary = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.campaign.name} - {self.log_count} logów ({self.get_format_display()})"
 
-class SMSProvider(models.Model):
-    """Konfiguracja providerów SMS"""
-    name = models.CharField(max_length=50)
-    class_name = models.CharField(max_length=100)  # np. 'providers.sms.TwilioSMS'
-    is_active = models.BooleanField(default=True)
-    config = models.JSONField(default=dict)  # API keys, URLs itp.
+
+class Suppression(models.Model):
+    """Globalna lista wykluczeń: adresy i numery, na które nie wysyłamy (rezygnacje, trwałe błędy)"""
+    KIND_CHOICES = [
+        ('email', 'Email'),
+        ('phone', 'Telefon'),
+    ]
+    REASON_CHOICES = [
+        ('unsubscribed', 'Rezygnacja'),
+        ('bounce', 'Trwały błąd doręczenia'),
+        ('manual', 'Dodane ręcznie'),
+    ]
+    
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES)
+    # Email małymi literami, telefon w formacie E.164 - patrz sender.suppression.normalize_*
+    value = models.CharField(max_length=254)
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, default='manual')
+    source = models.CharField(max_length=200, blank=True, default='')  # np. kampania lub plik importu
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'value'], name='suppression_kind_value_unique'),
+        ]
     
     def __str__(self):
-        return self.name
+        return f"{self.value} ({self.get_reason_display()})"
 
 
-class EmailProvider(models.Model):
-    """Konfiguracja providerów Email"""
+# Pomocnicze modele dla konfiguracji providerów
+
+class ProviderConfig(models.Model):
+    """Wspólna część konfiguracji providera: klasa z sender.services (lub pełna ścieżka) i jej config"""
     name = models.CharField(max_length=50)
-    class_name = models.CharField(max_length=100)  # np. 'providers.email.SMTPEmail'
+    class_name = models.CharField(max_length=100)
     is_active = models.BooleanField(default=True)
-    config = models.JSONField(default=dict)  # SMTP settings itp.
+    config = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)  # Zmiana przeładowuje providera w rejestrze
+    
+    class Meta:
+        abstract = True
     
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+    
+    def clean(self):
+        from .registry import resolve_provider_class
+        try:
+            resolve_provider_class(self.class_name)
+        except ImportError as e:
+            raise ValidationError({'class_name': f'Nie można zaimportować klasy: {e}'})
+        if not isinstance(self.config, dict):
+            raise ValidationError({'config': 'Konfiguracja musi być obiektem JSON'})
+        # Waga 0 wyłącza ruch do providera; limit czasu i progi obwodu muszą być dodatnie
+        for key, minimum in (('weight', 0), ('timeout', None), ('failure_threshold', 1), ('reset_timeout', None)):
+            if key not in self.config:
+                continue
+            value = self.config[key]
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValidationError({'config': f'Klucz "{key}" musi być liczbą'})
+            if minimum is None and value <= 0:
+                raise ValidationError({'config': f'Klucz "{key}" musi być dodatni'})
+            if minimum is not None and value < minimum:
+                raise ValidationError({'config': f'Klucz "{key}" musi być co najmniej {minimum}'})
+
+
+class SMSProvider(ProviderConfig):
+    """Konfiguracja providerów SMS - class_name np. 'providers.sms.TwilioSMS', config: API keys, URLs itp."""
+
+
+class EmailProvider(ProviderConfig):
+    """Konfiguracja providerów Email - class_name np. 'providers.email.SMTPEmail', config: SMTP settings itp."""
@@ -0,0 +1,144 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+
+class KeysetPage:
+    """Strona wyników paginacji kursorowej (bez COUNT i OFFSET)"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginacja kursorowa (keyset) po stałym kluczu sortowania.
+
+    Ostatnie pole w ``ordering`` musi być unikalne (np. klucz główny), żeby
+    kolejność była jednoznaczna. Koszt każdej strony jest taki sam niezależnie
+    od jej "głębokości", bo zapytanie zaczyna się od pozycji zapisanej w kursorze.
+    """
+
+    NEXT = 'n'
+    PREVIOUS = 'p'
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.fields = {name: queryset.model._meta.get_field(name) for name, _ in self.ordering}
+        self.nulls_largest = connections[queryset.db].features.nulls_order_largest
+
+    def get_page(self, cursor=None):
+        """Zwraca stronę dla kursora - nieprawidłowy kursor oznacza pierwszą stronę"""
+        position = self._decode(cursor) if cursor else None
+
+        if position is None:
+            direction, values = self.NEXT, None
+        else:
+            direction, values = position
+
+        reverse = direction == self.PREVIOUS
+        queryset = self.queryset.order_by(*self._order_by(reverse))
+        limit = self.per_page + 1
+
+        if values is None:
+            rows = list(queryset[:limit])
+        else:
+            # Kolejne segmenty leżą za kursorem w kolejności sortowania - czytamy
+            # je po kolei, aż zbierzemy pełną stronę
+            rows = []
+            for segment in self._segments(values, reverse):
+                rows.extend(queryset.filter(segment)[:limit - len(rows)])
+                if len(rows) >= limit:
+                    break
+
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        return KeysetPage(
+            rows,
+            next_cursor=self._encode(self.NEXT, rows[-1]) if rows and has_next else None,
+            previous_cursor=self._encode(self.PREVIOUS, rows[0]) if rows and has_previous else None,
+        )
+
+    def _order_by(self, reverse):
+        return [f"{'-' if descending != reverse else ''}{name}" for name, descending in self.ordering]
+
+    def _segments(self, values, reverse):
+        """
+        Rozkłada warunek 'wiersz leży za kursorem' na rozłączne segmenty w kolejności sortowania.
+
+        Każdy segment to równości na prefiksie klucza plus jeden zakres, więc baza
+        zawsze może zrobić seek po indeksie - zamiast jednego warunku z OR-ami,
+        który zmusza ją do przejścia indeksu od początku kampanii.
+        """
+        segments = []
+        for depth in range(len(self.ordering) - 1, -1, -1):
+            prefix = Q()
+            for (name, _), value in zip(self.ordering[:depth], values[:depth]):
+                prefix &= Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value})
+
+            name, descending = self.ordering[depth]
+            value = values[depth]
+            ascending = descending == reverse
+            # NULL-e są za wartościami gdy baza traktuje je jako największe i sortujemy rosnąco (lub odwrotnie)
+            nulls_after = self.nulls_largest == ascending
+
+            if value is None:
+                if not nulls_after:
+                    segments.append(prefix & Q(**{f'{name}__isnull': False}))
+            else:
+                segments.append(prefix & Q(**{f"{name}__{'gt' if ascending else 'lt'}": value}))
+                if nulls_after and self.fields[name].null:
+                    segments.append(prefix & Q(**{f'{name}__isnull': True}))
+        return segments
+
+    def _encode(self, direction, obj):
+        values = []
+        for name, _ in self.ordering:
+            value = getattr(obj, name)
+            values.append(None if value is None else self.fields[name].value_to_string(obj))
+        payload = json.dumps([direction, values], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+    def _decode(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, raw_values = json.loads(base64.urlsafe_b64decode(padded))
+            if direction not in (self.NEXT, self.PREVIOUS) or len(raw_values) != len(self.ordering):
+                return None
+            values = [
+                None if raw is None else self.fields[name].to_python(raw)
+                for (name, _), raw in zip(self.ordering, raw_values)
+            ]
+        except (ValueError, TypeError, binascii.Error, ValidationError):
+            return None
+        return direction, values
@@ -0,0 +1,202 @@
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+# Ile ostatnich żądań trzyma raport i ile najwolniejszych zapytań zapisujemy na żądanie
+PROFILER_HISTORY = getattr(settings, 'QUERY_PROFILER_HISTORY', 200)
+PROFILER_SLOWEST = getattr(settings, 'QUERY_PROFILER_SLOWEST', 5)
+
+# Te same zapytania (z dokładnością do parametrów) powtórzone tyle razy w żądaniu to podejrzenie N+1
+DUPLICATE_THRESHOLD = 5
+
+
+def is_enabled():
+    return getattr(settings, 'QUERY_PROFILER', False)
+
+
+def normalize_sql(sql):
+    """Zapytanie bez wartości parametrów - do wykrywania powtórzeń (N+1)"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\((?:\?, )+\?\)', '(...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+class QueryRecorder:
+    """Zbiera zapytania ze wszystkich połączeń (execute_wrapper działa też przy DEBUG=False)"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'seconds': time.perf_counter() - started,
+            })
+
+    @contextmanager
+    def record(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def db_seconds(self):
+        return sum(query['seconds'] for query in self.queries)
+
+    def slowest(self, limit=PROFILER_SLOWEST):
+        return sorted(self.queries, key=lambda query: query['seconds'], reverse=True)[:limit]
+
+    def duplicates(self, threshold=DUPLICATE_THRESHOLD):
+        counts = Counter(normalize_sql(query['sql']) for query in self.queries)
+        return [(sql, count) for sql, count in counts.most_common() if count >= threshold]
+
+
+class ProfileReport:
+    """Ostatnie profile żądań w pamięci procesu (każdy worker ma własny raport)"""
+
+    def __init__(self, maxlen=PROFILER_HISTORY):
+        self.entries = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def add(self, entry):
+        with self._lock:
+            self.entries.appendleft(entry)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.entries)
+
+    def by_view(self):
+        """Zestawienie per widok: liczba żądań, średnia i maksymalna liczba zapytań, czas bazy"""
+        views = {}
+        for entry in self.snapshot():
+            stats = views.setdefault(entry['view'], {'view': entry['view'], 'requests': 0, 'queries': 0,
+                                                     'max_queries': 0, 'db_ms': 0.0, 'total_ms': 0.0})
+            stats['requests'] += 1
+            stats['queries'] += entry['queries']
+            stats['max_queries'] = max(stats['max_queries'], entry['queries'])
+            stats['db_ms'] += entry['db_ms']
+            stats['total_ms'] += entry['total_ms']
+
+        for stats in views.values():
+            stats['avg_queries'] = round(stats['queries'] / stats['requests'], 1)
+            stats['avg_db_ms'] = round(stats['db_ms'] / stats['requests'], 2)
+            stats['avg_total_ms'] = round(stats['total_ms'] / stats['requests'], 2)
+        return sorted(views.values(), key=lambda stats: stats['avg_queries'], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+
+report = ProfileReport()
+
+
+class QueryProfilerMiddleware:
+    """
+    Profil zapytań SQL każdego żądania (włączany ustawieniem QUERY_PROFILER).
+
+    Dodaje nagłówki Server-Timing (db, app) i X-Query-Count oraz zapisuje
+    liczbę zapytań, czas bazy, najwolniejsze i powtarzające się zapytania
+    do raportu w pamięci (widok query_profile).
+    """
+
+    def __init__(self, get_response):
+        if not is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with recorder.record():
+            response = self.get_response(request)
+        total_seconds = time.perf_counter() - started
+
+        db_ms = recorder.db_seconds * 1000
+        total_ms = total_seconds * 1000
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={db_ms:.2f};desc="{recorder.count} queries"',
+            f'app;dur={max(total_ms - db_ms, 0):.2f}',
+            f'total;dur={total_ms:.2f}',
+        ])
+        response['X-Query-Count'] = str(recorder.count)
+
+        match = getattr(request, 'resolver_match', None)
+        report.add({
+            'at': timezone.now(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': match.view_name if match else request.path,
+            'status': response.status_code,
+            # Treść odpowiedzi strumieniowej (np. eksport) czyta bazę już po wyjściu z middleware
+            'streaming': response.streaming,
+            'queries': recorder.count,
+            'db_ms': round(db_ms, 2),
+            'total_ms': round(total_ms, 2),
+            'slowest': [
+                {'alias': query['alias'], 'sql': query['sql'], 'ms': round(query['seconds'] * 1000, 2)}
+                for query in recorder.slowest()
+            ],
+            'duplicates': recorder.duplicates(),
+        })
+        return response
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def assert_max_queries(max_queries, label=''):
+    """
+    Pomocnik do testów: blok nie może wykonać więcej niż max_queries zapytań.
+
+    Przykład:
+        with assert_max_queries(8, 'campaign_status'):
+            client.get(reverse('campaign_status', args=[campaign.uid]))
+    """
+    recorder = QueryRecorder()
+    with recorder.record():
+        yield recorder
+
+    if recorder.count > max_queries:
+        lines = [f'{label or "Blok"}: {recorder.count} zapytań przy budżecie {max_queries}']
+        for sql, count in recorder.duplicates(threshold=2):
+            lines.append(f'  {count}x {sql}')
+        raise QueryBudgetExceeded('\n'.join(lines))
+
+
+def assert_view_query_budgets(client, budgets):
+    """
+    Sprawdza budżety zapytań widoków: {url: max_queries}.
+
+    Zgłasza QueryBudgetExceeded ze wszystkimi przekroczeniami naraz.
+    """
+    failures = []
+    for url, max_queries in budgets.items():
+        try:
+            with assert_max_queries(max_queries, url):
+                client.get(url)
+        except QueryBudgetExceeded as e:
+            failures.append(str(e))
+    if failures:
+        raise QueryBudgetExceeded('\n'.join(failures))
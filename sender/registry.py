@@ -0,0 +1,147 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .balancing import PooledProvider, ProviderPool
+from .models import SMSProvider, EmailProvider
+
+logger = logging.getLogger(__name__)
+
+# Krótkie nazwy klas (bez kropki) są szukane w sender.services
+DEFAULT_PROVIDER_MODULE = 'sender.services'
+
+# Klucze config obsługiwane przez ProviderPool: waga ruchu, limit czasu wywołania (s),
+# liczba kolejnych błędów otwierająca obwód i czas do próby zamknięcia (s)
+POOL_OPTIONS = ('weight', 'timeout', 'failure_threshold', 'reset_timeout')
+
+
+def resolve_provider_class(class_name):
+    """Importuje klasę providera po pełnej ścieżce albo krótkiej nazwie z sender.services"""
+    if '.' not in class_name:
+        class_name = f'{DEFAULT_PROVIDER_MODULE}.{class_name}'
+    return import_string(class_name)
+
+
+class ProviderRegistry:
+    """
+    Cache instancji providerów na cały proces.
+
+    Instancje są budowane z modeli SMSProvider / EmailProvider (class_name + config)
+    i używane ponownie przez kolejne kampanie, więc klienci API i ich sesje HTTP
+    nie są tworzeni od nowa przy każdej wysyłce. Zmiana w adminie (zapis lub
+    usunięcie providera) zmienia odcisk konfiguracji i wymusza przeładowanie -
+    także w innych procesach, bo odcisk jest sprawdzany w bazie przy każdym pobraniu.
+    """
+
+    MODELS = {'sms': SMSProvider, 'email': EmailProvider}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fingerprints = {}
+        self._providers = {}
+        self._fallbacks = {}
+        self._pools = {}
+
+    def get_providers(self, kind):
+        """
+        Zwraca listę aktywnych providerów danego typu.
+
+        Returns:
+            list: [(konfiguracja: SMSProvider/EmailProvider, instancja providera), ...]
+        """
+        model = self.MODELS[kind]
+        fingerprint = tuple(
+            model.objects.filter(is_active=True).order_by('pk').values_list('pk', 'updated_at')
+        )
+        if self._fingerprints.get(kind) == fingerprint:
+            return self._providers[kind]
+
+        with self._lock:
+            if self._fingerprints.get(kind) != fingerprint:
+                self._providers[kind] = self._build(model)
+                self._fingerprints[kind] = fingerprint
+            return self._providers[kind]
+
+    def _build(self, model):
+        providers = []
+        for config in model.objects.filter(is_active=True).order_by('pk'):
+            # Klucze puli (waga, limity) nie trafiają do konstruktora providera
+            options = {key: value for key, value in config.config.items() if key not in POOL_OPTIONS}
+            try:
+                provider_class = resolve_provider_class(config.class_name)
+                providers.append((config, provider_class(**options)))
+                logger.info(f"Loaded {config._meta.verbose_name} '{config.name}' ({config.class_name})")
+            except Exception as e:
+                # Błędna konfiguracja jednego providera nie blokuje pozostałych
+                logger.error(f"Failed to load provider '{config.name}' ({config.class_name}): {str(e)}")
+        return providers
+
+    def get_pool(self, kind):
+        """
+        Pula aktywnych providerów z bazy do rozkładania ruchu i failoveru.
+
+        Pula (razem ze statystykami kondycji) jest budowana raz na wersję
+        konfiguracji. Bez providerów w bazie zawiera jeden provider wybrany
+        na podstawie settings.
+        """
+        providers = self.get_providers(kind)
+        fallback = None if providers else self._get_fallback(kind)
+        cached = self._pools.get(kind)
+        if cached is not None and cached[0] is providers and cached[1] is fallback:
+            return cached[2]
+
+        with self._lock:
+            if providers:
+                members = [
+                    PooledProvider(
+                        config.name,
+                        provider,
+                        weight=config.config.get('weight', 1),
+                        timeout=config.config.get('timeout'),
+                        failure_threshold=config.config.get('failure_threshold'),
+                        reset_timeout=config.config.get('reset_timeout'),
+                    )
+                    for config, provider in providers
+                ]
+            else:
+                members = [PooledProvider(type(fallback).__name__, fallback)]
+            pool = ProviderPool(members)
+            self._pools[kind] = (providers, fallback, pool)
+            return pool
+
+    def _get_fallback(self, kind):
+        # Dotychczasowe zachowanie: wybór na podstawie settings, gdy w bazie nie ma providerów
+        from .services import SMSAPIProvider, MockSMSProvider, DjangoEmailProvider, MockEmailProvider
+
+        # Mocki przyjmują config symulacji z settings (MOCK_SMS_PROVIDER / MOCK_EMAIL_PROVIDER)
+        if kind == 'sms':
+            token = getattr(settings, 'SMSAPI_TOKEN', None)
+            factory = SMSAPIProvider if token else MockSMSProvider
+            options = {} if token else getattr(settings, 'MOCK_SMS_PROVIDER', {})
+            key = ('sms', token, repr(options))
+        else:
+            backend = getattr(settings, 'EMAIL_BACKEND', '')
+            factory = MockEmailProvider if 'console' in backend else DjangoEmailProvider
+            options = getattr(settings, 'MOCK_EMAIL_PROVIDER', {}) if 'console' in backend else {}
+            key = ('email', backend, repr(options))
+
+        if key not in self._fallbacks:
+            logger.info(f"Using {factory.__name__} for {kind} (no active providers configured)")
+            self._fallbacks[key] = factory(**options)
+        return self._fallbacks[key]
+
+    def pools(self):
+        """Zbudowane do tej pory pule (bez zapytań do bazy) - np. dla metryk"""
+        return [pool for _, _, pool in list(self._pools.values())]
+
+    def clear(self):
+        with self._lock:
+            self._fingerprints.clear()
+            self._providers.clear()
+            self._fallbacks.clear()
+            self._pools.clear()
+
+
+registry = ProviderRegistry()
@@ -0,0 +1,213 @@
+import datetime
+import hashlib
+import logging
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .models import Campaign, Recipient
+from .segmentation import is_estimate_current, refresh_campaign_estimate
+
+logger = logging.getLogger(__name__)
+
+# Ilu odbiorców renderować i zapisywać jednym bulk_update
+RENDER_BATCH_SIZE = getattr(settings, 'RENDER_BATCH_SIZE', 1000)
+
+# Po ilu sekundach renderowanie w toku (render_summary "pending") uznać za przerwane
+RENDER_STALE_SECONDS = getattr(settings, 'RENDER_STALE_SECONDS', 300)
+
+_PLACEHOLDER_PATTERN = re.compile(r'\{\{(.+?)\}\}')
+
+# Jeden wątek w tle - ponowne renderowanie po edycji nie blokuje żądania,
+# a kolejne edycje tej samej kampanii wykonują się po kolei
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='render')
+
+
+def render_message(template, variables):
+    """Podstawia zmienne {{nazwa}} w treści wiadomości (puste wartości zostają jako znacznik)"""
+    message = template
+    for var_name, var_value in variables.items():
+        if var_value:
+            message = message.replace(f'{{{{{var_name}}}}}', str(var_value))
+    return message
+
+
+def content_digest(content):
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def missing_variables(message):
+    """Znaczniki, które zostały w treści po podstawieniu (brak wartości u odbiorcy)"""
+    return _PLACEHOLDER_PATTERN.findall(message)
+
+
+def get_message(recipient, campaign, digest=None):
+    """Wyrenderowana treść odbiorcy - z bazy, a gdy jest nieaktualna, liczona na bieżąco"""
+    digest = digest or content_digest(campaign.message_content)
+    if recipient.rendered_digest == digest and recipient.rendered_message is not None:
+        return recipient.rendered_message
+    return render_message(campaign.message_content, recipient.get_message_variables())
+
+
+def is_rendered(campaign):
+    return campaign.render_summary.get('digest') == content_digest(campaign.message_content)
+
+
+def render_campaign(campaign):
+    """
+    Renderuje i zapisuje treść wszystkich odbiorców kampanii (bulk_update porcjami).
+
+    Przerywa, gdy w międzyczasie zmieniła się treść kampanii - nowszą wersję
+    wyrenderuje kolejne zadanie. Na koniec zapisuje podsumowanie w render_summary.
+
+    Returns:
+        dict or None: podsumowanie albo None, gdy renderowanie przerwano
+    """
+    content = campaign.message_content
+    digest = content_digest(content)
+    rendered = 0
+    recipients_missing = 0
+    missing = Counter()
+
+    recipients = campaign.recipients.select_related('contact').only(
+        'uid', 'contact', 'extra_data',
+        'contact__first_name', 'contact__last_name', 'contact__email', 'contact__phone',
+    ).order_by('uid')
+    batch = []
+    for recipient in recipients.iterator(chunk_size=RENDER_BATCH_SIZE):
+        recipient.rendered_message = render_message(content, recipient.get_message_variables())
+        recipient.rendered_digest = digest
+        recipient_missing = set(missing_variables(recipient.rendered_message))
+        if recipient_missing:
+            recipients_missing += 1
+            missing.update(recipient_missing)
+        batch.append(recipient)
+        if len(batch) >= RENDER_BATCH_SIZE:
+            if not _still_current(campaign, content):
+                return None
+            Recipient.objects.bulk_update(batch, ['rendered_message', 'rendered_digest'])
+            rendered += len(batch)
+            batch = []
+    if batch:
+        Recipient.objects.bulk_update(batch, ['rendered_message', 'rendered_digest'])
+        rendered += len(batch)
+
+    summary = {
+        'digest': digest,
+        'rendered': rendered,
+        # Zmienna → liczba odbiorców bez wartości
+        'missing': dict(missing.most_common()),
+        'recipients_missing': recipients_missing,
+        'finished_at': timezone.now().isoformat(),
+    }
+
+    # Zapis tylko, jeśli treść się nie zmieniła (inaczej podsumowanie dotyczyłoby starej wersji)
+    if not Campaign.objects.filter(pk=campaign.pk, message_content=content).update(render_summary=summary):
+        return None
+    campaign.render_summary = summary
+    logger.info(f"Rendered {rendered} messages of campaign {campaign.uid}")
+    return summary
+
+
+def _still_current(campaign, content):
+    return Campaign.objects.filter(pk=campaign.pk, message_content=content).exists()
+
+
+def _render_in_background(campaign_uid):
+    try:
+        campaign = Campaign.objects.filter(uid=campaign_uid).first()
+        if campaign and not is_rendered(campaign):
+            render_campaign(campaign)
+        # Nowa treść albo nowa lista odbiorców - szacunek SMS liczony tu, a nie przy wyświetlaniu
+        if campaign:
+            refresh_campaign_estimate(campaign)
+    except Exception as e:
+        logger.error(f"Error rendering campaign {campaign_uid}: {str(e)}")
+    finally:
+        # Wątek roboczy ma własne połączenia - nie zostawiaj ich otwartych
+        connections.close_all()
+
+
+def _estimate_in_background(campaign_uid):
+    try:
+        campaign = Campaign.objects.filter(uid=campaign_uid).first()
+        if campaign:
+            refresh_campaign_estimate(campaign)
+    except Exception as e:
+        logger.error(f"Error estimating campaign {campaign_uid}: {str(e)}")
+    finally:
+        connections.close_all()
+
+
+def _pending_summary():
+    return {'status': 'pending', 'since': timezone.now().isoformat()}
+
+
+def schedule_render(campaign):
+    """Ponowne renderowanie w tle, po zatwierdzeniu bieżącej transakcji (np. po edycji treści)"""
+    campaign.render_summary = _pending_summary()
+    Campaign.objects.filter(pk=campaign.pk).update(render_summary=campaign.render_summary)
+    # Transakcja zapisu odbiorców jest na aliasie zapisu - na nim czekamy na commit
+    transaction.on_commit(
+        lambda: _executor.submit(_render_in_background, campaign.uid), using=router.db_for_write(Recipient)
+    )
+
+
+def schedule_estimate(campaign):
+    """
+    Przeliczenie szacunku SMS w tle po zatwierdzeniu transakcji - gdy treść się nie
+    zmieniła, ale zmieniła się transliteracja, typ kampanii albo odbiorcy (np. w adminie)
+    """
+    transaction.on_commit(
+        lambda: _executor.submit(_estimate_in_background, campaign.uid), using=router.db_for_write(Campaign)
+    )
+
+
+def _render_in_progress(campaign):
+    """Czy renderowanie zlecone przez schedule_render (albo inny przebieg) jeszcze trwa"""
+    summary = campaign.render_summary
+    if summary.get('status') != 'pending' or not summary.get('since'):
+        return False
+    since = datetime.datetime.fromisoformat(summary['since'])
+    return timezone.now() - since < datetime.timedelta(seconds=RENDER_STALE_SECONDS)
+
+
+def claim_render(campaign):
+    """
+    Przejmuje renderowanie kampanii (compare-and-set na render_summary).
+
+    Zapis udaje się tylko, gdy podsumowanie jest takie, jak przy odczycie -
+    jeśli w międzyczasie renderowanie zlecił ktoś inny, kampania zostaje jemu.
+    """
+    summary = _pending_summary()
+    if not Campaign.objects.filter(pk=campaign.pk, render_summary=campaign.render_summary).update(
+        render_summary=summary,
+    ):
+        return False
+    campaign.render_summary = summary
+    return True
+
+
+def render_stale_campaigns():
+    """
+    Renderuje kampanie z nieaktualną treścią odbiorców (np. gdy proces padł w trakcie
+    renderowania) i przelicza nieaktualne szacunki SMS.
+
+    Kampanie renderowane właśnie w tle (świeże "pending") są pomijane, a pozostałe
+    przejmowane przez claim_render - dwa schedulery nie renderują tej samej kampanii.
+    """
+    rendered = []
+    campaigns = Campaign.objects.exclude(status__in=Campaign.FINISHED_STATUSES).only(
+        'uid', 'message_type', 'message_content', 'sms_transliterate', 'render_summary', 'sms_estimate',
+    )
+    for campaign in campaigns:
+        if not is_rendered(campaign) and not _render_in_progress(campaign) and claim_render(campaign):
+            if render_campaign(campaign):
+                rendered.append(campaign.uid)
+        if not is_estimate_current(campaign):
+            refresh_campaign_estimate(campaign)
+    return rendered
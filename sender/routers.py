@@ -0,0 +1,27 @@
+from django.db import connections
+
+
+class WriterRouter:
+    """
+    Kieruje zapisy na osobne połączenie 'writer', odczyty na 'default'.
+
+    Obie nazwy wskazują ten sam plik SQLite - różnią się trybem transakcji
+    (IMMEDIATE dla zapisu), więc odczyty nigdy nie czekają na blokadę zapisu.
+    Transakcje zapisu otwiera się na aliasie zapisu:
+    transaction.atomic(using=router.db_for_write(Model)); odczyty wewnątrz
+    takiej transakcji idą tym samym połączeniem i widzą jej niezatwierdzone zmiany.
+    """
+
+    def db_for_read(self, model, **hints):
+        if connections['writer'].in_atomic_block:
+            return 'writer'
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'writer'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
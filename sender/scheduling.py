@@ -0,0 +1,117 @@
+import logging
+import math
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .dispatch import dispatch_recipients, finish_sending
+from .models import Campaign
+
+logger = logging.getLogger(__name__)
+
+# Ilu odbiorców jednej kampanii scheduler wypuszcza najwyżej w jednym przebiegu -
+# po przerwie (np. wstrzymaniu przez circuit breaker) zaległości wychodzą porcjami, a nie naraz
+SCHEDULER_BATCH_SIZE = getattr(settings, 'CAMPAIGN_SCHEDULER_BATCH_SIZE', 200)
+
+
+def get_campaign_timezone():
+    """Strefa, w której interpretowane jest okno wysyłki (godziny odbiorców, nie serwera)"""
+    return ZoneInfo(getattr(settings, 'CAMPAIGN_TIMEZONE', 'Europe/Warsaw'))
+
+
+def _window_intervals(campaign, start, end):
+    """Przedziały okna wysyłki (aware datetime) nachodzące na [start, end]"""
+    tz = get_campaign_timezone()
+    window_start, window_end = campaign.send_window_start, campaign.send_window_end
+
+    day = start.astimezone(tz).date() - timedelta(days=1)
+    last_day = end.astimezone(tz).date()
+    while day <= last_day:
+        opens = datetime.combine(day, window_start, tzinfo=tz)
+        # Okno przez północ (np. 22:00-6:00) kończy się następnego dnia
+        closes_day = day + timedelta(days=1) if window_end <= window_start else day
+        closes = datetime.combine(closes_day, window_end, tzinfo=tz)
+        if opens < end and closes > start:
+            yield max(opens, start), min(closes, end)
+        day += timedelta(days=1)
+
+
+def is_in_window(campaign, now):
+    if not campaign.send_window_start:
+        return True
+    return any(True for _ in _window_intervals(campaign, now, now + timedelta(microseconds=1)))
+
+
+def active_seconds(campaign, start, end):
+    """Liczba sekund między start a end, w których wysyłka była dozwolona"""
+    if end <= start:
+        return 0.0
+    if not campaign.send_window_start:
+        return (end - start).total_seconds()
+    return sum((closes - opens).total_seconds() for opens, closes in _window_intervals(campaign, start, end))
+
+
+def release_quota(campaign, now, total):
+    """
+    Ilu odbiorców kampanii powinno być już obsłużonych w chwili now.
+
+    Bez rozłożenia - wszyscy (w oknie). Z rozłożeniem - proporcjonalnie do czasu
+    wysyłki, który upłynął od scheduled_at, liczonego tylko w oknie, więc
+    spread_minutes to czas aktywnej wysyłki, a nie czas zegarowy.
+    """
+    if not campaign.spread_minutes:
+        return total
+    fraction = active_seconds(campaign, campaign.scheduled_at, now) / (campaign.spread_minutes * 60)
+    return min(total, math.ceil(total * fraction))
+
+
+def run_scheduler_tick(sender, now=None, batch_size=None):
+    """
+    Jeden przebieg schedulera: wypuszcza należną porcję odbiorców każdej zaplanowanej kampanii.
+
+    Returns:
+        dict: {uid kampanii: results} dla kampanii, do których coś wysłano
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or SCHEDULER_BATCH_SIZE
+    released = {}
+
+    due = Campaign.objects.filter(status='queued', scheduled_at__lte=now).order_by('scheduled_at')
+    for campaign in due:
+        if not is_in_window(campaign, now):
+            continue
+
+        counts = campaign.recipients.aggregate(
+            total=Count('pk'),
+            pending=Count('pk', filter=Q(status='pending')),
+        )
+        processed = counts['total'] - counts['pending']
+        to_release = min(release_quota(campaign, now, counts['total']) - processed, batch_size)
+        if to_release <= 0 and counts['pending']:
+            continue
+
+        # queued → sending; nie uda się, jeśli kampanię równolegle wysyła inny proces
+        if not campaign.transition_to('sending'):
+            continue
+        try:
+            recipients = campaign.recipients.filter(status='pending').select_related('contact').order_by(
+                'uid'
+            )[:max(to_release, 0)]
+            results, paused = dispatch_recipients(campaign, recipients, sender)
+        finally:
+            finish_sending(campaign)
+
+        released[campaign.uid] = results
+        logger.info(
+            f"Scheduler released {results['sent'] + results['failed']} recipients of campaign {campaign.uid} "
+            f"({processed + results['sent'] + results['failed']}/{counts['total']})"
+        )
+        if paused:
+            # Providerzy niedostępni - pozostałe kampanie i tak by się zatrzymały
+            logger.warning(f"Scheduler tick stopped: {paused}")
+            break
+
+    return released
@@ -0,0 +1,78 @@
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.text import smart_split, unescape_string_literal
+
+
+# Indeks kontaktów (rowid = id kontaktu) - dane odbiorców są w kontaktach
+FTS_TABLE = 'sender_contact_fts'
+SEARCH_FIELDS = ['first_name', 'last_name', 'email', 'phone']
+
+# Tokenizer trigramowy nie dopasowuje fraz krótszych niż 3 znaki
+FTS_MIN_TERM_LENGTH = 3
+
+
+def split_terms(query):
+    """Dzieli zapytanie na słowa (z obsługą cudzysłowów) tak jak wyszukiwarka w adminie"""
+    terms = []
+    for bit in smart_split(query):
+        if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+            bit = unescape_string_literal(bit)
+        bit = bit.strip()
+        if bit:
+            terms.append(bit)
+    return terms
+
+
+def _icontains(term):
+    condition = Q()
+    for field in SEARCH_FIELDS:
+        condition |= Q(**{f'contact__{field}__icontains': term})
+    return condition
+
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search_recipients(queryset, query):
+    """
+    Filtruje odbiorców po imieniu, nazwisku, emailu i telefonie ich kontaktu.
+
+    Każde słowo musi wystąpić w którymś z pól. Na SQLite słowa są szukane
+    w indeksie FTS5 kontaktów (trigramy), na PostgreSQL icontains korzysta
+    z indeksów pg_trgm z migracji, na pozostałych bazach zostaje zwykłe icontains.
+    """
+    terms = split_terms(query)
+    if not terms:
+        return queryset
+
+    if connections[queryset.db].vendor == 'sqlite':
+        indexed = [term for term in terms if len(term) >= FTS_MIN_TERM_LENGTH]
+        if indexed:
+            match = ' AND '.join(_fts_phrase(term) for term in indexed)
+            queryset = queryset.filter(
+                contact_id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+            )
+        terms = [term for term in terms if len(term) < FTS_MIN_TERM_LENGTH]
+
+    for term in terms:
+        queryset = queryset.filter(_icontains(term))
+    return queryset
+
+
+def rebuild_search_index(using='default'):
+    """Przebudowuje indeks FTS od zera (np. po VACUUM albo przy podejrzeniu rozjazdu z tabelą kontaktów)"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return 0
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, first_name, last_name, email, phone) '
+            'SELECT id, first_name, last_name, email, phone FROM sender_contact'
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
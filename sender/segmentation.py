@@ -0,0 +1,230 @@
+import hashlib
+import re
+
+from django.conf import settings
+
+from .spreadsheets import pandas
+
+# Alfabet GSM 03.38: znaki podstawowe (1 septet) i rozszerzenia (znak ucieczki + znak = 2 septety)
+GSM7_BASIC = (
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_EXTENDED = "^{}\\[~]|€\f"
+
+# Limity jednej wiadomości i części wiadomości łączonej (nagłówek UDH zabiera miejsce)
+SEGMENT_LIMITS = {
+    'gsm7': (160, 153),
+    'ucs2': (70, 67),
+}
+
+# Koszt jednej części SMS w punktach SMSAPI - zależy od cennika konta
+POINTS_PER_SEGMENT = getattr(settings, 'SMS_POINTS_PER_SEGMENT', 0.16)
+
+# Transliteracja: polskie znaki i typografia, które bez tego wymuszają UCS-2
+TRANSLITERATION = str.maketrans({
+    'ą': 'a', 'ć': 'c', 'ę': 'e', 'ł': 'l', 'ń': 'n', 'ó': 'o', 'ś': 's', 'ź': 'z', 'ż': 'z',
+    'Ą': 'A', 'Ć': 'C', 'Ę': 'E', 'Ł': 'L', 'Ń': 'N', 'Ó': 'O', 'Ś': 'S', 'Ź': 'Z', 'Ż': 'Z',
+    '„': '"', '”': '"', '“': '"', '‘': "'", '’': "'", '‚': "'",
+    '–': '-', '—': '-', '…': '...', '\u00a0': ' ', '\t': ' ',
+})
+
+_GSM7_PATTERN = '[' + re.escape(GSM7_BASIC + GSM7_EXTENDED) + ']*'
+_GSM7_EXTENDED_PATTERN = '[' + re.escape(GSM7_EXTENDED) + ']'
+# Znaki spoza BMP (np. emoji) zajmują w UCS-2/UTF-16 dwie jednostki
+_ASTRAL_PATTERN = '[\U00010000-\U0010ffff]'
+_VARIABLE_PATTERN = re.compile(r'\{\{(.+?)\}\}')
+
+_GSM7_CHARS = frozenset(GSM7_BASIC + GSM7_EXTENDED)
+_GSM7_EXTENDED_CHARS = frozenset(GSM7_EXTENDED)
+
+
+def transliterate(text):
+    return text.translate(TRANSLITERATION)
+
+
+def segment_count(encoding, units):
+    single, multipart = SEGMENT_LIMITS[encoding]
+    if units <= single:
+        return 1
+    return -(-units // multipart)
+
+
+def analyze_message(text):
+    """
+    Kodowanie i liczba części jednej wiadomości.
+
+    Returns:
+        dict: encoding ('gsm7' / 'ucs2'), units (septety albo jednostki UTF-16), segments
+    """
+    if all(char in _GSM7_CHARS for char in text):
+        encoding = 'gsm7'
+        units = len(text) + sum(1 for char in text if char in _GSM7_EXTENDED_CHARS)
+    else:
+        encoding = 'ucs2'
+        units = len(text.encode('utf-16-le')) // 2
+    return {'encoding': encoding, 'units': units, 'segments': segment_count(encoding, units)}
+
+
+def _piece_stats(values):
+    """Dla serii tekstów: czy mieszczą się w GSM-7, długość w septetach i w jednostkach UTF-16"""
+    length = values.str.len()
+    return (
+        values.str.fullmatch(_GSM7_PATTERN),
+        length + values.str.count(_GSM7_EXTENDED_PATTERN),
+        length + values.str.count(_ASTRAL_PATTERN),
+    )
+
+
+def estimate_segments(template, frame, transliterate_text=False):
+    """
+    Wektorowo liczy kodowanie i części SMS dla każdego odbiorcy bez renderowania treści.
+
+    Szablon dzielony jest na stały tekst i zmienne {{nazwa}}; statystyki stałych
+    fragmentów liczone są raz, a zmiennych - operacjami na kolumnach frame.
+    Jak render_message, pusta wartość zmiennej zostawia znacznik {{nazwa}}.
+
+    Args:
+        frame: DataFrame z kolumną na każdą zmienną szablonu (brak kolumny = znacznik zostaje)
+
+    Returns:
+        DataFrame: encoding, units, segments (indeks jak frame)
+    """
+    pd = pandas()
+    index = frame.index
+    is_gsm = pd.Series(True, index=index)
+    septets = pd.Series(0, index=index)
+    utf16 = pd.Series(0, index=index)
+
+    position = 0
+    pieces = []
+    for match in _VARIABLE_PATTERN.finditer(template):
+        pieces.append(('text', template[position:match.start()]))
+        pieces.append(('variable', match.group(1)))
+        position = match.end()
+    pieces.append(('text', template[position:]))
+
+    for kind, value in pieces:
+        if kind == 'variable':
+            placeholder = f'{{{{{value}}}}}'
+            column = frame[value] if value in frame else pd.Series(None, index=index, dtype=object)
+            values = column.where(column.notna() & (column.astype(str) != ''), placeholder).astype(str)
+        else:
+            if not value:
+                continue
+            values = pd.Series(value, index=index)
+        if transliterate_text:
+            values = values.str.translate(TRANSLITERATION)
+        piece_gsm, piece_septets, piece_utf16 = _piece_stats(values)
+        is_gsm &= piece_gsm
+        septets += piece_septets
+        utf16 += piece_utf16
+
+    units = septets.where(is_gsm, utf16)
+    single = is_gsm.map({True: SEGMENT_LIMITS['gsm7'][0], False: SEGMENT_LIMITS['ucs2'][0]})
+    multipart = is_gsm.map({True: SEGMENT_LIMITS['gsm7'][1], False: SEGMENT_LIMITS['ucs2'][1]})
+    segments = (-(-units // multipart)).where(units > single, 1)
+
+    return pd.DataFrame({
+        'encoding': is_gsm.map({True: 'gsm7', False: 'ucs2'}),
+        'units': units,
+        'segments': segments,
+    }, index=index)
+
+
+def non_gsm_characters(text, limit=10):
+    """Znaki tekstu spoza GSM-7 (np. do podpowiedzi, co wymusza UCS-2)"""
+    found = []
+    for char in text:
+        if char not in _GSM7_CHARS and char not in found:
+            found.append(char)
+    return found[:limit]
+
+
+def _estimate_key(campaign):
+    payload = f'{campaign.message_content}\x00{campaign.sms_transliterate}\x00{POINTS_PER_SEGMENT}'
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _recipients_frame(campaign, variables):
+    """Kolumny zmiennych szablonu dla odbiorców kampanii z numerem telefonu"""
+    pd = pandas()
+    rows = campaign.recipients.exclude(contact__phone__isnull=True).exclude(contact__phone='').values_list(
+        'contact__first_name', 'contact__last_name', 'contact__email', 'contact__phone', 'extra_data',
+    )
+    first_names, last_names, emails, phones, extra = zip(*rows) if rows else ((), (), (), (), ())
+    frame = pd.DataFrame({
+        'first_name': first_names,
+        'last_name': last_names,
+        'email': emails,
+        'phone': phones,
+    }, dtype=object)
+    frame['full_name'] = frame['first_name'].astype(str) + ' ' + frame['last_name'].astype(str)
+    for name in variables - set(frame.columns):
+        frame[name] = [data.get(name) if data else None for data in extra]
+    return frame
+
+
+def estimate_campaign(campaign):
+    """
+    Szacunek SMS kampanii przed wysyłką: kodowanie, części i koszt w punktach.
+
+    Zawsze liczony też wariant z transliteracją - żeby pokazać, ile by oszczędziła.
+    """
+    variables = set(_VARIABLE_PATTERN.findall(campaign.message_content))
+    frame = _recipients_frame(campaign, variables)
+
+    def totals(result):
+        segments = int(result['segments'].sum())
+        return {
+            'gsm7': int((result['encoding'] == 'gsm7').sum()),
+            'ucs2': int((result['encoding'] == 'ucs2').sum()),
+            'segments': segments,
+            'max_segments': int(result['segments'].max()) if len(result) else 0,
+            'points': round(segments * POINTS_PER_SEGMENT, 2),
+        }
+
+    estimate = {
+        'key': _estimate_key(campaign),
+        'recipients': len(frame),
+        'transliterate': campaign.sms_transliterate,
+        'points_per_segment': POINTS_PER_SEGMENT,
+        'non_gsm_characters': non_gsm_characters(campaign.message_content),
+        **totals(estimate_segments(campaign.message_content, frame, campaign.sms_transliterate)),
+    }
+    if not campaign.sms_transliterate:
+        estimate['transliterated'] = totals(estimate_segments(campaign.message_content, frame, True))
+    return estimate
+
+
+def is_estimate_current(campaign):
+    """Czy zapisany szacunek dotyczy bieżącej treści i transliteracji"""
+    if campaign.message_type not in ('sms', 'both'):
+        return not campaign.sms_estimate
+    return campaign.sms_estimate.get('key') == _estimate_key(campaign)
+
+
+def refresh_campaign_estimate(campaign):
+    """
+    Przelicza i zapisuje szacunek kampanii - na ścieżkach zapisu (utworzenie,
+    renderowanie w tle, zmiana transliteracji lub odbiorców), nigdy w widoku.
+    """
+    estimate = estimate_campaign(campaign) if campaign.message_type in ('sms', 'both') else {}
+    campaign.sms_estimate = estimate
+    type(campaign).objects.filter(pk=campaign.pk).update(sms_estimate=estimate)
+    return estimate
+
+
+def get_campaign_estimate(campaign):
+    """
+    Zapisany szacunek kampanii (tylko odczyt).
+
+    Returns:
+        dict or None: szacunek, {'pending': True}, gdy nowszy jest jeszcze liczony
+            w tle, albo None dla kampanii bez SMS
+    """
+    if campaign.message_type not in ('sms', 'both'):
+        return None
+    if not is_estimate_current(campaign):
+        return {'pending': True}
+    return campaign.sms_estimate
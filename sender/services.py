@@ -1,38 +1,59 @@
+import asyncio
+import importlib.util
 import logging
+import smtplib
 import time
+import uuid
 import random
-from django.core.mail import send_mail
+import threading
+import weakref
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.message import make_msgid
 from django.conf import settings
 import re
 
+from .balancing import CALL_TIMEOUT, ProvidersUnavailable
+from .segmentation import analyze_message
+
 logger = logging.getLogger(__name__)
 
 
 class MessageSender:
     """Service do wysyłania wiadomości email i SMS"""
     
-    def __init__(self):
-        # Wybierz provider SMS na podstawie konfiguracji
-        if hasattr(settings, 'SMSAPI_TOKEN') and settings.SMSAPI_TOKEN:
-            print("Using SMSAPI provider for SMS")
-            self.sms_provider = SMSAPIProvider()
-        else:
-            print("Using mock SMS provider")
-            self.sms_provider = MockSMSProvider()
-            
-        # Email provider
-        if hasattr(settings, 'EMAIL_BACKEND') and 'console' not in settings.EMAIL_BACKEND:
-            self.email_provider = DjangoEmailProvider()
-        else:
-            self.email_provider = MockEmailProvider()
+    def __init__(self, sms_provider=None, email_provider=None):
+        # Pule providerów z rejestru (konfiguracja z bazy, instancje i statystyki kondycji
+        # współdzielone między kampaniami); bez aktywnych providerów w bazie - provider z settings.
+        # Jawnie podane providery (np. w benchmarkach) zastępują rejestr.
+        from .registry import registry
+        
+        self.sms_provider = sms_provider or registry.get_pool('sms')
+        self.email_provider = email_provider or registry.get_pool('email')
+    
+    def ensure_available(self, message_type):
+        """
+        Sprawdza, czy dla typu kampanii jest provider z zamkniętym obwodem.
+        
+        Raises:
+            ProvidersUnavailable: gdy wszystkie obwody potrzebnego typu są otwarte
+        """
+        pools = {'email': [self.email_provider], 'sms': [self.sms_provider]}.get(
+            message_type, [self.email_provider, self.sms_provider]
+        )
+        for pool in pools:
+            if not pool.is_available():
+                raise ProvidersUnavailable("Wszyscy providerzy niedostępni (otwarte obwody)")
     
     def send_email(self, to_email, subject, message):
         """
         Wyślij email
         
         Returns:
-            tuple: (success: bool, error_message: str or None)
+            tuple: (success: bool, error_message: str or None, telemetry: dict)
         """
+        # Błędny adres to wina odbiorcy, nie providera - nie może psuć jego statystyk ani wywoływać failoveru
+        if not self._validate_email(to_email):
+            return False, "Nieprawidłowy adres email", {}
         return self.email_provider.send(to_email, subject, message)
     
     def send_sms(self, to_phone, message):
@@ -40,28 +61,69 @@ class MessageSender:
         Wyślij SMS
         
         Returns:
-            tuple: (success: bool, error_message: str or None)
+            tuple: (success: bool, error_message: str or None, telemetry: dict)
         """
+        if not self._validate_phone(to_phone):
+            return False, "Nieprawidłowy numer telefonu", {}
         return self.sms_provider.send(to_phone, message)
+    
+    async def asend_email(self, to_email, subject, message):
+        """Jak send_email(), dla kodu asynchronicznego"""
+        if not self._validate_email(to_email):
+            return False, "Nieprawidłowy adres email", {}
+        return await self.email_provider.asend(to_email, subject, message)
+    
+    async def asend_sms(self, to_phone, message):
+        """Jak send_sms(), dla kodu asynchronicznego"""
+        if not self._validate_phone(to_phone):
+            return False, "Nieprawidłowy numer telefonu", {}
+        return await self.sms_provider.asend(to_phone, message)
+    
+    async def aclose(self):
+        """Zamyka połączenia providerów otwarte w bieżącej pętli zdarzeń (koniec wysyłki równoległej)"""
+        for pool in (self.email_provider, self.sms_provider):
+            if hasattr(pool, 'aclose'):
+                await pool.aclose()
+    
+    def _validate_phone(self, phone):
+        """Walidacja numeru telefonu"""
+        digits_only = re.sub(r'[^\d]', '', phone)
+        return len(digits_only) >= 9
+    
+    def _validate_email(self, email):
+        """Walidacja adresu email"""
+        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+        return re.match(pattern, email) is not None
 
 
 class SMSAPIProvider:
     """Provider SMS używający SMSAPI - zgodnie z oficjalną dokumentacją"""
     
-    def __init__(self):
-        try:
-            from smsapi.client import SmsApiPlClient
-            from smsapi.exception import SmsApiException
-            
-            self.client = SmsApiPlClient(access_token=settings.SMSAPI_TOKEN)
-            self.SmsApiException = SmsApiException
-            logger.info("SMSAPI provider initialized successfully")
-        except ImportError:
+    def __init__(self, access_token=None):
+        # Sam klient (i jego zależności HTTP) importowany przy pierwszej wysyłce - nie przy starcie procesu;
+        # tu tylko sprawdzamy, czy pakiet jest zainstalowany
+        if importlib.util.find_spec('smsapi') is None:
             logger.error("smsapi-client not installed. Run: pip install smsapi-client")
-            raise
-        except Exception as e:
-            logger.error(f"Failed to initialize SMSAPI: {str(e)}")
-            raise
+            raise ImportError("No module named 'smsapi'")
+        self.access_token = access_token or settings.SMSAPI_TOKEN
+        self._client = None
+        self._client_lock = threading.Lock()
+    
+    def _connect(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    try:
+                        from smsapi.client import SmsApiPlClient
+                        from smsapi.exception import SmsApiException
+                        
+                        self.SmsApiException = SmsApiException
+                        self._client = SmsApiPlClient(access_token=self.access_token)
+                        logger.info("SMSAPI provider initialized successfully")
+                    except Exception as e:
+                        logger.error(f"Failed to initialize SMSAPI: {str(e)}")
+                        raise
+        return self._client
     
     def send(self, to_phone, message):
         """
@@ -72,38 +134,41 @@ class SMSAPIProvider:
             message (str): Treść wiadomości
             
         Returns:
-            tuple: (success: bool, error_message: str or None)
+            tuple: (success: bool, error_message: str or None, details: dict) -
+                details: message_id i koszt (points) z odpowiedzi SMSAPI
         """
+        client = self._connect()
         try:
             # Walidacja numeru telefonu
             if not self._validate_phone(to_phone):
-                return False, "Nieprawidłowy numer telefonu"
+                return False, "Nieprawidłowy numer telefonu", {'permanent': True}
             
             # Przygotuj numer telefonu
             clean_phone = self._clean_phone_number(to_phone)
             
             # Wyślij SMS zgodnie z dokumentacją: client.sms.send(to="phone number", message="text message")
-            send_results = self.client.sms.send(to=clean_phone, message=message, encoding='UTF8')
+            send_results = client.sms.send(to=clean_phone, message=message, encoding='UTF8')
             
             # Obsłuż wyniki zgodnie z dokumentacją: for result in send_results: print(result.id, result.points, result.error)
             for result in send_results:
                 if result.error:
                     logger.error(f"SMSAPI error for {clean_phone}: {result.error}")
-                    return False, str(result.error)
+                    return False, str(result.error), {}
                 else:
                     logger.info(f"SMS sent successfully to {clean_phone} (ID: {result.id}, Points: {result.points})")
-                    return True, None
+                    return True, None, {'message_id': str(result.id), 'points': float(result.points or 0)}
             
             # Jeśli brak wyników
-            return False, "Brak wyników wysyłania"
+            return False, "Brak wyników wysyłania", {}
                 
         except self.SmsApiException as e:
             # Obsługa wyjątków zgodnie z dokumentacją: except SmsApiException as e: print(e.message, e.code)
             logger.error(f"SMSAPI exception: {e.message} (code: {e.code})")
-            return False, f"SMSAPI: {e.message}"
+            # Kod 13: brak prawidłowych numerów (błędny lub zablokowany numer) - błąd odbiorcy, nie bramki
+            return False, f"SMSAPI: {e.message}", {'permanent': True} if e.code == 13 else {}
         except Exception as e:
             logger.error(f"Error sending SMS via SMSAPI: {str(e)}")
-            return False, f"Błąd: {str(e)}"
+            return False, f"Błąd: {str(e)}", {}
     
     def _validate_phone(self, phone):
         """Walidacja numeru telefonu"""
@@ -126,32 +191,236 @@ class SMSAPIProvider:
         return clean
 
 
-class MockSMSProvider:
-    """Mock provider SMS dla testów (istniejący kod)"""
+class AsyncSMSAPIProvider(SMSAPIProvider):
+    """
+    Provider SMS na REST API SMSAPI przez httpx - async def send.
+    
+    Wysyłka nie zajmuje wątku na czas odpowiedzi bramki; połączenia HTTP
+    (keep-alive) są współdzielone przez wszystkie wysyłki w danej pętli zdarzeń
+    i zamykane przez aclose() na końcu wysyłki.
+    """
+    
+    API_URL = 'https://api.smsapi.pl/sms.do'
+    
+    def __init__(self, access_token=None, api_url=None, max_connections=100):
+        try:
+            import httpx
+        except ImportError:
+            logger.error("httpx not installed. Run: pip install httpx")
+            raise
+        
+        self.httpx = httpx
+        self.access_token = access_token or settings.SMSAPI_TOKEN
+        self.api_url = api_url or self.API_URL
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.timeout = CALL_TIMEOUT
+        # Klient httpx jest związany z pętlą zdarzeń - osobny dla każdej pętli
+        self._clients = weakref.WeakKeyDictionary()
+    
+    def set_timeout(self, seconds):
+        """Limit czasu żądania HTTP (ustawiany przez pulę providerów)"""
+        self.timeout = seconds
+    
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = self.httpx.AsyncClient(
+                headers={'Authorization': f'Bearer {self.access_token}'},
+                limits=self.limits,
+                timeout=self.timeout,
+            )
+        return client
+    
+    async def aclose(self):
+        """Zamyka klienta httpx bieżącej pętli zdarzeń"""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+    
+    async def send(self, to_phone, message):
+        """
+        Wyślij SMS przez SMSAPI (POST sms.do, format=json)
+        
+        Returns:
+            tuple: (success: bool, error_message: str or None, details: dict) - jak SMSAPIProvider
+        """
+        if not self._validate_phone(to_phone):
+            return False, "Nieprawidłowy numer telefonu", {'permanent': True}
+        clean_phone = self._clean_phone_number(to_phone)
+        
+        try:
+            response = await self._client().post(self.api_url, data={
+                'to': clean_phone,
+                'message': message,
+                'encoding': 'utf-8',
+                'format': 'json',
+            })
+            payload = response.json()
+        except self.httpx.TimeoutException as e:
+            raise TimeoutError(str(e)) from e
+        except Exception as e:
+            logger.error(f"Error sending SMS via SMSAPI: {str(e)}")
+            return False, f"Błąd: {str(e)}", {}
+        
+        if 'error' in payload:
+            logger.error(f"SMSAPI exception: {payload.get('message')} (code: {payload['error']})")
+            # Kod 13: brak prawidłowych numerów - błąd odbiorcy, nie bramki
+            return False, f"SMSAPI: {payload.get('message')}", {'permanent': True} if payload['error'] == 13 else {}
+        
+        for result in payload.get('list', []):
+            logger.info(f"SMS sent successfully to {clean_phone} (ID: {result['id']}, Points: {result.get('points')})")
+            return True, None, {'message_id': str(result['id']), 'points': float(result.get('points') or 0)}
+        return False, "Brak wyników wysyłania", {}
+
+
+class SimulatedProvider:
+    """
+    Symulacja bramki dla mocków: opóźnienie, błędy i limit przepustowości.
+    
+    Wszystko ustawiane przez config providera (SMSProvider/EmailProvider.config):
+        latency: {"distribution": "none" | "fixed" | "uniform" | "exponential",
+                  "value": s, "min": s, "max": s, "mean": s}
+        failures: {typ błędu: prawdopodobieństwo}, typy z ERRORS
+        throttle: {"rate": wiadomości/s, "burst": n, "mode": "reject" | "delay"}
+        seed: ziarno generatora - ten sam seed daje te same błędy i opóźnienia
+    """
+    
+    # Typ błędu → komunikat zwracany jak przez prawdziwą bramkę
+    ERRORS = {}
+    # Błędy odbiorcy (trwałe - trafia na listę wykluczeń), a nie awarie bramki
+    PERMANENT_ERRORS = ('rejected', 'invalid')
+    DEFAULT_LATENCY = {'distribution': 'none'}
+    DEFAULT_FAILURES = {}
+    
+    def __init__(self, latency=None, failures=None, throttle=None, seed=None):
+        if isinstance(latency, (int, float)):
+            latency = {'distribution': 'fixed', 'value': latency}
+        self.latency = latency if latency is not None else self.DEFAULT_LATENCY
+        self.failures = failures if failures is not None else self.DEFAULT_FAILURES
+        unknown = set(self.failures) - set(self.ERRORS)
+        if unknown:
+            raise ValueError(f"Nieznane typy błędów: {', '.join(sorted(unknown))} (dostępne: {', '.join(self.ERRORS)})")
+        
+        # Limit czasu wywołania z puli providerów (set_timeout) - bez niego opóźnienie bez ograniczeń
+        self.timeout = None
+        self.throttle = throttle
+        if throttle:
+            self._tokens = float(throttle.get('burst', throttle['rate']))
+            self._refilled_at = time.monotonic()
+        
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+    
+    def _delay(self):
+        distribution = self.latency.get('distribution', 'uniform')
+        if distribution == 'none':
+            return 0.0
+        if distribution == 'fixed':
+            return self.latency['value']
+        if distribution == 'uniform':
+            return self._random.uniform(self.latency['min'], self.latency['max'])
+        if distribution == 'exponential':
+            return self._random.expovariate(1 / self.latency['mean'])
+        raise ValueError(f"Nieznany rozkład opóźnienia: {distribution}")
+    
+    def _acquire(self):
+        """Token bucket - czas oczekiwania na token (s) albo None, gdy wiadomość odrzucono"""
+        rate = self.throttle['rate']
+        burst = float(self.throttle.get('burst', rate))
+        now = time.monotonic()
+        self._tokens = min(burst, self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        if self.throttle.get('mode', 'reject') == 'delay':
+            wait = (1 - self._tokens) / rate
+            self._tokens -= 1
+            return wait
+        return None
+    
+    def set_timeout(self, seconds):
+        """Limit czasu wywołania - dłuższe symulowane opóźnienie kończy się TimeoutError jak timeout gniazda"""
+        self.timeout = seconds
+    
+    def failure(self, error):
+        """Wynik nieudanej wysyłki; trwały błąd odbiorcy oznaczony w details"""
+        permanent = error in [self.ERRORS.get(error_type) for error_type in self.PERMANENT_ERRORS]
+        return False, error, {'permanent': True} if permanent else {}
+    
+    def simulate(self):
+        """
+        Losuje wynik wysyłki i czeka symulowane opóźnienie.
+        
+        Returns:
+            str or None: komunikat błędu albo None przy sukcesie
+        """
+        with self._lock:
+            wait = self._acquire() if self.throttle else 0.0
+            if wait is None:
+                return "Przekroczono limit wysyłki bramki (throttling)"
+            delay = wait + self._delay()
+            roll = self._random.random()
+        
+        if self.timeout is not None and delay > self.timeout:
+            time.sleep(self.timeout)
+            raise TimeoutError(f"Brak odpowiedzi bramki w ciągu {self.timeout} s")
+        if delay > 0:
+            time.sleep(delay)
+        
+        # Profile błędów jako rozłączne przedziały [0, 1) - jedno losowanie na wiadomość
+        threshold = 0.0
+        for error_type, rate in self.failures.items():
+            threshold += rate
+            if roll < threshold:
+                return self.ERRORS[error_type]
+        return None
+
+
+class MockSMSProvider(SimulatedProvider):
+    """Mock provider SMS dla testów - bez config zachowuje się jak dotychczas"""
+    
+    ERRORS = {
+        'network': "Tymczasowy błąd sieci SMS",
+        'rejected': "Numer telefonu odrzucony przez operatora",
+        'invalid': "Nieprawidłowy numer telefonu",
+    }
+    DEFAULT_LATENCY = {'distribution': 'uniform', 'min': 0.2, 'max': 0.8}
+    DEFAULT_FAILURES = {'network': 0.03}  # 3% szans na błąd
+    
+    def __init__(self, points=None, **options):
+        """points: symulowany koszt jednej części SMS (jak points z SMSAPI), domyślnie brak"""
+        super().__init__(**options)
+        self.points = points
     
     def send(self, to_phone, message):
         """Mock wysyłanie SMS dla testów"""
         # Walidacja numeru telefonu
         if not self._validate_phone(to_phone):
-            return False, "Nieprawidłowy numer telefonu"
-        
-        # Sprawdź długość wiadomości
-        if len(message) > 160:
-            logger.warning(f"SMS message longer than 160 characters: {len(message)}")
+            return False, "Nieprawidłowy numer telefonu", {'permanent': True}
         
-        # Symulacja opóźnienia wysyłania
-        time.sleep(random.uniform(0.2, 0.8))
+        # Kodowanie i liczba części jak w bramce (polskie znaki wymuszają UCS-2)
+        segments = analyze_message(message)
+        if segments['segments'] > 1:
+            logger.debug(f"[MOCK] SMS to {to_phone}: {segments['segments']} parts ({segments['encoding']})")
         
         # Symulacja różnych scenariuszy
         if 'fail' in to_phone:
-            return False, "Numer telefonu odrzucony przez operatora"
+            return self.failure(self.ERRORS['rejected'])
         elif to_phone.startswith('000'):
-            return False, "Nieprawidłowy numer telefonu"
-        elif random.random() < 0.03:  # 3% szans na błąd
-            return False, "Tymczasowy błąd sieci SMS"
-        else:
-            logger.info(f"[MOCK] SMS sent to {to_phone}: {message[:50]}...")
-            return True, None
+            return self.failure(self.ERRORS['invalid'])
+        
+        # Symulacja opóźnienia, limitu i błędów bramki
+        error = self.simulate()
+        if error:
+            return self.failure(error)
+        
+        logger.info(f"[MOCK] SMS sent to {to_phone}: {message[:50]}...")
+        details = {'message_id': f'mock-{uuid.uuid4().hex[:16]}', 'segments': segments['segments']}
+        if self.points is not None:
+            details['points'] = round(self.points * segments['segments'], 4)
+        return True, None, details
     
     def _validate_phone(self, phone):
         """Walidacja numeru telefonu"""
@@ -166,25 +435,63 @@ class MockSMSProvider:
 class DjangoEmailProvider:
     """Provider email używający Django (prawdziwy wysył)"""
     
+    def __init__(self, from_email=None, **connection_options):
+        """
+        Args:
+            from_email (str): Nadawca, domyślnie DEFAULT_FROM_EMAIL
+            **connection_options: Opcje backendu email (np. host, port, username,
+                password, use_tls) - domyślnie ustawienia EMAIL_* z settings
+        """
+        self.from_email = from_email or getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com')
+        # Timeout gniazda SMTP - bez niego niedostępny serwer blokuje wątek na czas timeoutu systemowego
+        connection_options.setdefault('timeout', getattr(settings, 'EMAIL_TIMEOUT', None) or CALL_TIMEOUT)
+        self.connection_options = connection_options
+        # Backend SMTP trzyma otwarte połączenie w atrybutach - przy wysyłce równoległej
+        # (wątki sync_to_async i puli providerów) każdy wątek ma własny backend
+        self._local = threading.local()
+    
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = get_connection(**self.connection_options)
+        connection.timeout = self.connection_options['timeout']
+        return connection
+    
+    def set_timeout(self, seconds):
+        """Timeout gniazda SMTP (ustawiany przez pulę providerów) - zawieszony serwer kończy się TimeoutError"""
+        self.connection_options['timeout'] = seconds
+    
     def send(self, to_email, subject, message):
         """Wyślij email przez Django"""
         try:
             # Walidacja email
             if not self._validate_email(to_email):
-                return False, "Nieprawidłowy adres email"
+                return False, "Nieprawidłowy adres email", {'permanent': True}
             
-            send_mail(
+            # Własny Message-ID - identyfikator wiadomości do telemetrii (jak ID z bramki SMS)
+            message_id = make_msgid()
+            EmailMessage(
                 subject=subject,
-                message=message,
-                from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com'),
-                recipient_list=[to_email],
-                fail_silently=False,
-            )
+                body=message,
+                from_email=self.from_email,
+                to=[to_email],
+                connection=self.connection,
+                headers={'Message-ID': message_id},
+            ).send(fail_silently=False)
             logger.info(f"Email sent successfully to {to_email}")
-            return True, None
+            return True, None, {'message_id': message_id}
+        except smtplib.SMTPRecipientsRefused as e:
+            # 5xx dla adresata - skrzynka nie istnieje lub odrzuca pocztę (trwały błąd)
+            permanent = all(500 <= code < 600 for code, _ in e.recipients.values())
+            logger.error(f"Recipient refused {to_email}: {e.recipients}")
+            return False, f"Adres odrzucony przez serwer: {e.recipients}", {'permanent': True} if permanent else {}
+        except TimeoutError:
+            # Wynik nieznany - pula oznaczy próbę jako przekroczenie limitu (bez failoveru)
+            raise
         except Exception as e:
             logger.error(f"Failed to send email to {to_email}: {str(e)}")
-            return False, f"Błąd wysyłania: {str(e)}"
+            return False, f"Błąd wysyłania: {str(e)}", {}
     
     def _validate_email(self, email):
         """Walidacja adresu email"""
@@ -192,28 +499,142 @@ class DjangoEmailProvider:
         return re.match(pattern, email) is not None
 
 
-class MockEmailProvider:
-    """Mock provider email dla testów (istniejący kod)"""
+class AsyncSMTPEmailProvider:
+    """
+    Provider email na aiosmtplib - async def send.
+    
+    Na każdą pętlę zdarzeń trzyma do max_connections połączeń SMTP; kolejne
+    wiadomości idą już otwartymi połączeniami (bez ponownego EHLO, TLS i AUTH),
+    a aclose() na końcu wysyłki je zamyka.
+    Bez podanych opcji używa ustawień EMAIL_* jak DjangoEmailProvider.
+    """
+    
+    def __init__(self, from_email=None, host=None, port=None, username=None, password=None,
+                 use_tls=None, use_ssl=None, timeout=None, max_connections=10):
+        try:
+            import aiosmtplib
+        except ImportError:
+            logger.error("aiosmtplib not installed. Run: pip install aiosmtplib")
+            raise
+        
+        self.aiosmtplib = aiosmtplib
+        self.from_email = from_email or getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com')
+        self.options = {
+            'hostname': host or settings.EMAIL_HOST,
+            'port': port or settings.EMAIL_PORT,
+            'username': (username if username is not None else settings.EMAIL_HOST_USER) or None,
+            'password': (password if password is not None else settings.EMAIL_HOST_PASSWORD) or None,
+            'use_tls': settings.EMAIL_USE_SSL if use_ssl is None else use_ssl,
+            'start_tls': settings.EMAIL_USE_TLS if use_tls is None else use_tls,
+            'timeout': timeout or getattr(settings, 'EMAIL_TIMEOUT', None) or CALL_TIMEOUT,
+        }
+        self.max_connections = max_connections
+        # {pętla zdarzeń: (semafor połączeń, wolne połączenia)}
+        self._pools = weakref.WeakKeyDictionary()
+    
+    def set_timeout(self, seconds):
+        """Timeout operacji SMTP (ustawiany przez pulę providerów)"""
+        self.options['timeout'] = seconds
+    
+    def _pool(self):
+        loop = asyncio.get_running_loop()
+        pool = self._pools.get(loop)
+        if pool is None:
+            pool = self._pools[loop] = (asyncio.Semaphore(self.max_connections), [])
+        return pool
+    
+    async def aclose(self):
+        """Zamyka połączenia SMTP bieżącej pętli zdarzeń"""
+        pool = self._pools.pop(asyncio.get_running_loop(), None)
+        for client in pool[1] if pool else []:
+            try:
+                await client.quit()
+            except Exception:
+                client.close()
+    
+    async def send(self, to_email, subject, message):
+        """Wyślij email przez SMTP (asynchronicznie)"""
+        if not self._validate_email(to_email):
+            return False, "Nieprawidłowy adres email", {'permanent': True}
+        
+        message_id = make_msgid()
+        email = EmailMessage(
+            subject=subject,
+            body=message,
+            from_email=self.from_email,
+            to=[to_email],
+            headers={'Message-ID': message_id},
+        ).message()
+        
+        limit, idle = self._pool()
+        async with limit:
+            client = idle.pop() if idle else None
+            # Połączenie wraca do puli tylko, jeśli jest w znanym stanie (sukces albo odrzucony adresat)
+            reusable = False
+            try:
+                if client is None or not client.is_connected:
+                    client = self.aiosmtplib.SMTP(**self.options)
+                    await client.connect()
+                await client.send_message(email)
+                reusable = True
+            except self.aiosmtplib.SMTPRecipientsRefused as e:
+                reusable = True
+                refused = {error.recipient: (error.code, error.message) for error in e.recipients}
+                # 5xx dla adresata - skrzynka nie istnieje lub odrzuca pocztę (trwały błąd)
+                permanent = all(500 <= error.code < 600 for error in e.recipients)
+                logger.error(f"Recipient refused {to_email}: {refused}")
+                return False, f"Adres odrzucony przez serwer: {refused}", {'permanent': True} if permanent else {}
+            except TimeoutError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to send email to {to_email}: {str(e)}")
+                return False, f"Błąd wysyłania: {str(e)}", {}
+            finally:
+                if reusable:
+                    idle.append(client)
+                elif client is not None:
+                    # Połączenie w nieznanym stanie (timeout, zerwane) - zamknij zamiast zostawiać gniazdo
+                    client.close()
+        
+        logger.info(f"Email sent successfully to {to_email}")
+        return True, None, {'message_id': message_id}
+    
+    def _validate_email(self, email):
+        """Walidacja adresu email"""
+        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+        return re.match(pattern, email) is not None
+
+
+class MockEmailProvider(SimulatedProvider):
+    """Mock provider email dla testów - bez config zachowuje się jak dotychczas"""
+    
+    ERRORS = {
+        'server': "Tymczasowy błąd serwera email",
+        'rejected': "Adres email odrzucony przez serwer",
+        'invalid': "Nieprawidłowy adres email",
+    }
+    DEFAULT_LATENCY = {'distribution': 'uniform', 'min': 0.1, 'max': 0.5}
+    DEFAULT_FAILURES = {'server': 0.05}  # 5% szans na błąd
     
     def send(self, to_email, subject, message):
         """Mock wysyłanie emaila dla testów"""
         # Walidacja email
         if not self._validate_email(to_email):
-            return False, "Nieprawidłowy adres email"
-        
-        # Symulacja opóźnienia wysyłania
-        time.sleep(random.uniform(0.1, 0.5))
+            return False, "Nieprawidłowy adres email", {'permanent': True}
         
         # Symulacja różnych scenariuszy
         if 'fail@' in to_email.lower():
-            return False, "Adres email odrzucony przez serwer"
+            return self.failure(self.ERRORS['rejected'])
         elif 'invalid@' in to_email.lower():
-            return False, "Nieprawidłowy adres email"
-        elif random.random() < 0.05:  # 5% szans na błąd
-            return False, "Tymczasowy błąd serwera email"
-        else:
-            logger.info(f"[MOCK] Email sent to {to_email} with subject: {subject}")
-            return True, None
+            return self.failure(self.ERRORS['invalid'])
+        
+        # Symulacja opóźnienia, limitu i błędów serwera
+        error = self.simulate()
+        if error:
+            return self.failure(error)
+        
+        logger.info(f"[MOCK] Email sent to {to_email} with subject: {subject}")
+        return True, None, {'message_id': f'mock-{uuid.uuid4().hex[:16]}'}
     
     def _validate_email(self, email):
         """Walidacja adresu email"""
@@ -0,0 +1,116 @@
+import base64
+import logging
+import socketserver
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """
+    Minimalna sesja SMTP: przyjmuje każdą wiadomość (i każde AUTH), nic nie dostarcza.
+
+    Obsługuje komendy, których używa smtplib / backend SMTP Django:
+    EHLO/HELO, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA, RSET, NOOP, QUIT.
+    """
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode('ascii'))
+
+    def handle(self):
+        server = self.server
+        self.reply(f'220 {server.hostname} SMTP sink')
+        recipients = []
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command, _, argument = line.decode('utf-8', 'replace').strip().partition(' ')
+            command = command.upper()
+
+            if command == 'EHLO':
+                self.wfile.write(
+                    f'250-{server.hostname}\r\n250-8BITMIME\r\n250-SMTPUTF8\r\n250 AUTH PLAIN LOGIN\r\n'.encode('ascii')
+                )
+            elif command == 'HELO':
+                self.reply(f'250 {server.hostname}')
+            elif command == 'AUTH':
+                mechanism, _, initial = argument.partition(' ')
+                if mechanism.upper() == 'LOGIN':
+                    # Nazwa i hasło w dwóch kolejnych liniach base64
+                    self.reply('334 ' + base64.b64encode(b'Username:').decode())
+                    self.rfile.readline()
+                    self.reply('334 ' + base64.b64encode(b'Password:').decode())
+                    self.rfile.readline()
+                elif not initial:
+                    self.reply('334 ')
+                    self.rfile.readline()
+                self.reply('235 2.7.0 Authentication successful')
+            elif command == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                recipients.append(argument)
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                size = 0
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                    size += len(data)
+                if server.latency:
+                    time.sleep(server.latency)
+                server.record(len(recipients), size)
+                self.reply('250 OK: queued')
+            elif command == 'RSET':
+                recipients = []
+                self.reply('250 OK')
+            elif command == 'NOOP':
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    Lokalny serwer SMTP-"czarna dziura" do benchmarków DjangoEmailProvider.
+
+    Przykład config EmailProvider, który wysyła do sinka zamiast do serwera z settings:
+        {"backend": "django.core.mail.backends.smtp.EmailBackend", "host": "127.0.0.1",
+         "port": 2525, "use_tls": false}
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=2525, latency=0.0):
+        super().__init__((host, port), SMTPSinkHandler)
+        self.hostname = host
+        self.latency = latency
+        self.messages = 0
+        self.recipients = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def record(self, recipients, size):
+        with self._lock:
+            self.messages += 1
+            self.recipients += recipients
+            self.bytes += size
+
+    def start(self):
+        """Uruchamia serwer w wątku w tle (np. w benchmarku); zatrzymanie: shutdown()"""
+        thread = threading.Thread(target=self.serve_forever, name='smtp-sink', daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,52 @@
+"""
+Arkusze (pandas) ładowane leniwie.
+
+Import pandas (razem z numpy) trwa kilkaset milisekund, a większość procesów
+(worker WSGI/ASGI, komendy manage.py, strony bez arkuszy) go nie potrzebuje.
+Pozostałe moduły korzystają z pandas wyłącznie przez ten moduł: pandas()
+importuje bibliotekę przy pierwszym użyciu, np. przy parsowaniu pliku.
+"""
+import importlib
+import time
+
+from .metrics import STAGE_SECONDS, ROWS_PARSED
+
+
+def pandas():
+    """Moduł pandas - import przy pierwszym wywołaniu, kolejne to odczyt z sys.modules"""
+    return importlib.import_module('pandas')
+
+
+def read_workbook(excel_file):
+    """Wczytuje arkusz do DataFrame (z pomiarem czasu parsowania)"""
+    started = time.perf_counter()
+    df = pandas().read_excel(excel_file)
+    STAGE_SECONDS.observe(time.perf_counter() - started, stage='parse')
+    ROWS_PARSED.inc(len(df))
+    return df
+
+
+def read_values(path):
+    """Wszystkie komórki pliku XLSX/CSV jako płaska lista tekstów (plik tekstowy - wiersze)"""
+    pd = pandas()
+    suffix = path.suffix.lower()
+    if suffix in ('.xlsx', '.xls'):
+        frame = pd.read_excel(path, header=None, dtype=str)
+    elif suffix == '.csv':
+        frame = pd.read_csv(path, header=None, dtype=str, sep=None, engine='python')
+    else:
+        return path.read_text(encoding='utf-8').splitlines()
+    return frame.to_numpy().ravel()
+
+
+def is_missing(value):
+    """Pusta komórka arkusza (NaN, NaT, None)"""
+    return pandas().isna(value)
+
+
+def sample_rows(df, limit=5):
+    """Pierwsze wiersze arkusza jako słowniki tekstów (puste komórki jako '')"""
+    return [
+        {col: '' if is_missing(row[col]) else str(row[col]).strip() for col in df.columns}
+        for _, row in df.head(limit).iterrows()
+    ]
@@ -0,0 +1,145 @@
+import hashlib
+import logging
+import math
+import re
+import threading
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import Suppression
+
+logger = logging.getLogger(__name__)
+
+# Udział fałszywych trafień filtra - każde trafienie kosztuje jedno zapytanie do bazy
+BLOOM_ERROR_RATE = getattr(settings, 'SUPPRESSION_BLOOM_ERROR_RATE', 0.001)
+
+# Numer kierunkowy dla numerów krajowych (bez prefiksu)
+DEFAULT_COUNTRY_CODE = getattr(settings, 'SUPPRESSION_DEFAULT_COUNTRY_CODE', '48')
+
+
+def normalize_email(email):
+    if not email:
+        return None
+    email = str(email).strip().lower()
+    return email if '@' in email else None
+
+
+def normalize_phone(phone):
+    """Numer w formacie E.164 (+48600100200) albo None, gdy to nie numer"""
+    if not phone:
+        return None
+    phone = str(phone).strip()
+    digits = re.sub(r'\D', '', phone)
+    if phone.startswith('00'):
+        digits = digits[2:]
+    elif not phone.startswith('+'):
+        if digits.startswith('0') and len(digits) == 10:
+            # Krajowy numer z zerem na początku (0600100200)
+            digits = DEFAULT_COUNTRY_CODE + digits[1:]
+        elif len(digits) <= 9:
+            digits = DEFAULT_COUNTRY_CODE + digits
+    if len(digits) < 9:
+        return None
+    return f'+{digits}'
+
+
+NORMALIZERS = {
+    'email': normalize_email,
+    'phone': normalize_phone,
+}
+
+
+class BloomFilter:
+    """Filtr Blooma na bytearray; k pozycji z dwóch skrótów blake2b (double hashing)"""
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class SuppressionIndex:
+    """
+    Filtr Blooma listy wykluczeń trzymany w pamięci procesu.
+
+    Filtr jest przebudowywany, gdy zmieni się zawartość tabeli (liczba wierszy
+    i najnowszy wpis) - sprawdzane przez refresh(), raz na porcję odbiorców.
+    Negatyw filtra jest pewny; trafienie potwierdza jedno zapytanie do bazy.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._bloom = None
+
+    def refresh(self):
+        fingerprint = tuple(Suppression.objects.aggregate(count=Count('pk'), last=Max('pk')).values())
+        if fingerprint != self._fingerprint:
+            with self._lock:
+                if fingerprint != self._fingerprint:
+                    self._bloom = self._build(fingerprint[0])
+                    self._fingerprint = fingerprint
+        return self
+
+    def _build(self, count):
+        # Zapas na wpisy dodane do filtra bez przebudowy (add())
+        bloom = BloomFilter(int(count * 1.25) + 1000)
+        for kind, value in Suppression.objects.values_list('kind', 'value').iterator(chunk_size=10000):
+            bloom.add(f'{kind}:{value}')
+        logger.info(f"Suppression filter rebuilt: {count} entries, {len(bloom.bits) // 1024} KiB")
+        return bloom
+
+    def is_suppressed(self, kind, value):
+        value = NORMALIZERS[kind](value)
+        if not value:
+            return False
+        if self._bloom is None:
+            self.refresh()
+        if f'{kind}:{value}' not in self._bloom:
+            return False
+        return Suppression.objects.filter(kind=kind, value=value).exists()
+
+    def screen(self, email=None, phone=None):
+        """Zbiór wykluczonych kanałów odbiorcy ({'email', 'phone'} lub podzbiór)"""
+        suppressed = set()
+        if email and self.is_suppressed('email', email):
+            suppressed.add('email')
+        if phone and self.is_suppressed('phone', phone):
+            suppressed.add('phone')
+        return suppressed
+
+    def add(self, kind, value, reason='manual', source=''):
+        """
+        Dodaje wpis do listy wykluczeń (istniejący zostaje bez zmian).
+
+        Returns:
+            bool: True, gdy dodano nowy wpis
+        """
+        value = NORMALIZERS[kind](value)
+        if not value:
+            return False
+        _, created = Suppression.objects.get_or_create(
+            kind=kind, value=value, defaults={'reason': reason, 'source': source[:200]},
+        )
+        if created and self._bloom is not None:
+            # Od razu widoczne w tym procesie; inne procesy przebudują filtr przy refresh()
+            self._bloom.add(f'{kind}:{value}')
+        return created
+
+
+index = SuppressionIndex()
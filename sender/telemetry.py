@@ -0,0 +1,152 @@
+import bisect
+import logging
+
+from django.db import router, transaction
+
+from .models import Campaign
+
+logger = logging.getLogger(__name__)
+
+# Górne granice przedziałów opóźnienia providera (ms); percentyle liczone z histogramu
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+PERCENTILES = (50, 90, 95, 99)
+
+# Przedziały osi czasu: zaczynamy od minuty, przy zbyt wielu przedziałach (kampania
+# rozłożona na dni) szerokość jest podwajana, więc rozmiar rollupu jest ograniczony
+TIMELINE_BUCKET_SECONDS = 60
+TIMELINE_MAX_BUCKETS = 240
+
+
+class DeliveryStats:
+    """
+    Zwarty rollup telemetrii wysyłki kampanii (zapisywany w Campaign.delivery_stats).
+
+    Zamiast surowych latencji trzyma histogram (percentyle) i oś czasu
+    z licznikami per przedział, więc rozmiar nie rośnie z liczbą wiadomości,
+    a rollupy kolejnych porcji wysyłki (scheduler) można scalać.
+    """
+
+    def __init__(self, data=None):
+        data = data or {}
+        self.messages = data.get('messages', 0)
+        self.failed = data.get('failed', 0)
+        self.retried = data.get('retried', 0)
+        self.points = data.get('points', 0.0)
+        self.latency_counts = data.get('latency_counts') or [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum_ms = data.get('latency_sum_ms', 0.0)
+        self.latency_max_ms = data.get('latency_max_ms', 0.0)
+        self.providers = data.get('providers', {})
+        self.bucket_seconds = data.get('bucket_seconds', TIMELINE_BUCKET_SECONDS)
+        # {początek przedziału (epoch s): [wysłane, błędy, suma latencji ms, liczba pomiarów]}
+        self.timeline = {start: list(values) for start, *values in data.get('timeline', [])}
+
+    def record(self, at, success, telemetry):
+        """Jedna wiadomość: at - czas wysyłki, telemetry - z ProviderPool.send()"""
+        self.messages += 1
+        if not success:
+            self.failed += 1
+        if telemetry.get('attempt', 1) > 1:
+            self.retried += 1
+        self.points += telemetry.get('points') or 0
+
+        latency = telemetry.get('latency_ms')
+        if latency is not None:
+            self.latency_counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency)] += 1
+            self.latency_sum_ms += latency
+            self.latency_max_ms = max(self.latency_max_ms, latency)
+
+        provider = telemetry.get('provider')
+        if provider:
+            stats = self.providers.setdefault(provider, {'messages': 0, 'failed': 0})
+            stats['messages'] += 1
+            stats['failed'] += 0 if success else 1
+
+        start = int(at.timestamp()) // self.bucket_seconds * self.bucket_seconds
+        bucket = self.timeline.setdefault(start, [0, 0, 0.0, 0])
+        bucket[0 if success else 1] += 1
+        if latency is not None:
+            bucket[2] += latency
+            bucket[3] += 1
+        self._compact()
+
+    def merge(self, other):
+        self.messages += other.messages
+        self.failed += other.failed
+        self.retried += other.retried
+        self.points += other.points
+        self.latency_counts = [a + b for a, b in zip(self.latency_counts, other.latency_counts)]
+        self.latency_sum_ms += other.latency_sum_ms
+        self.latency_max_ms = max(self.latency_max_ms, other.latency_max_ms)
+        for provider, stats in other.providers.items():
+            own = self.providers.setdefault(provider, {'messages': 0, 'failed': 0})
+            own['messages'] += stats['messages']
+            own['failed'] += stats['failed']
+
+        self.bucket_seconds = max(self.bucket_seconds, other.bucket_seconds)
+        timeline, self.timeline = self.timeline, {}
+        for source in (timeline, other.timeline):
+            for start, values in source.items():
+                self._add_bucket(start, values)
+        self._compact()
+
+    def _add_bucket(self, start, values):
+        start = start // self.bucket_seconds * self.bucket_seconds
+        bucket = self.timeline.setdefault(start, [0, 0, 0.0, 0])
+        for index, value in enumerate(values):
+            bucket[index] += value
+
+    def _compact(self):
+        while len(self.timeline) > TIMELINE_MAX_BUCKETS:
+            self.bucket_seconds *= 2
+            timeline, self.timeline = self.timeline, {}
+            for start, values in timeline.items():
+                self._add_bucket(start, values)
+
+    def percentile(self, q):
+        """Percentyl latencji (ms) z histogramu - interpolacja liniowa w przedziale"""
+        total = sum(self.latency_counts)
+        if not total:
+            return None
+        rank = total * q / 100
+        seen = 0
+        for index, count in enumerate(self.latency_counts):
+            if count and seen + count >= rank:
+                lower = LATENCY_BUCKETS_MS[index - 1] if index else 0
+                upper = LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else self.latency_max_ms
+                value = lower + (upper - lower) * (rank - seen) / count
+                return round(min(value, self.latency_max_ms), 1)
+            seen += count
+        return round(self.latency_max_ms, 1)
+
+    def as_dict(self):
+        measured = sum(self.latency_counts)
+        return {
+            'messages': self.messages,
+            'failed': self.failed,
+            'retried': self.retried,
+            'points': round(self.points, 4),
+            'latency_counts': self.latency_counts,
+            'latency_sum_ms': round(self.latency_sum_ms, 1),
+            'latency_max_ms': self.latency_max_ms,
+            'latency_avg_ms': round(self.latency_sum_ms / measured, 1) if measured else None,
+            'percentiles': {f'p{q}': self.percentile(q) for q in PERCENTILES},
+            'providers': self.providers,
+            'bucket_seconds': self.bucket_seconds,
+            'timeline': [
+                [start, sent, failed, round(latency_sum, 1), latency_count]
+                for start, (sent, failed, latency_sum, latency_count) in sorted(self.timeline.items())
+            ],
+        }
+
+
+def save_delivery_stats(campaign, stats):
+    """Scala rollup porcji wysyłki z zapisanym w kampanii (jedna aktualizacja wiersza)"""
+    if not stats.messages:
+        return
+
+    with transaction.atomic(using=router.db_for_write(Campaign)):
+        stored = Campaign.objects.select_for_update().values_list('delivery_stats', flat=True).get(pk=campaign.pk)
+        merged = DeliveryStats(stored)
+        merged.merge(stats)
+        campaign.delivery_stats = merged.as_dict()
+        Campaign.objects.filter(pk=campaign.pk).update(delivery_stats=campaign.delivery_stats)
@@ -1,3 +1,1356 @@
+import datetime
+import gc
+import json
+import random
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.admin import site
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .admin import MessageLogAdmin
+from .archive import index_path, read_archived_messages
+from .balancing import (
+    MAX_HUNG_CALLS, PROBE_SHARE, CircuitBreaker, PooledProvider, ProviderPool, ProvidersUnavailable,
+)
+from .dispatch import dispatch_recipients
+from .exports import export_rows
+from .importing import ingest_recipients, reimport_recipients
+from .management.commands import benchmark_startup
+from .metrics import ROWS_PARSED, Counter, Histogram
+from .models import Campaign, Contact, MessageBody, MessageLog, Recipient, SMSProvider
+from .pagination import KeysetPaginator
+from .profiling import assert_max_queries, assert_view_query_budgets
+from .registry import ProviderRegistry, resolve_provider_class
+from .rendering import RENDER_STALE_SECONDS, claim_render, render_message, render_stale_campaigns
+from .routers import WriterRouter
+from .scheduling import active_seconds, get_campaign_timezone, is_in_window, release_quota, run_scheduler_tick
+from .search import rebuild_search_index, search_recipients
+from .segmentation import (
+    analyze_message, estimate_segments, get_campaign_estimate, refresh_campaign_estimate, transliterate,
+)
+from .services import DjangoEmailProvider, MessageSender, MockEmailProvider, MockSMSProvider
+from .smtp_sink import SMTPSink
+from .spreadsheets import pandas, read_workbook, sample_rows
+from .suppression import BloomFilter, normalize_phone
+from .telemetry import TIMELINE_BUCKET_SECONDS, TIMELINE_MAX_BUCKETS, DeliveryStats
+from .views import RECIPIENTS_ORDERING
+
+
+def recipient_row(first_name, email=None, phone=None, last_name='Kowalski', **extra_data):
+    """Wiersz odbiorcy jak po walidacji pliku (clean_recipient_row)"""
+    return {
+        'first_name': first_name,
+        'last_name': last_name,
+        'email': email,
+        'phone': phone,
+        'extra_data': extra_data,
+    }
+
+
+class CampaignTransitionTests(TestCase):
+    """Maszyna stanów kampanii i zapis compare-and-set"""
+
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name='Test', message_content='Treść', message_type='email')
+
+    def test_allowed_transitions(self):
+        self.assertTrue(self.campaign.transition_to('queued'))
+        self.assertTrue(self.campaign.transition_to('sending'))
+        sent_at = timezone.now()
+        self.assertTrue(self.campaign.transition_to('completed', sent_at=sent_at))
+
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.status, 'completed')
+        self.assertEqual(self.campaign.sent_at, sent_at)
+
+    def test_forbidden_transitions(self):
+        self.assertFalse(self.campaign.transition_to('sending'))
+        self.assertFalse(self.campaign.transition_to('completed'))
+
+        Campaign.objects.filter(pk=self.campaign.pk).update(status='completed')
+        self.campaign.refresh_from_db()
+        for status in Campaign.TRANSITIONS:
+            self.assertFalse(self.campaign.transition_to(status))
+        self.assertEqual(Campaign.objects.get(pk=self.campaign.pk).status, 'completed')
+
+    def test_stale_instance_loses_race(self):
+        self.campaign.transition_to('queued')
+        first = Campaign.objects.get(pk=self.campaign.pk)
+        second = Campaign.objects.get(pk=self.campaign.pk)
+
+        self.assertTrue(first.transition_to('sending'))
+        # Druga wysyłka widzi jeszcze queued - warunkowy UPDATE niczego nie zmienia
+        self.assertFalse(second.transition_to('sending'))
+        self.assertEqual(second.status, 'queued')
+        self.assertEqual(Campaign.objects.get(pk=self.campaign.pk).status, 'sending')
+
+    def test_only_status_columns_are_written(self):
+        stale = Campaign.objects.get(pk=self.campaign.pk)
+        Campaign.objects.filter(pk=self.campaign.pk).update(name='Zmieniona')
+
+        self.assertTrue(stale.transition_to('queued'))
+        self.assertEqual(Campaign.objects.get(pk=self.campaign.pk).name, 'Zmieniona')
+
+
+class KeysetPaginatorTests(TestCase):
+    """Kursory listy odbiorców (sortowanie jak w campaign_status, z NULL-ami w sent_at)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.campaign = Campaign.objects.create(name='Test', message_content='Treść', message_type='email')
+        sent_at = timezone.now()
+        for i in range(23):
+            contact = Contact.objects.create(key=f'osoba{i}@example.com|', digest=f'osoba{i}',
+                                             email=f'osoba{i}@example.com', first_name='Osoba', last_name=f'Test{i % 4}')
+            # Co trzeci wysłany, część z tym samym sent_at i nazwiskiem - remisy rozstrzyga dalszy klucz
+            Recipient.objects.create(
+                campaign=cls.campaign,
+                contact=contact,
+                sort_name=f'Test{i % 4} Osoba',
+                status='sent' if i % 3 == 0 else 'pending',
+                sent_at=sent_at - datetime.timedelta(minutes=i // 6) if i % 3 == 0 else None,
+            )
+        cls.expected = list(cls.campaign.recipients.order_by(*RECIPIENTS_ORDERING).values_list('uid', flat=True))
+
+    def paginator(self):
+        return KeysetPaginator(self.campaign.recipients.all(), 5, RECIPIENTS_ORDERING)
+
+    def test_forward_and_back(self):
+        paginator = self.paginator()
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+        self.assertEqual([recipient.uid for page in pages for recipient in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+        # Wstecz od ostatniej strony - te same strony w odwrotnej kolejności
+        page = pages[-1]
+        for expected_page in reversed(pages[:-1]):
+            page = paginator.get_page(page.previous_cursor)
+            self.assertEqual([recipient.uid for recipient in page], [recipient.uid for recipient in expected_page])
+        self.assertFalse(page.has_previous())
+
+    def test_invalid_cursor_returns_first_page(self):
+        paginator = self.paginator()
+        first = [recipient.uid for recipient in paginator.get_page()]
+        for cursor in ('nie-kursor', 'e30', '!!!'):
+            self.assertEqual([recipient.uid for recipient in paginator.get_page(cursor)], first)
+
+
+class IndexUsageTests(TestCase):
+    """Zapytania statusu kampanii i logów odbiorcy korzystają z indeksów (plan zapytania)"""
+
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name='Indeksy', message_content='Cześć', message_type='email')
+        ingest_recipients(self.campaign, [recipient_row(f'Osoba{i}', f'osoba{i}@example.com') for i in range(5)])
+
+    def test_status_filter_uses_campaign_status_index(self):
+        plan = self.campaign.recipients.filter(status='pending').explain()
+        self.assertIn('recipient_campaign_status_idx', plan)
+
+    def test_last_log_uses_recipient_sent_index(self):
+        recipient = self.campaign.recipients.first()
+        plan = MessageLog.objects.filter(recipient=recipient).order_by('-sent_at').explain()
+        self.assertIn('messagelog_recipient_sent_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class SearchTests(TestCase):
+    """Wyszukiwanie odbiorców przez indeks FTS5 kontaktów (sender.search)"""
+
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name='Szukaj', message_content='Cześć', message_type='both')
+        ingest_recipients(self.campaign, [
+            recipient_row('Anna', 'anna.nowak@example.com', '600100200', last_name='Nowak'),
+            recipient_row('Jan', 'jan@firma.pl', '600100201', last_name='Kowalski'),
+            recipient_row('Ola', 'ola@example.com', last_name='Nowicka'),
+        ])
+
+    def search(self, query):
+        return set(search_recipients(self.campaign.recipients.all(), query).values_list('contact__first_name', flat=True))
+
+    def test_substring_in_any_field(self):
+        self.assertEqual(self.search('wak'), {'Anna'})
+        self.assertEqual(self.search('firma'), {'Jan'})
+        self.assertEqual(self.search('100201'), {'Jan'})
+        self.assertEqual(self.search('NOW'), {'Anna', 'Ola'})
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search('Now example'), {'Anna', 'Ola'})
+        self.assertEqual(self.search('Nowak Ola'), set())
+        self.assertEqual(self.search('"anna.nowak"'), {'Anna'})
+
+    def test_short_terms_fall_back_to_icontains(self):
+        self.assertEqual(self.search('Ol'), {'Ola'})
+        self.assertEqual(self.search(''), {'Anna', 'Jan', 'Ola'})
+
+    def test_rebuild_index(self):
+        self.assertEqual(rebuild_search_index(), Contact.objects.count())
+        self.assertEqual(self.search('Kowal'), {'Jan'})
+
+
+class ReimportTests(TestCase):
+    """Różnicowa aktualizacja odbiorców z nowej wersji pliku"""
+
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name='Test', message_content='Cześć {{first_name}}', message_type='both')
+        ingest_recipients(self.campaign, [
+            recipient_row('Anna', 'anna@example.com', '600100200'),
+            recipient_row('Bartek', 'bartek@example.com'),
+            recipient_row('Celina', phone='600100202'),
+            recipient_row('Daria', 'daria@example.com'),
+        ])
+        Recipient.objects.filter(contact__email='daria@example.com').update(status='sent', sent_at=timezone.now())
+
+    def test_only_differences_are_written(self):
+        stats = reimport_recipients(self.campaign, [
+            recipient_row('Anna', 'anna@example.com', '600100200'),
+            recipient_row('Bartłomiej', 'bartek@example.com'),
+            recipient_row('Edward', 'edward@example.com'),
+        ])
+
+        self.assertEqual(stats, {
+            'inserted': 1, 'updated': 1, 'deleted': 1, 'unchanged': 1, 'sent_kept': 1, 'skipped': 0, 'suppressed': 0,
+        })
+        names = set(self.campaign.recipients.values_list('contact__first_name', flat=True))
+        self.assertEqual(names, {'Anna', 'Bartłomiej', 'Daria', 'Edward'})
+        self.assertEqual(self.campaign.recipients.get(contact__first_name='Daria').status, 'sent')
+
+    def test_same_file_changes_nothing(self):
+        before = dict(self.campaign.recipients.values_list('uid', 'row_hash'))
+        stats = reimport_recipients(self.campaign, [
+            recipient_row('Anna', 'anna@example.com', '600 100 200'),
+            recipient_row('Bartek', 'bartek@example.com'),
+            recipient_row('Celina', phone='600100202'),
+        ])
+
+        # Inny zapis numeru Anny to ten sam kontakt i ten sam wiersz
+        self.assertEqual(stats, {
+            'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 3, 'sent_kept': 1, 'skipped': 0, 'suppressed': 0,
+        })
+        self.assertEqual(dict(self.campaign.recipients.values_list('uid', 'row_hash')), before)
+
+    def test_duplicate_rows_are_skipped(self):
+        stats = reimport_recipients(self.campaign, [
+            recipient_row('Anna', 'anna@example.com', '600100200'),
+            recipient_row('Anna', 'ANNA@example.com', '+48 600 100 200'),
+            None,
+        ])
+
+        self.assertEqual(stats['skipped'], 2)
+        self.assertEqual(Contact.objects.filter(email__iexact='anna@example.com').count(), 1)
+
+
+class ContactSnapshotTests(TestCase):
+    """Kontakty jako niezmienne migawki - kolejne importy nie zmieniają innych kampanii"""
+
+    def setUp(self):
+        self.finished = Campaign.objects.create(name='Wysłana', message_content='Cześć {{first_name}}',
+                                                message_type='both')
+        ingest_recipients(self.finished, [
+            recipient_row('Anna', 'anna@example.com', '600100200', last_name='Nowak'),
+            recipient_row('Bartek', 'bartek@example.com'),
+        ])
+        self.finished.recipients.update(status='sent', sent_at=timezone.now())
+
+    def identities(self, campaign):
+        return set(campaign.recipients.values_list(
+            'contact__first_name', 'contact__last_name', 'contact__email', 'contact__phone', 'sort_name',
+        ))
+
+    def test_second_import_leaves_finished_campaign_unchanged(self):
+        before = self.identities(self.finished)
+        pending = Campaign.objects.create(name='Oczekująca', message_content='Cześć', message_type='both')
+        ingest_recipients(pending, [recipient_row('Bartek', 'bartek@example.com')])
+        pending.recipients.update(rendered_message='Cześć', rendered_digest='abc')
+
+        campaign = Campaign.objects.create(name='Nowa', message_content='Cześć', message_type='both')
+        ingest_recipients(campaign, [
+            recipient_row('Anna', 'anna@example.com', '+48 600 100 200', last_name='Kowalska'),
+            recipient_row('Bartłomiej', 'bartek@example.com'),
+        ])
+
+        self.assertEqual(self.identities(self.finished), before)
+        self.assertEqual(self.identities(campaign), {
+            ('Anna', 'Kowalska', 'anna@example.com', '+48 600 100 200', 'Kowalska Anna'),
+            ('Bartłomiej', 'Kowalski', 'bartek@example.com', None, 'Kowalski Bartłomiej'),
+        })
+        # Treści oczekujących odbiorców innych kampanii pozostają aktualne
+        self.assertEqual(pending.recipients.get().rendered_digest, 'abc')
+
+    def test_reimport_does_not_touch_other_campaigns(self):
+        before = self.identities(self.finished)
+        campaign = Campaign.objects.create(name='Nowa', message_content='Cześć', message_type='both')
+        ingest_recipients(campaign, [recipient_row('Anna', 'anna@example.com', '600100200', last_name='Nowak')])
+        self.assertEqual(Contact.objects.count(), 2)
+
+        stats = reimport_recipients(campaign, [recipient_row('Anna', 'anna@example.com', '600100200', last_name='Nowicka')])
+
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(self.identities(self.finished), before)
+        self.assertEqual(campaign.recipients.get().sort_name, 'Nowicka Anna')
+
+    def test_same_data_reuses_contact(self):
+        campaign = Campaign.objects.create(name='Nowa', message_content='Cześć', message_type='both')
+        ingest_recipients(campaign, [
+            recipient_row('Anna', 'anna@example.com', '600100200', last_name='Nowak'),
+            recipient_row('Bartek', 'bartek@example.com'),
+        ])
+
+        self.assertEqual(Contact.objects.count(), 2)
+        self.assertEqual(
+            set(campaign.recipients.values_list('contact_id', flat=True)),
+            set(self.finished.recipients.values_list('contact_id', flat=True)),
+        )
+
+
+class ContactAdminTests(TestCase):
+    """Edycja kontaktu w adminie"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'haslo'))
+        self.campaign = Campaign.objects.create(name='Kampania', message_content='Cześć', message_type='email')
+        ingest_recipients(self.campaign, [
+            recipient_row('Anna', 'anna@example.com', last_name='Nowak'),
+            recipient_row('Jan', 'jan@example.com'),
+        ])
+        self.anna = Contact.objects.get(email='anna@example.com')
+
+    def change(self, contact, **data):
+        url = reverse('admin:sender_contact_change', args=[contact.pk])
+        return self.client.post(url, {'email': contact.email, 'phone': '', 'first_name': contact.first_name,
+                                      'last_name': contact.last_name, **data})
+
+    def test_collision_is_a_form_error(self):
+        response = self.change(self.anna, email='jan@example.com', first_name='Jan', last_name='Kowalski')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Kontakt z tymi samymi danymi już istnieje.', response.context['adminform'].form.non_field_errors())
+        self.anna.refresh_from_db()
+        self.assertEqual(self.anna.email, 'anna@example.com')
+
+    def test_edit_updates_key_digest_and_sort_name(self):
+        response = self.change(self.anna, email='ANNA.NOWAK@example.com', last_name='Nowicka')
+
+        self.assertEqual(response.status_code, 302)
+        self.anna.refresh_from_db()
+        self.assertEqual(self.anna.key, 'anna.nowak@example.com|')
+        self.assertFalse(Contact.objects.exclude(pk=self.anna.pk).filter(digest=self.anna.digest).exists())
+        self.assertEqual(self.anna.recipients.get().sort_name, 'Nowicka Anna')
+
+    def test_sent_contact_is_read_only(self):
+        self.anna.recipients.update(status='sent', sent_at=timezone.now())
+        response = self.change(self.anna, first_name='Hanna')
+
+        self.assertEqual(response.status_code, 302)
+        self.anna.refresh_from_db()
+        self.assertEqual(self.anna.first_name, 'Anna')
+
+
+class ExportTests(TestCase):
+    """Eksport wyników kampanii (sender.exports)"""
+
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name='Eksport', message_content='Cześć', message_type='both')
+        ingest_recipients(self.campaign, [
+            recipient_row('Celina', 'celina@example.com', last_name='Zielińska'),
+            recipient_row('Anna', 'anna@example.com', '600100200', last_name='Nowak', miasto='Kraków'),
+            recipient_row('Adam', 'adam@example.com', last_name='Nowak'),
+        ])
+
+    def test_rows_ordered_by_name_from_index(self):
+        rows = list(export_rows(self.campaign))
+        self.assertEqual([row[:2] for row in rows], [['Adam', 'Nowak'], ['Anna', 'Nowak'], ['Celina', 'Zielińska']])
+
+        plan = self.campaign.recipients.order_by('sort_name', 'uid').explain()
+        self.assertIn('recipient_campaign_name_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def export(self, export_format, **params):
+        url = reverse('export_campaign', args=[self.campaign.uid])
+        response = self.client.get(url, {'format': export_format, **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        self.campaign.recipients.filter(contact__first_name='Anna').update(
+            status='sent', sent_at=timezone.make_aware(datetime.datetime(2026, 5, 4, 12, 30)),
+        )
+        lines = self.export('csv').decode('utf-8').splitlines()
+
+        self.assertEqual(lines[0], '\ufeffImię,Nazwisko,Email,Telefon,Status,Wysłano,Błąd,Dodatkowe dane')
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(
+            lines[2], 'Anna,Nowak,anna@example.com,600100200,Wysłane,2026-05-04 12:30:00,,"{""miasto"": ""Kraków""}"',
+        )
+
+    def test_csv_status_filter(self):
+        self.campaign.recipients.filter(contact__first_name='Adam').update(status='failed', error_message='Błąd')
+        lines = self.export('csv', status='failed').decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('Adam,Nowak'))
+
+    def test_xlsx(self):
+        from openpyxl import load_workbook
+
+        sent_at = datetime.datetime(2026, 5, 4, 12, 30)
+        self.campaign.recipients.filter(contact__first_name='Anna').update(
+            status='sent', sent_at=timezone.make_aware(sent_at),
+        )
+        sheet = load_workbook(BytesIO(self.export('xlsx'))).active
+
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(rows[0][:5], ('Imię', 'Nazwisko', 'Email', 'Telefon', 'Status'))
+        self.assertEqual([row[:2] for row in rows[1:]], [('Adam', 'Nowak'), ('Anna', 'Nowak'), ('Celina', 'Zielińska')])
+        self.assertEqual(rows[2][4], 'Wysłane')
+        self.assertEqual(rows[2][5], sent_at)
+
+    def test_unknown_format(self):
+        url = reverse('export_campaign', args=[self.campaign.uid])
+        self.assertEqual(self.client.get(url, {'format': 'pdf'}).status_code, 400)
+
+    async def test_asgi_export_streams_asynchronously(self):
+        url = reverse('export_campaign', args=[self.campaign.uid])
+        response = await self.async_client.get(url, {'format': 'csv'})
+
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode('utf-8')
+        self.assertTrue(content.startswith('\ufeffImię,Nazwisko'))
+        self.assertEqual(content.count('\n'), 4)
+
+
+class MessageBodyTests(TestCase):
+    """Treści logów adresowane skrótem i kompresowane (MessageBody)"""
+
+    def test_same_text_is_stored_once(self):
+        first = MessageBody.store('Cześć Anna')
+        second = MessageBody.store('Cześć Anna')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(MessageBody.objects.count(), 1)
+        self.assertFalse(first.compressed)
+        self.assertEqual(first.text, 'Cześć Anna')
+
+    def test_long_text_is_compressed(self):
+        text = 'Dzień dobry, zapraszamy na promocję! ' * 40
+        body = MessageBody.objects.get(pk=MessageBody.store(text).pk)
+        self.assertTrue(body.compressed)
+        self.assertLess(len(bytes(body.data)), body.size)
+        self.assertEqual(body.size, len(text.encode('utf-8')))
+        self.assertEqual(body.text, text)
+
+    def test_purge_orphans(self):
+        campaign = Campaign.objects.create(name='Logi', message_content='Cześć', message_type='email')
+        ingest_recipients(campaign, [recipient_row('Anna', 'anna@example.com')])
+        used = MessageBody.store('Używana')
+        MessageBody.store('Osierocona')
+        MessageLog.objects.create(recipient=campaign.recipients.get(), message_type='email', body=used, success=True)
+
+        self.assertEqual(MessageBody.purge_orphans(), 1)
+        self.assertEqual(list(MessageBody.objects.values_list('pk', flat=True)), [used.pk])
+
+
+class ArchiveTests(TestCase):
+    """Archiwizacja logów do plików i odczyt treści z archiwum (sender.archive)"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.campaign = Campaign.objects.create(name='Stara', message_content='Cześć', message_type='both')
+        ingest_recipients(self.campaign, [
+            recipient_row(f'Osoba{i}', f'osoba{i}@example.com', f'600100{i:03d}') for i in range(30)
+        ])
+        sent_at = timezone.now() - datetime.timedelta(days=200)
+        Campaign.objects.filter(pk=self.campaign.pk).update(status='completed', sent_at=sent_at)
+        for recipient in self.campaign.recipients.all():
+            for minutes, message_type in ((0, 'email'), (1, 'sms')):
+                log = MessageLog.objects.create(
+                    recipient=recipient, message_type=message_type, success=True,
+                    body=MessageBody.store(f'{message_type} do {recipient.uid}'),
+                )
+                MessageLog.objects.filter(pk=log.pk).update(sent_at=sent_at + datetime.timedelta(minutes=minutes))
+
+    def test_jsonl_round_trip(self):
+        recipients = list(self.campaign.recipients.order_by('uid')[:3])
+        # Małe bloki - odczyt musi znaleźć odbiorców w różnych członach gzip przez indeks
+        with mock.patch('sender.archive.ARCHIVE_BLOCK_SIZE', 512):
+            call_command('archive_message_logs', '--archive-dir', self.directory.name, '--summaries',
+                         '--pause', '0', '--batch-size', '7', stdout=StringIO())
+
+        self.assertFalse(MessageLog.objects.exists())
+        self.assertFalse(MessageBody.objects.exists())
+        archive = self.campaign.log_archives.get()
+        self.assertEqual(archive.log_count, 60)
+        self.assertEqual(archive.summary['email']['sent'], 30)
+        self.assertTrue(index_path(archive.path).exists())
+
+        messages = read_archived_messages(self.campaign, [recipient.uid for recipient in recipients])
+        # Ostatnia wiadomość odbiorcy to SMS (minutę po emailu)
+        self.assertEqual(messages, {str(recipient.uid): f'sms do {recipient.uid}' for recipient in recipients})
+
+    def test_dry_run_keeps_logs(self):
+        out = StringIO()
+        call_command('archive_message_logs', '--archive-dir', self.directory.name, '--dry-run', stdout=out)
+        self.assertIn('Stara: 60 logów', out.getvalue())
+        self.assertEqual(MessageLog.objects.count(), 60)
+        self.assertFalse(self.campaign.log_archives.exists())
+
+
+class SuppressionTests(TestCase):
+    """Normalizacja numerów i filtr Blooma listy wykluczeń"""
+
+    def test_normalize_phone(self):
+        cases = {
+            '600100200': '+48600100200',
+            '600 100 200': '+48600100200',
+            '0600100200': '+48600100200',
+            '+48 600-100-200': '+48600100200',
+            '0048600100200': '+48600100200',
+            '48600100200': '+48600100200',
+            '+44 20 7946 0958': '+442079460958',
+            600100200: '+48600100200',
+            '12345': None,
+            'brak': None,
+            '': None,
+            None: None,
+        }
+        for phone, expected in cases.items():
+            with self.subTest(phone=phone):
+                self.assertEqual(normalize_phone(phone), expected)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        items = [f'osoba{i}@example.com' for i in range(1000)]
+        for item in items:
+            bloom.add(item)
+        self.assertTrue(all(item in bloom for item in items))
+
+    def test_bloom_filter_error_rate(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'+48600{i:06d}')
+        false_positives = sum(f'+48700{i:06d}' in bloom for i in range(10000))
+        self.assertLess(false_positives / 10000, 0.03)
+
+
+class SegmentationTests(TestCase):
+    """Kodowanie i liczba części SMS"""
+
+    def test_gsm7_limits(self):
+        self.assertEqual(analyze_message('a' * 160), {'encoding': 'gsm7', 'units': 160, 'segments': 1})
+        self.assertEqual(analyze_message('a' * 161)['segments'], 2)
+        self.assertEqual(analyze_message('a' * 306)['segments'], 2)
+        self.assertEqual(analyze_message('a' * 307)['segments'], 3)
+
+    def test_gsm7_extended_characters_take_two_septets(self):
+        self.assertEqual(analyze_message('€' * 80), {'encoding': 'gsm7', 'units': 160, 'segments': 1})
+        self.assertEqual(analyze_message('€' * 81)['segments'], 2)
+
+    def test_ucs2(self):
+        self.assertEqual(analyze_message('ą' * 70), {'encoding': 'ucs2', 'units': 70, 'segments': 1})
+        self.assertEqual(analyze_message('ą' * 71)['segments'], 2)
+        # Emoji spoza BMP to dwie jednostki UTF-16
+        self.assertEqual(analyze_message('😀' * 35)['units'], 70)
+        self.assertEqual(analyze_message('😀' * 36)['segments'], 2)
+
+    def test_transliterate(self):
+        self.assertEqual(transliterate('Zażółć gęślą jaźń – „już”…'), 'Zazolc gesla jazn - "juz"...')
+        self.assertEqual(analyze_message(transliterate('ą' * 160))['encoding'], 'gsm7')
+
+    def test_estimate_matches_rendered_messages(self):
+        template = 'Dzień dobry {{first_name}}! Wizyta {{Data}} – {{Poradnia}} {{brak}}'
+        rows = [
+            {'first_name': 'Jan', 'Data': '2025-01-01', 'Poradnia': 'Kardiologia'},
+            {'first_name': 'Łucja', 'Data': '', 'Poradnia': 'A' * 200},
+            {'first_name': 'Zoë', 'Data': None, 'Poradnia': '€€€'},
+            {'first_name': '😀', 'Data': '2025-01-02', 'Poradnia': 'Chirurgia'},
+        ]
+        frame = pandas().DataFrame(rows, dtype=object)
+
+        for transliterate_text in (False, True):
+            result = estimate_segments(template, frame, transliterate_text)
+            for i, row in enumerate(rows):
+                message = render_message(template, row)
+                if transliterate_text:
+                    message = transliterate(message)
+                with self.subTest(row=i, transliterate=transliterate_text):
+                    expected = analyze_message(message)
+                    self.assertEqual(result.loc[i, 'encoding'], expected['encoding'])
+                    self.assertEqual(result.loc[i, 'units'], expected['units'])
+                    self.assertEqual(result.loc[i, 'segments'], expected['segments'])
+
+    def test_campaign_estimate_is_read_only(self):
+        campaign = Campaign.objects.create(name='Test', message_content='Cześć {{first_name}}', message_type='sms')
+        ingest_recipients(campaign, [recipient_row('Anna', phone='600100200'), recipient_row('Ola', phone='600100201')])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_campaign_estimate(campaign), {'pending': True})
+
+        refresh_campaign_estimate(campaign)
+        estimate = get_campaign_estimate(Campaign.objects.get(pk=campaign.pk))
+        self.assertEqual(estimate['recipients'], 2)
+        self.assertEqual(estimate['ucs2'], 2)
+        self.assertEqual(estimate['transliterated']['gsm7'], 2)
+
+        campaign.message_content = 'Nowa treść'
+        self.assertEqual(get_campaign_estimate(campaign), {'pending': True})
+
+        email_campaign = Campaign.objects.create(name='Email', message_content='Treść', message_type='email')
+        self.assertIsNone(get_campaign_estimate(email_campaign))
+
+
+class RenderSweepTests(TestCase):
+    """Zaległe renderowanie treści przez scheduler (render_stale_campaigns)"""
+
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name='Render', message_content='Cześć {{first_name}}',
+                                                message_type='email')
+        ingest_recipients(self.campaign, [recipient_row('Anna', 'anna@example.com')])
+
+    def set_summary(self, summary):
+        Campaign.objects.filter(pk=self.campaign.pk).update(render_summary=summary)
+
+    def test_renders_unrendered_campaign(self):
+        self.assertEqual(render_stale_campaigns(), [self.campaign.uid])
+        self.assertEqual(self.campaign.recipients.get().rendered_message, 'Cześć Anna')
+        # Kolejny przebieg nie ma nic do zrobienia
+        self.assertEqual(render_stale_campaigns(), [])
+
+    def test_skips_render_in_progress(self):
+        self.set_summary({'status': 'pending', 'since': timezone.now().isoformat()})
+        self.assertEqual(render_stale_campaigns(), [])
+        self.assertIsNone(self.campaign.recipients.get().rendered_message)
+
+    def test_takes_over_abandoned_render(self):
+        since = timezone.now() - datetime.timedelta(seconds=RENDER_STALE_SECONDS + 1)
+        self.set_summary({'status': 'pending', 'since': since.isoformat()})
+        self.assertEqual(render_stale_campaigns(), [self.campaign.uid])
+
+    def test_claim_is_compare_and_set(self):
+        first = Campaign.objects.get(pk=self.campaign.pk)
+        second = Campaign.objects.get(pk=self.campaign.pk)
+        self.assertTrue(claim_render(first))
+        self.assertFalse(claim_render(second))
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Budżety zapytań widoków statusu (sender.profiling).
+
+    Liczba zapytań nie może rosnąć z liczbą kampanii, odbiorców ani logów,
+    więc te same budżety obowiązują dla małych i dużych danych.
+    """
+
+    BUDGETS = {
+        'campaigns': 1,
+        'campaign_status': 6,
+        'campaign_status_filtered': 6,
+        'campaign_status_keyset': 6,
+        # Strona za kursorem: do jednego zapytania na segment klucza sortowania (3 pola)
+        'campaign_status_keyset_next': 8,
+        'api_campaign_status': 2,
+    }
+
+    def create_campaign(self, index, size):
+        campaign = Campaign.objects.create(name=f'Kampania {index}', message_content='Cześć {{first_name}}',
+                                           message_type='both')
+        ingest_recipients(campaign, [
+            recipient_row(f'Osoba{i}', f'osoba{index}-{i}@example.com', f'600{index:03d}{i:03d}')
+            for i in range(size)
+        ])
+        # Połowa odbiorców po wysyłce (z logami), bez wyrenderowanych treści -
+        # strona statusu bierze wtedy treść z ostatniego logu
+        body = MessageBody.store('Cześć')
+        for i, recipient in enumerate(campaign.recipients.order_by('uid')[:size // 2]):
+            recipient.status = 'sent' if i % 2 else 'failed'
+            recipient.sent_at = timezone.now()
+            recipient.save(update_fields=['status', 'sent_at'])
+            for message_type in ('email', 'sms'):
+                MessageLog.objects.create(recipient=recipient, message_type=message_type, body=body, success=bool(i % 2))
+        return campaign
+
+    def urls(self, campaign):
+        status_url = reverse('campaign_status', args=[campaign.uid])
+        return {
+            reverse('campaigns'): self.BUDGETS['campaigns'],
+            status_url: self.BUDGETS['campaign_status'],
+            f'{status_url}?status=failed&search=Osoba1': self.BUDGETS['campaign_status_filtered'],
+            # Nieprawidłowy kursor wymusza paginację kursorową od pierwszej strony
+            f'{status_url}?cursor=start': self.BUDGETS['campaign_status_keyset'],
+            reverse('api_campaign_status', args=[campaign.uid]): self.BUDGETS['api_campaign_status'],
+        }
+
+    def test_small_campaign(self):
+        campaign = self.create_campaign(0, 4)
+        assert_view_query_budgets(self.client, self.urls(campaign))
+
+    def test_budgets_do_not_grow_with_data(self):
+        for index in range(5):
+            campaign = self.create_campaign(index, 80)
+        assert_view_query_budgets(self.client, self.urls(campaign))
+
+    def test_next_keyset_page(self):
+        campaign = self.create_campaign(0, 120)
+        status_url = reverse('campaign_status', args=[campaign.uid])
+        first = self.client.get(f'{status_url}?cursor=start').context['recipients']
+        self.assertTrue(first.has_next())
+
+        with assert_max_queries(self.BUDGETS['campaign_status_keyset_next'], 'campaign_status (kolejna strona)'):
+            response = self.client.get(status_url, {'cursor': first.next_cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['recipients'].has_previous())
+
+
+class AdminChangelistTests(TestCase):
+    """Listy w adminie - liczba zapytań nie rośnie z liczbą wierszy"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'haslo'))
+        self.body = MessageBody.store('Cześć')
+
+    def add_campaigns(self, count):
+        for index in range(count):
+            campaign = Campaign.objects.create(name=f'Kampania {index}', message_content='Cześć', message_type='email')
+            ingest_recipients(campaign, [
+                recipient_row(f'Osoba{i}', f'osoba{Campaign.objects.count()}-{i}@example.com') for i in range(3)
+            ])
+            for recipient in campaign.recipients.all():
+                MessageLog.objects.create(recipient=recipient, message_type='email', body=self.body, success=True)
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(context)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        urls = [reverse(f'admin:sender_{model}_changelist') for model in ('campaign', 'recipient', 'messagelog')]
+        self.add_campaigns(1)
+        small = [self.queries(url) for url in urls]
+        self.add_campaigns(4)
+        self.assertEqual([self.queries(url) for url in urls], small)
+
+
+class MessageLogAdminSearchTests(TestCase):
+    """Wyszukiwanie logów w adminie przez indeks wyszukiwania odbiorców"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'haslo'))
+        campaign = Campaign.objects.create(name='Kampania', message_content='Cześć', message_type='email')
+        ingest_recipients(campaign, [
+            recipient_row('Anna', 'anna@example.com', last_name='Nowak'),
+            recipient_row('Jan', 'jan@example.com'),
+        ])
+        body = MessageBody.store('Cześć')
+        for recipient in campaign.recipients.all():
+            MessageLog.objects.create(recipient=recipient, message_type='email', body=body, success=True)
+
+    def search(self, term):
+        response = self.client.get(reverse('admin:sender_messagelog_changelist'), {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return {log.recipient.email for log in response.context['cl'].result_list}
+
+    def test_search_by_name_and_email(self):
+        self.assertEqual(self.search('Nowak'), {'anna@example.com'})
+        self.assertEqual(self.search('jan@example'), {'jan@example.com'})
+        self.assertEqual(self.search(''), {'anna@example.com', 'jan@example.com'})
+
+    def test_search_does_not_scan_joined_columns(self):
+        with self.assertNumQueries(1) as context:
+            list(MessageLogAdmin(MessageLog, site).get_search_results(None, MessageLog.objects.all(), 'Nowak')[0])
+        sql = context.captured_queries[0]['sql']
+        self.assertIn('sender_contact_fts', sql)
+        self.assertNotIn('LIKE', sql)
+
+
+class MetricsTests(TestCase):
+    """Metryki procesu (liczniki i histogramy z shardami wątków) i endpoint /metrics"""
+
+    def test_counter_from_many_threads(self):
+        counter = Counter('test_total', 'Test', ['kind'])
+
+        def work():
+            for _ in range(1000):
+                counter.inc(kind='a')
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        gc.collect()
+
+        self.assertEqual(counter.value(kind='a'), 8000)
+        # Shardy zakończonych wątków są doliczone do bazy i usunięte
+        self.assertEqual(counter._shards, {})
+        self.assertEqual(counter.expose()[-1], 'test_total{kind="a"} 8000')
+        with self.assertRaises(ValueError):
+            counter.inc(other='a')
+
+    def test_histogram_exposition(self):
+        histogram = Histogram('test_seconds', 'Test', ['stage'], buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(value, stage='render')
+        self.assertEqual(histogram.expose()[2:], [
+            'test_seconds_bucket{stage="render",le="0.1"} 1',
+            'test_seconds_bucket{stage="render",le="1.0"} 3',
+            'test_seconds_bucket{stage="render",le="+Inf"} 4',
+            'test_seconds_sum{stage="render"} 4.05',
+            'test_seconds_count{stage="render"} 4',
+        ])
+
+    def test_endpoint(self):
+        campaign = Campaign.objects.create(name='Kolejka', message_content='x', message_type='sms')
+        ingest_recipients(campaign, [recipient_row('Anna', phone='600100200')])
+        campaign.transition_to('queued')
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE sender_provider_request_seconds histogram', body)
+        self.assertIn('sender_queue_depth 1\n', body)
+        self.assertIn('sender_campaigns{status="queued"} 1\n', body)
+
+        with self.settings(METRICS_TOKEN='sekret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer sekret')
+            self.assertEqual(response.status_code, 200)
+
+
+class PipelineBenchmarkTests(TestCase):
+    """Benchmark potoku import → render → wysyłka (benchmark_pipeline)"""
+
+    def test_small_run_reports_every_stage_and_rolls_back(self):
+        out = StringIO()
+        call_command('benchmark_pipeline', sizes='40', smtp_sink=True, stdout=out, stderr=StringIO())
+        run, = json.loads(out.getvalue())['runs']
+
+        self.assertEqual((run['created'], run['dispatched']), (40, 40))
+        self.assertEqual(set(run['stages']), {
+            'excel_write', 'excel_parse', 'mapping', 'validation', 'ingestion', 'render', 'dispatch',
+            'status_aggregation',
+        })
+        self.assertEqual({view['status_code'] for view in run['views'].values()}, {200})
+        self.assertFalse(Campaign.objects.exists())
+
+
+class SQLiteProfileTests(TestCase):
+    """Profil połączeń SQLite (SQLITE_PRAGMAS i timeout blokady)"""
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_lock_wait_comes_from_timeout_option(self):
+        timeout = settings.DATABASES['default']['OPTIONS']['timeout']
+        self.assertNotIn('busy_timeout', settings.SQLITE_PRAGMAS)
+        self.assertEqual(self.pragma('busy_timeout'), timeout * 1000)
+
+    def test_pragmas_applied_on_connect(self):
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('temp_store'), 2)  # MEMORY
+        self.assertEqual(self.pragma('cache_size'), settings.SQLITE_PRAGMAS['cache_size'])
+
+    def test_writer_router(self):
+        router = WriterRouter()
+        writer = mock.Mock(in_atomic_block=False)
+        with mock.patch('sender.routers.connections', {'writer': writer}):
+            self.assertEqual(router.db_for_write(Recipient), 'writer')
+            self.assertEqual(router.db_for_read(Recipient), 'default')
+            # Odczyt w transakcji zapisu widzi jej niezatwierdzone zmiany
+            writer.in_atomic_block = True
+            self.assertEqual(router.db_for_read(Recipient), 'writer')
+        self.assertFalse(router.allow_migrate('writer', 'sender'))
+
+
+class StubProvider:
+    """Provider zwracający kolejne wyniki z listy (ostatni powtarzany)"""
+
+    def __init__(self, *results, delay=0):
+        self.results = list(results) or [(True, None, {})]
+        self.delay = delay
+        self.calls = 0
+
+    def send(self, *args):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        result = self.results[min(self.calls, len(self.results)) - 1]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class MockProviderTests(TestCase):
+    """Konfigurowalne mocki providerów i lokalny serwer SMTP (sink)"""
+
+    def outcomes(self, **options):
+        provider = MockSMSProvider(latency=0, failures={'network': 0.3, 'invalid': 0.1}, **options)
+        return [provider.send('600100200', 'x')[:2] for _ in range(50)]
+
+    def test_same_seed_gives_same_results(self):
+        self.assertEqual(self.outcomes(seed=7), self.outcomes(seed=7))
+        self.assertNotEqual(self.outcomes(seed=7), self.outcomes(seed=8))
+
+    def test_zero_latency_does_not_sleep(self):
+        provider = MockEmailProvider(latency={'distribution': 'none'}, failures={})
+        with mock.patch('sender.services.time.sleep') as sleep:
+            for _ in range(20):
+                self.assertTrue(provider.send('anna@example.com', 'Temat', 'x')[0])
+        sleep.assert_not_called()
+
+    def test_failure_profiles(self):
+        provider = MockSMSProvider(latency=0, failures={'network': 0.5, 'invalid': 0.5}, seed=1)
+        results = [provider.send('600100200', 'x') for _ in range(40)]
+        self.assertFalse(any(success for success, _, _ in results))
+        errors = {error: details for _, error, details in results}
+        self.assertEqual(errors, {
+            MockSMSProvider.ERRORS['network']: {},
+            MockSMSProvider.ERRORS['invalid']: {'permanent': True},
+        })
+        with self.assertRaises(ValueError):
+            MockSMSProvider(failures={'timeout': 0.1})
+
+    def test_throttle_rejects_over_burst(self):
+        provider = MockSMSProvider(latency=0, failures={}, throttle={'rate': 1, 'burst': 2})
+        results = [provider.send('600100200', 'x') for _ in range(3)]
+        self.assertEqual([success for success, _, _ in results], [True, True, False])
+        self.assertIn('throttling', results[2][1])
+
+    def test_django_provider_against_smtp_sink(self):
+        sink = SMTPSink(port=0)
+        sink.start()
+        self.addCleanup(sink.server_close)
+        self.addCleanup(sink.shutdown)
+        provider = DjangoEmailProvider(
+            backend='django.core.mail.backends.smtp.EmailBackend', host='127.0.0.1', port=sink.port, use_tls=False,
+        )
+        for _ in range(3):
+            success, error, details = provider.send('anna@example.com', 'Temat', 'Treść')
+            self.assertTrue(success, error)
+        provider.connection.close()
+        self.assertEqual((sink.messages, sink.recipients), (3, 3))
+        self.assertTrue(details['message_id'])
+
+
+class ProviderRegistryTests(TestCase):
+    """Providery budowane z konfiguracji w bazie i trzymane w cache (ProviderRegistry)"""
+
+    def setUp(self):
+        self.registry = ProviderRegistry()
+        self.config = SMSProvider.objects.create(
+            name='Mock', class_name='MockSMSProvider', config={'seed': 7, 'weight': 3, 'timeout': 2},
+        )
+
+    def test_providers_are_cached_until_config_changes(self):
+        (config, provider), = self.registry.get_providers('sms')
+        self.assertIsInstance(provider, MockSMSProvider)
+        # Klucze puli (weight, timeout) nie trafiają do konstruktora - inaczej TypeError i brak providera
+        self.assertEqual(config.name, 'Mock')
+
+        with self.assertNumQueries(1):
+            self.assertIs(self.registry.get_providers('sms')[0][1], provider)
+
+        self.config.config = {'seed': 8}
+        self.config.save()
+        self.assertIsNot(self.registry.get_providers('sms')[0][1], provider)
+
+    def test_pool_uses_pool_options(self):
+        pool = self.registry.get_pool('sms')
+        member, = pool.members
+        self.assertEqual((member.name, member.weight, member.timeout), ('Mock', 3.0, 2))
+        self.assertIs(self.registry.get_pool('sms'), pool)
+
+    def test_broken_provider_is_skipped(self):
+        SMSProvider.objects.create(name='Zepsuty', class_name='sender.services.NieMaTakiej')
+        with self.assertLogs('sender.registry', 'ERROR'):
+            providers = self.registry.get_providers('sms')
+        self.assertEqual([config.name for config, _ in providers], ['Mock'])
+
+    def test_resolve_provider_class(self):
+        self.assertIs(resolve_provider_class('MockSMSProvider'), MockSMSProvider)
+        self.assertIs(resolve_provider_class('sender.services.MockSMSProvider'), MockSMSProvider)
+
+
+class ProviderPoolTests(TestCase):
+    """Rozkład ruchu między providerów według wag i kondycji"""
+
+    def pool(self, *weights):
+        return ProviderPool([PooledProvider(f'p{i}', StubProvider(), weight=weight) for i, weight in enumerate(weights)])
+
+    def test_traffic_follows_weights(self):
+        pool = self.pool(3, 1)
+        with mock.patch('sender.balancing.random.choices', random.Random(1).choices):
+            for _ in range(2000):
+                pool.send('600100200', 'x')
+        heavy, light = (member.provider.calls for member in pool.members)
+        self.assertAlmostEqual(heavy / (heavy + light), 0.75, delta=0.05)
+
+    def test_zero_weight_provider_is_left_out(self):
+        self.assertEqual(len(self.pool(1, 0)), 1)
+
+    def test_unhealthy_provider_gets_probe_share(self):
+        pool = self.pool(1, 1)
+        healthy, failing = pool.members
+        for _ in range(10):
+            healthy.health.record(True, 0.1)
+            failing.health.record(False, 0.1)
+        self.assertFalse(failing.health.is_healthy)
+        self.assertEqual(pool.effective_weights(pool.members), [1.0, PROBE_SHARE])
+
+    def test_slower_provider_gets_less_traffic(self):
+        pool = self.pool(1, 1)
+        fast, slow = pool.members
+        fast.health.record(True, 0.1)
+        slow.health.record(True, 0.4)
+        self.assertEqual(pool.effective_weights(pool.members), [1.0, 0.25])
+        self.assertEqual([row['effective_weight'] for row in pool.stats()], [1.0, 0.25])
+
+    def test_all_unhealthy_keep_relative_weights(self):
+        # Bez zdrowej alternatywy nie ma dokąd przełączyć ruchu - wagi maleją, ale proporcje zostają
+        pool = self.pool(2, 1)
+        for member in pool.members:
+            member.health.record(False, 0.1)
+        first, second = pool.effective_weights(pool.members)
+        self.assertAlmostEqual(first / second, 2.0)
+
+
+class CircuitBreakerTests(TestCase):
+    """Obwód providera i limity czasu wywołań"""
+
+    def test_opens_after_threshold_and_recovers(self):
+        with mock.patch('sender.balancing.time.monotonic', return_value=100.0) as clock:
+            breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+            breaker.record(False)
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+            breaker.record(False)
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+            self.assertFalse(breaker.allow())
+
+            # Po reset_timeout jedno wywołanie próbne
+            clock.return_value = 130.0
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+            breaker.record(False)
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+            clock.return_value = 160.0
+            self.assertTrue(breaker.allow())
+            breaker.record(True)
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_explicit_values_are_kept(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.5)
+        self.assertEqual((breaker.failure_threshold, breaker.reset_timeout), (1, 0.5))
+        self.assertEqual(PooledProvider('stub', StubProvider(), timeout=0.25).timeout, 0.25)
+
+    def test_open_circuit_pauses_pool(self):
+        pool = ProviderPool([PooledProvider('stub', StubProvider((False, 'awaria', {})), failure_threshold=2)])
+        pool.send('600100200', 'x')
+        pool.send('600100200', 'x')
+        self.assertFalse(pool.is_available())
+        with self.assertRaises(ProvidersUnavailable):
+            pool.send('600100200', 'x')
+
+    def test_failover_to_next_provider(self):
+        broken = StubProvider((False, 'awaria', {}))
+        working = StubProvider((True, None, {'message_id': '1'}))
+        pool = ProviderPool([PooledProvider('broken', broken, weight=1000), PooledProvider('working', working, weight=0.001)])
+        with mock.patch('sender.balancing.random.choices', side_effect=lambda candidates, weights: [candidates[0]]):
+            success, error, telemetry = pool.send('600100200', 'x')
+        self.assertTrue(success)
+        self.assertEqual((telemetry['provider'], telemetry['attempt'], telemetry['message_id']), ('working', 2, '1'))
+
+    def test_permanent_error_is_not_retried(self):
+        first = StubProvider((False, 'Nieprawidłowy numer', {'permanent': True}))
+        second = StubProvider()
+        pool = ProviderPool([PooledProvider('first', first), PooledProvider('second', second, weight=0.001)])
+        with mock.patch('sender.balancing.random.choices', side_effect=lambda candidates, weights: [candidates[0]]):
+            success, _, telemetry = pool.send('600100200', 'x')
+        self.assertFalse(success)
+        self.assertTrue(telemetry['permanent'])
+        self.assertEqual(second.calls, 0)
+        self.assertEqual(pool.members[0].breaker.failures, 0)
+
+    def test_socket_timeout_of_provider(self):
+        provider = MockSMSProvider(latency=5, failures={})
+        pool = ProviderPool([PooledProvider('mock', provider, timeout=0.05)])
+        started = time.monotonic()
+        success, error, telemetry = pool.send('600100200', 'x')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertFalse(success)
+        self.assertTrue(telemetry['timed_out'])
+
+    def test_hung_calls_make_provider_unavailable(self):
+        member = PooledProvider('slow', StubProvider(delay=0.3), timeout=0.02)
+        pool = ProviderPool([member])
+        for _ in range(MAX_HUNG_CALLS):
+            success, _, telemetry = pool.send('600100200', 'x')
+            self.assertTrue(telemetry['timed_out'])
+        self.assertFalse(pool.is_available())
+
+        # Zawieszone wywołania w końcu wracają i zwalniają providera
+        deadline = time.monotonic() + 5
+        while not member.is_available() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertTrue(member.is_available())
+
+    def test_config_validation(self):
+        for config in ({'timeout': 0}, {'reset_timeout': -1}, {'failure_threshold': 0}, {'weight': -1}, {'timeout': True}):
+            with self.subTest(config=config), self.assertRaises(ValidationError):
+                SMSProvider(name='test', class_name='MockSMSProvider', config=config).clean()
+        SMSProvider(name='test', class_name='MockSMSProvider', config={'weight': 0, 'timeout': 0.5}).clean()
+
+
+class ChannelStub(StubProvider):
+    """StubProvider w miejscu puli providerów MessageSender (także asend)"""
+
+    def is_available(self):
+        return True
+
+    async def asend(self, *args):
+        return self.send(*args)
+
+
+class SchedulerTests(TestCase):
+    """Okno wysyłki i rozłożenie kampanii w czasie (scheduler)"""
+
+    def setUp(self):
+        self.tz = get_campaign_timezone()
+        self.campaign = Campaign.objects.create(
+            name='Zaplanowana', message_content='Cześć {{first_name}}', message_type='sms',
+            scheduled_at=self.at(1, 9), send_window_start=datetime.time(9), send_window_end=datetime.time(20),
+            spread_minutes=100,
+        )
+        ingest_recipients(self.campaign, [recipient_row(f'Osoba{i}', phone=f'6001002{i:02d}') for i in range(10)])
+        self.campaign.transition_to('queued')
+        self.sms = ChannelStub()
+        self.sender = MessageSender(sms_provider=self.sms, email_provider=ChannelStub())
+
+    def at(self, day, hour, minute=0):
+        return datetime.datetime(2026, 3, day, hour, minute, tzinfo=self.tz)
+
+    def test_window(self):
+        self.assertFalse(is_in_window(self.campaign, self.at(1, 8, 59)))
+        self.assertTrue(is_in_window(self.campaign, self.at(1, 9)))
+        self.assertFalse(is_in_window(self.campaign, self.at(1, 20)))
+
+    def test_window_over_midnight(self):
+        campaign = Campaign(send_window_start=datetime.time(22), send_window_end=datetime.time(6))
+        self.assertTrue(is_in_window(campaign, self.at(1, 23)))
+        self.assertTrue(is_in_window(campaign, self.at(2, 5)))
+        self.assertFalse(is_in_window(campaign, self.at(2, 12)))
+
+    def test_spread_counts_only_time_in_window(self):
+        self.assertEqual(active_seconds(self.campaign, self.at(1, 19), self.at(2, 10)), 2 * 3600)
+        self.assertEqual(release_quota(self.campaign, self.at(1, 9, 50), 10), 5)
+        # Noc nie przybliża końca rozłożenia
+        self.assertEqual(release_quota(self.campaign, self.at(1, 19, 30), 10), 10)
+        self.campaign.scheduled_at = self.at(1, 19, 30)
+        self.assertEqual(release_quota(self.campaign, self.at(2, 9, 20), 10), 5)
+
+    def test_tick_releases_recipients_gradually(self):
+        self.assertEqual(run_scheduler_tick(self.sender, now=self.at(1, 8)), {})
+
+        released = run_scheduler_tick(self.sender, now=self.at(1, 9, 30))
+        self.assertEqual(released[self.campaign.uid]['sent'], 3)
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.status, 'queued')
+
+        # Ta sama chwila - porcja już wypuszczona
+        self.assertEqual(run_scheduler_tick(self.sender, now=self.at(1, 9, 30)), {})
+        # Poza oknem nic nie wychodzi
+        self.assertEqual(run_scheduler_tick(self.sender, now=self.at(1, 21)), {})
+
+        released = run_scheduler_tick(self.sender, now=self.at(2, 10), batch_size=4)
+        self.assertEqual(released[self.campaign.uid]['sent'], 4)
+        run_scheduler_tick(self.sender, now=self.at(2, 10))
+
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.status, 'completed')
+        self.assertEqual(self.sms.calls, 10)
+
+
+class DeliveryStatsTests(TestCase):
+    """Telemetria wysyłki: provider_response wiadomości i rollup kampanii"""
+
+    start = datetime.datetime(2026, 3, 2, 9, tzinfo=datetime.timezone.utc)
+
+    def record(self, stats, latencies, minute=0):
+        for index, latency in enumerate(latencies):
+            at = self.start + datetime.timedelta(minutes=minute + index)
+            stats.record(at, latency < 1000, {'provider': 'mock', 'latency_ms': latency, 'attempt': 1, 'points': 0.16})
+
+    def test_percentiles_from_histogram(self):
+        stats = DeliveryStats()
+        self.record(stats, [5] * 50 + [120] * 25 + [240] * 25)
+        summary = stats.as_dict()
+        self.assertEqual(summary['percentiles']['p50'], 10.0)
+        self.assertEqual(summary['percentiles']['p90'], 220.0)
+        self.assertEqual(summary['latency_max_ms'], 240)
+        self.assertEqual(summary['points'], 16.0)
+
+    def test_merge_equals_single_rollup(self):
+        latencies = [5, 80, 1200, 30] * 10
+        whole = DeliveryStats()
+        self.record(whole, latencies)
+        first, second = DeliveryStats(), DeliveryStats()
+        self.record(first, latencies[:15])
+        self.record(second, latencies[15:], minute=15)
+        merged = DeliveryStats(first.as_dict())
+        merged.merge(second)
+        self.assertEqual(merged.as_dict(), whole.as_dict())
+        self.assertEqual(whole.providers, {'mock': {'messages': 40, 'failed': 10}})
+
+    def test_timeline_is_bounded(self):
+        stats = DeliveryStats()
+        self.record(stats, [50] * (TIMELINE_MAX_BUCKETS + 60))
+        self.assertEqual(stats.bucket_seconds, 2 * TIMELINE_BUCKET_SECONDS)
+        self.assertLessEqual(len(stats.timeline), TIMELINE_MAX_BUCKETS)
+        self.assertEqual(sum(sent for sent, _, _, _ in stats.timeline.values()), TIMELINE_MAX_BUCKETS + 60)
+
+    def test_dispatch_stores_telemetry(self):
+        campaign = Campaign.objects.create(name='Telemetria', message_content='x', message_type='sms')
+        ingest_recipients(campaign, [recipient_row('Anna', phone='600100200'), recipient_row('Jan', phone='600100201')])
+        campaign.transition_to('queued')
+        campaign.transition_to('sending')
+        pool = ProviderPool([PooledProvider('mock', MockSMSProvider(latency=0, failures={}, points=0.16))])
+        sender = MessageSender(sms_provider=pool, email_provider=ChannelStub())
+        dispatch_recipients(campaign, campaign.recipients.select_related('contact').order_by('uid'), sender)
+
+        for response in MessageLog.objects.values_list('provider_response', flat=True):
+            self.assertEqual((response['provider'], response['attempt'], response['points']), ('mock', 1, 0.16))
+            self.assertTrue(response['message_id'].startswith('mock-'))
+            self.assertIn('latency_ms', response)
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.delivery_stats['messages'], 2)
+        self.assertEqual(campaign.delivery_stats['points'], 0.32)
+        self.assertEqual(campaign.delivery_stats['providers'], {'mock': {'messages': 2, 'failed': 0}})
+
+
+class AsyncDispatchTests(TestCase):
+    """Wysyłka równoległa w jednej pętli zdarzeń i asynchroniczne widoki statusu"""
+
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name='Równoległa', message_content='Cześć {{first_name}}',
+                                                message_type='sms')
+        ingest_recipients(self.campaign, [recipient_row(f'Osoba{i}', phone=f'6001002{i:02d}') for i in range(6)])
+        self.campaign.transition_to('queued')
+
+    def test_concurrent_dispatch_saves_every_outcome(self):
+        failed = (False, 'awaria', {})
+        sms = ChannelStub((True, None, {}), failed, (True, None, {}), failed, (True, None, {}))
+        self.campaign.transition_to('sending')
+        recipients = self.campaign.recipients.select_related('contact').order_by('uid')
+        with mock.patch('sender.dispatch.DISPATCH_CONCURRENCY', 4):
+            results, paused = dispatch_recipients(
+                self.campaign, recipients, MessageSender(sms_provider=sms, email_provider=ChannelStub()),
+            )
+
+        self.assertIsNone(paused)
+        self.assertEqual((results['sent'], results['failed']), (4, 2))
+        self.assertEqual(sms.calls, 6)
+        self.assertEqual(MessageLog.objects.filter(recipient__campaign=self.campaign).count(), 6)
+        self.assertFalse(self.campaign.recipients.filter(status='pending').exists())
+
+    async def test_async_status_views(self):
+        response = await self.async_client.get(reverse('api_campaign_status', args=[self.campaign.uid]))
+        data = json.loads(response.content)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['stats']['pending'], 6)
+        self.assertEqual(data['campaign']['status'], 'queued')
+
+        response = await self.async_client.get(reverse('campaigns'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['global_stats']['total_recipients'], 6)
+
+
+class PartialDispatchTests(TestCase):
+    """Wstrzymanie wysyłki w połowie odbiorcy kampanii 'both'"""
+
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name='Oba kanały', message_content='Cześć {{first_name}}',
+                                                message_type='both')
+        ingest_recipients(self.campaign, [
+            recipient_row('Anna', 'anna@example.com', '600100200'),
+            recipient_row('Jan', 'jan@example.com', '600100201'),
+        ])
+        self.campaign.transition_to('queued')
+        self.campaign.transition_to('sending')
+
+    def dispatch(self, email, sms):
+        recipients = self.campaign.recipients.filter(status='pending').select_related('contact').order_by('uid')
+        return dispatch_recipients(self.campaign, recipients, MessageSender(sms_provider=sms, email_provider=email))
+
+    def check_resume(self, paused_recipients):
+        email = ChannelStub()
+        sms = ChannelStub(ProvidersUnavailable('Wszyscy providerzy niedostępni'))
+        results, paused = self.dispatch(email, sms)
+
+        self.assertTrue(paused)
+        self.assertEqual(results['sent'], 0)
+        partial = self.campaign.recipients.filter(message_logs__isnull=False)
+        self.assertEqual(partial.count(), paused_recipients)
+        for recipient in partial:
+            self.assertEqual(recipient.status, 'pending')
+            self.assertIsNotNone(recipient.sent_at)
+            self.assertEqual(list(recipient.message_logs.values_list('message_type', 'success')), [('email', True)])
+
+        # Wznowienie: email nie wychodzi drugi raz do odbiorców, którzy już go dostali
+        resumed_email = ChannelStub()
+        results, paused = self.dispatch(resumed_email, ChannelStub())
+        self.assertIsNone(paused)
+        self.assertEqual(results['sent'], 2)
+        self.assertEqual(resumed_email.calls, 2 - paused_recipients)
+        for recipient in self.campaign.recipients.all():
+            self.assertEqual(recipient.status, 'sent')
+            self.assertEqual(
+                sorted(recipient.message_logs.values_list('message_type', flat=True)), ['email', 'sms'],
+            )
+
+    def test_sequential_dispatch_keeps_only_missing_channel_pending(self):
+        self.check_resume(paused_recipients=1)
+
+    def test_concurrent_dispatch_keeps_only_missing_channel_pending(self):
+        with mock.patch('sender.dispatch.DISPATCH_CONCURRENCY', 4):
+            self.check_resume(paused_recipients=2)
+
+class LazyImportTests(TestCase):
+    """pandas ładowane dopiero przy parsowaniu arkusza, nie przy starcie procesu"""
+
+    def test_worker_start_skips_heavy_modules(self):
+        command = benchmark_startup.Command()
+        for name, script in benchmark_startup.STAGE_SCRIPTS.items():
+            code = f'{script}\n{benchmark_startup.STAGE_FOOTER.format(modules=benchmark_startup.HEAVY_MODULES)}'
+            _, stdout, _ = command._python(['-c', code])
+            with self.subTest(stage=name):
+                self.assertEqual(stdout.strip().splitlines()[-1], '[]')
 
-# Create your tests here.
+    def test_read_workbook(self):
+        buffer = BytesIO()
+        pandas().DataFrame({'first_name': ['Anna', None], 'phone': ['600100200', '600100201']}).to_excel(
+            buffer, index=False,
+        )
+        buffer.seek(0)
+        parsed = ROWS_PARSED.value()
+        frame = read_workbook(buffer)
+        self.assertEqual(ROWS_PARSED.value() - parsed, 2)
+        self.assertEqual(sample_rows(frame), [
+            {'first_name': 'Anna', 'phone': '600100200'},
+            {'first_name': '', 'phone': '600100201'},
+        ])
@@ -8,6 +8,7 @@ urlpatterns = [
     path('template/', views.template, name='template'),
     path('campaign-status/<uuid:campaign_id>/', views.campaign_status, name='campaign_status'),
     path('edit-campaign/<uuid:campaign_id>/', views.edit_campaign, name='edit_campaign'),
+    path('export-campaign/<uuid:campaign_id>/', views.export_campaign, name='export_campaign'),
     
     # AJAX endpoints
     path('upload-excel/', views.upload_excel, name='upload_excel'),
@@ -15,7 +16,12 @@ urlpatterns = [
     path('send-campaign/<uuid:campaign_id>/', views.send_campaign, name='send_campaign'),
     path('delete-campaign/<uuid:campaign_id>/', views.delete_campaign, name='delete_campaign'),
     path('duplicate-campaign/<uuid:campaign_id>/', views.duplicate_campaign, name='duplicate_campaign'),
+    path('update-recipients/<uuid:campaign_id>/', views.update_recipients, name='update_recipients'),
     
     # API endpoints
     path('api/campaign-status/<uuid:campaign_id>/', views.api_campaign_status, name='api_campaign_status'),
+    
+    # Monitoring
+    path('metrics', views.metrics, name='metrics'),
+    path('query-profile/', views.query_profile, name='query_profile'),
 ]
\ No newline at end of file
@@ -1,48 +1,62 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.core.paginator import Paginator
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_time
+from django.db import router, transaction
 from django.db.models import Count, Q
 from django.contrib import messages
-import pandas as pd
+from django.conf import settings
 import json
-import re
 from datetime import datetime
 import logging
-from .models import Campaign, Recipient, MessageLog
+from .models import Campaign, Recipient, MessageBody, MessageLog
+from .archive import read_archived_messages
+from .exports import aiter_chunks, export_rows, stream_csv, stream_xlsx
+from .importing import INGEST_BATCH_SIZE, map_columns, iter_recipient_rows, ingest_recipients, reimport_recipients
+from .metrics import REGISTRY
+from .pagination import KeysetPaginator
+from .rendering import content_digest, render_campaign, render_message, schedule_estimate, schedule_render
+from . import profiling
+from .scheduling import get_campaign_timezone
+from .segmentation import get_campaign_estimate, is_estimate_current, refresh_campaign_estimate
+from .spreadsheets import read_workbook, sample_rows
+from .search import search_recipients
+from .dispatch import dispatch_recipients, finish_sending
 from .services import MessageSender
 
 logger = logging.getLogger(__name__)
 
+RECIPIENTS_PER_PAGE = 50
+# Kolejność z indeksu recipient_campaign_order_idx: wysłani od najnowszych, dalej po nazwisku i imieniu
+RECIPIENTS_ORDERING = ['-sent_at', 'sort_name', 'uid']
+
+# Od tylu odbiorców lista na stronie statusu używa paginacji kursorowej
+KEYSET_PAGINATION_THRESHOLD = getattr(settings, 'RECIPIENTS_KEYSET_PAGINATION_THRESHOLD', 10000)
+
 
 def upload_view(request):
     """Główny widok do tworzenia nowej kampanii"""
     return render(request, 'sender/upload.html')
 
 
-def campaigns_view(request):
-    """Widok listy wszystkich kampanii"""
-    campaigns = Campaign.objects.all().order_by('-created_at')
-    
-    # Dodaj statystyki do każdej kampanii
-    for campaign in campaigns:
-        # Oblicz statystyki
-        recipients = campaign.recipients.all()
-        campaign.total_recipients = recipients.count()
-        campaign.sent_count = recipients.filter(status='sent').count()
-        campaign.failed_count = recipients.filter(status='failed').count()
-        campaign.pending_count = recipients.filter(status='pending').count()
-        
-        # Sprawdź czy kampania jest zakończona
-        if campaign.pending_count == 0 and campaign.total_recipients > 0:
-            if not campaign.is_completed:
-                campaign.is_completed = True
-                campaign.save()
+async def campaigns_view(request):
+    """Widok listy wszystkich kampanii (async - ORM przez async API, bez wątku na żądanie)"""
+    # Statystyki odbiorców liczone jednym zapytaniem z agregacją zamiast czterech na kampanię
+    campaigns = [
+        campaign async for campaign in Campaign.objects.annotate(
+            total_recipients=Count('recipients'),
+            sent_count=Count('recipients', filter=Q(recipients__status='sent')),
+            failed_count=Count('recipients', filter=Q(recipients__status='failed')),
+            pending_count=Count('recipients', filter=Q(recipients__status='pending')),
+        ).order_by('-created_at')
+    ]
     
     # Oblicz globalne statystyki
-    total_campaigns = campaigns.count()
+    total_campaigns = len(campaigns)
     completed_campaigns = sum(1 for campaign in campaigns if campaign.is_completed)
     pending_campaigns = total_campaigns - completed_campaigns
     total_recipients_all = sum(campaign.total_recipients for campaign in campaigns)
@@ -68,8 +82,17 @@ def campaign_status(request, campaign_id):
     """Szczegółowy widok statusu kampanii"""
     campaign = get_object_or_404(Campaign, uid=campaign_id)
     
-    # Pobierz odbiorców z paginacją
-    recipients_list = campaign.recipients.all().order_by('-sent_at', 'last_name', 'first_name')
+    # Statystyki - jednym zapytaniem, jak w api_campaign_status
+    stats = campaign.recipients.aggregate(
+        total=Count('uid'),
+        sent=Count('uid', filter=Q(status='sent')),
+        failed=Count('uid', filter=Q(status='failed')),
+        pending=Count('uid', filter=Q(status='pending')),
+        skipped=Count('uid', filter=Q(status='skipped')),
+    )
+    
+    # Pobierz odbiorców z paginacją (uid na końcu - jednoznaczna kolejność dla kursorów)
+    recipients_list = campaign.recipients.select_related('contact').order_by(*RECIPIENTS_ORDERING)
     
     # Filtrowanie
     status_filter = request.GET.get('status')
@@ -79,67 +102,152 @@ def campaign_status(request, campaign_id):
         recipients_list = recipients_list.filter(status=status_filter)
     
     if search_query:
-        recipients_list = recipients_list.filter(
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(email__icontains=search_query) |
-            Q(phone__icontains=search_query)
-        )
+        recipients_list = search_recipients(recipients_list, search_query)
+    
+    # Paginacja - dla dużych kampanii kursorowa (bez COUNT(*) i OFFSET)
+    cursor = request.GET.get('cursor')
+    if cursor or stats['total'] >= KEYSET_PAGINATION_THRESHOLD:
+        pagination_mode = 'keyset'
+        paginator = KeysetPaginator(recipients_list, RECIPIENTS_PER_PAGE, RECIPIENTS_ORDERING)
+        recipients = paginator.get_page(cursor)
+    else:
+        pagination_mode = 'pages'
+        paginator = Paginator(recipients_list, RECIPIENTS_PER_PAGE)
+        page_number = request.GET.get('page')
+        recipients = paginator.get_page(page_number)
     
-    # Paginacja
-    paginator = Paginator(recipients_list, 50)  # 50 odbiorców na stronę
-    page_number = request.GET.get('page')
-    recipients = paginator.get_page(page_number)
+    # Treści z archiwum logów - tylko na żądanie, bo wymagają odczytu plików
+    has_archive = campaign.log_archives.exists()
+    show_archived = has_archive and request.GET.get('archived') == '1'
+    archived_messages = {}
+    if show_archived:
+        archived_messages = read_archived_messages(campaign, [recipient.uid for recipient in recipients])
     
     # Dodaj spersonalizowane wiadomości dla każdego odbiorcy
+    digest = content_digest(campaign.message_content)
+    stale = [
+        recipient.uid for recipient in recipients
+        if recipient.rendered_digest != digest or recipient.rendered_message is None
+    ]
+    # Ostatnie logi odbiorców bez aktualnej treści - jednym zapytaniem dla całej strony
+    last_logs = {}
+    if stale:
+        logs = MessageLog.objects.filter(recipient_id__in=stale).select_related('body').order_by('recipient_id', '-sent_at')
+        for message_log in logs:
+            last_logs.setdefault(message_log.recipient_id, message_log)
+    
     for recipient in recipients:
-        # Sprawdź czy istnieje log wiadomości z finalną treścią
-        message_log = recipient.message_logs.first()
+        if recipient.rendered_digest == digest and recipient.rendered_message is not None:
+            # Treść wyrenderowana z góry - ta sama, którą wysyła dispatcher
+            recipient.personalized_message = recipient.rendered_message
+            continue
+        
+        # Log wiadomości z finalną treścią (już wysłanej)
+        message_log = last_logs.get(recipient.uid)
         
         if message_log and message_log.final_message:
             # Użyj finalnej wiadomości z logu (już wysłanej)
             recipient.personalized_message = message_log.final_message
+        elif str(recipient.uid) in archived_messages:
+            # Wiadomość przeniesiona do archiwum
+            recipient.personalized_message = archived_messages[str(recipient.uid)]
         else:
-            # Wygeneruj wiadomość z podstawionymi zmiennymi
-            variables = recipient.get_message_variables()
-            
-            personalized_message = campaign.message_content
-            for var_name, var_value in variables.items():
-                if var_value:
-                    personalized_message = personalized_message.replace(
-                        f'{{{{{var_name}}}}}', 
-                        str(var_value)
-                    )
-            
-            recipient.personalized_message = personalized_message
-    
-    # Statystyki
-    all_recipients = campaign.recipients.all()
-    stats = {
-        'total': all_recipients.count(),
-        'sent': all_recipients.filter(status='sent').count(),
-        'failed': all_recipients.filter(status='failed').count(),
-        'pending': all_recipients.filter(status='pending').count(),
-        'skipped': all_recipients.filter(status='skipped').count(),
-    }
-    
-    # Sprawdź czy kampania jest zakończona
-    if stats['pending'] == 0 and stats['total'] > 0 and not campaign.is_completed:
-        campaign.is_completed = True
-        campaign.save()
+            # Treść jeszcze nie wyrenderowana (np. renderowanie w tle po edycji)
+            recipient.personalized_message = render_message(
+                campaign.message_content, recipient.get_message_variables()
+            )
     
     context = {
         'campaign': campaign,
         'recipients': recipients,
-        'stats': stats
+        'pagination_mode': pagination_mode,
+        'has_archive': has_archive,
+        'show_archived': show_archived,
+        'stats': stats,
+        # Szacunek części i kosztu SMS - tylko przed zakończeniem wysyłki
+        'sms_estimate': None if campaign.is_completed else get_campaign_estimate(campaign),
     }
     
     return render(request, 'sender/campaign_status.html', context)
 
 
+def export_campaign(request, campaign_id):
+    """
+    Eksport wyników kampanii do CSV lub XLSX - oba strumieniowo, w stałej pamięci.
+    
+    Pod ASGI odpowiedź dostaje iterator asynchroniczny - synchroniczny Django
+    odczytałby tam w całości przed wysłaniem pierwszego bajtu.
+    """
+    campaign = get_object_or_404(Campaign, uid=campaign_id)
+    
+    export_format = request.GET.get('format', 'csv')
+    rows = export_rows(campaign, status=request.GET.get('status') or None)
+    filename = f"kampania-{campaign.uid}"
+    
+    def stream(chunks):
+        return aiter_chunks(chunks) if isinstance(request, ASGIRequest) else chunks
+    
+    if export_format == 'csv':
+        response = StreamingHttpResponse(stream(stream_csv(rows)), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+        return response
+    
+    if export_format == 'xlsx':
+        response = StreamingHttpResponse(
+            stream(stream_xlsx(rows)),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}.xlsx"'
+        return response
+    
+    return JsonResponse({'success': False, 'error': 'Nieprawidłowy format eksportu'}, status=400)
+
+
+def _parse_schedule(data):
+    """
+    Odczytuje pola planowania z formularza edycji kampanii.
+    
+    Raises:
+        ValueError: z komunikatem dla użytkownika, gdy pola są niepoprawne
+    """
+    schedule = {'scheduled_at': None, 'send_window_start': None, 'send_window_end': None, 'spread_minutes': None}
+    
+    if data.get('scheduled_at'):
+        scheduled_at = parse_datetime(data['scheduled_at'])
+        if scheduled_at is None:
+            raise ValueError('Nieprawidłowa data rozpoczęcia wysyłki')
+        # datetime-local nie ma strefy - to czas lokalny kampanii
+        schedule['scheduled_at'] = timezone.make_aware(scheduled_at, get_campaign_timezone())
+    
+    for field in ('send_window_start', 'send_window_end'):
+        if data.get(field):
+            schedule[field] = parse_time(data[field])
+            if schedule[field] is None:
+                raise ValueError('Nieprawidłowa godzina okna wysyłki')
+    if bool(schedule['send_window_start']) != bool(schedule['send_window_end']):
+        raise ValueError('Okno wysyłki wymaga podania godziny początku i końca')
+    if schedule['send_window_start'] and schedule['send_window_start'] == schedule['send_window_end']:
+        raise ValueError('Początek i koniec okna wysyłki muszą się różnić')
+    
+    if data.get('spread_minutes'):
+        try:
+            schedule['spread_minutes'] = int(data['spread_minutes'])
+        except ValueError:
+            raise ValueError('Czas rozłożenia wysyłki musi być liczbą minut')
+        if schedule['spread_minutes'] < 1:
+            raise ValueError('Czas rozłożenia wysyłki musi być dodatni')
+    
+    return schedule
+
+
 def edit_campaign(request, campaign_id):
     """Widok edycji kampanii"""
     campaign = get_object_or_404(Campaign, uid=campaign_id)
+    context = {
+        'campaign': campaign,
+        'campaign_timezone': get_campaign_timezone(),
+        'preview_recipients': campaign.recipients.select_related('contact')[:5],
+    }
     
     # Sprawdź czy kampania może być edytowana
     if campaign.is_completed or campaign.sent_at:
@@ -160,18 +268,35 @@ def edit_campaign(request, campaign_id):
             # Walidacja
             if not all([campaign_name, message_type, message_content]):
                 messages.error(request, 'Wszystkie pola są wymagane')
-                return render(request, 'sender/edit_campaign.html', {'campaign': campaign})
+                return render(request, 'sender/edit_campaign.html', context)
             
             if message_type not in ['email', 'sms', 'both']:
                 messages.error(request, 'Nieprawidłowy typ wiadomości')
-                return render(request, 'sender/edit_campaign.html', {'campaign': campaign})
+                return render(request, 'sender/edit_campaign.html', context)
+            
+            try:
+                schedule = _parse_schedule(request.POST)
+            except ValueError as e:
+                messages.error(request, str(e))
+                return render(request, 'sender/edit_campaign.html', context)
             
             # Aktualizuj kampanię
+            content_changed = message_content != campaign.message_content
+            sms_settings = (campaign.message_type, campaign.sms_transliterate)
             campaign.name = campaign_name
             campaign.message_type = message_type
             campaign.message_content = message_content
+            campaign.sms_transliterate = request.POST.get('sms_transliterate') == 'on'
+            for field, value in schedule.items():
+                setattr(campaign, field, value)
             campaign.save()
             
+            # Nowa treść - odbiorcy renderowani ponownie w tle (do tego czasu treść liczona na bieżąco)
+            if content_changed:
+                schedule_render(campaign)
+            elif sms_settings != (campaign.message_type, campaign.sms_transliterate):
+                schedule_estimate(campaign)
+            
             messages.success(request, 'Kampania została zaktualizowana')
             return redirect('campaign_status', campaign_id=campaign_id)
             
@@ -179,7 +304,7 @@ def edit_campaign(request, campaign_id):
             logger.error(f"Error updating campaign: {str(e)}")
             messages.error(request, f'Błąd podczas aktualizacji: {str(e)}')
     
-    return render(request, 'sender/edit_campaign.html', {'campaign': campaign})
+    return render(request, 'sender/edit_campaign.html', context)
 
 
 @require_http_methods(["DELETE", "POST"])
@@ -202,6 +327,7 @@ def delete_campaign(request, campaign_id):
         
         # Usuń kampanię (CASCADE usunie również odbiorców i logi)
         campaign.delete()
+        MessageBody.purge_orphans()
         
         return JsonResponse({
             'success': True,
@@ -224,22 +350,40 @@ def duplicate_campaign(request, campaign_id):
             name=f"{original_campaign.name} (kopia)",
             message_type=original_campaign.message_type,
             message_content=original_campaign.message_content,
-            excel_columns=original_campaign.excel_columns
+            sms_transliterate=original_campaign.sms_transliterate,
+            excel_columns=original_campaign.excel_columns,
+            render_summary=original_campaign.render_summary,
+            # Ta sama treść i odbiorcy - szacunek SMS bez zmian
+            sms_estimate=original_campaign.sms_estimate,
         )
         
-        # Skopiuj odbiorców (tylko tych którzy nie zostali wysłani)
+        # Skopiuj odbiorców porcjami - wskazują te same kontakty, status zawsze pending
         recipients_copied = 0
-        for recipient in original_campaign.recipients.all():
-            Recipient.objects.create(
+        batch = []
+        recipients = original_campaign.recipients.only(
+            'contact', 'sort_name', 'extra_data', 'row_hash', 'rendered_message', 'rendered_digest',
+        ).order_by('uid')
+        for recipient in recipients.iterator(chunk_size=INGEST_BATCH_SIZE):
+            batch.append(Recipient(
                 campaign=new_campaign,
-                first_name=recipient.first_name,
-                last_name=recipient.last_name,
-                email=recipient.email,
-                phone=recipient.phone,
+                contact_id=recipient.contact_id,
+                sort_name=recipient.sort_name,
                 extra_data=recipient.extra_data,
-                status='pending'  # Zawsze ustawiaj jako pending
-            )
-            recipients_copied += 1
+                row_hash=recipient.row_hash,
+                # Ta sama treść kampanii - wyrenderowana wiadomość pozostaje aktualna
+                rendered_message=recipient.rendered_message,
+                rendered_digest=recipient.rendered_digest,
+            ))
+            if len(batch) >= INGEST_BATCH_SIZE:
+                Recipient.objects.bulk_create(batch)
+                recipients_copied += len(batch)
+                batch = []
+        if batch:
+            Recipient.objects.bulk_create(batch)
+            recipients_copied += len(batch)
+        
+        if not is_estimate_current(new_campaign):
+            schedule_estimate(new_campaign)
         
         return JsonResponse({
             'success': True,
@@ -272,7 +416,7 @@ def upload_excel(request):
         
         # Wczytaj Excel
         try:
-            df = pd.read_excel(excel_file)
+            df = read_workbook(excel_file)
         except Exception as e:
             return JsonResponse({'success': False, 'error': f'Błąd odczytu pliku Excel: {str(e)}'})
         
@@ -335,17 +479,7 @@ def upload_excel(request):
         logger.info(f"Extra columns: {extra_columns}")
         
         # Przygotuj przykładowe dane (pierwsze 5 wierszy)
-        sample_data = []
-        for _, row in df.head(5).iterrows():
-            row_data = {}
-            for col in columns:
-                value = row[col]
-                # Konwertuj NaN na None/pusty string
-                if pd.isna(value):
-                    row_data[col] = ''
-                else:
-                    row_data[col] = str(value).strip()
-            sample_data.append(row_data)
+        sample_data = sample_rows(df, 5)
         
         response_data = {
             'success': True,
@@ -384,36 +518,10 @@ def create_campaign(request):
             return JsonResponse({'success': False, 'error': 'Nieprawidłowy typ wiadomości'})
         
         # Wczytaj ponownie Excel
-        df = pd.read_excel(excel_file)
+        df = read_workbook(excel_file)
         
         # Mapowanie kolumn (podobnie jak w upload_excel) - ulepszone
-        columns = df.columns.tolist()
-        mapped_columns = {}
-        
-        for col in columns:
-            col_lower = col.lower().strip()
-            if any(keyword in col_lower for keyword in ['imię', 'imie', 'first', 'name', 'first_name']):
-                if 'first_name' not in mapped_columns:
-                    mapped_columns['first_name'] = col
-            elif any(keyword in col_lower for keyword in ['nazwisko', 'last', 'surname', 'last_name']):
-                if 'last_name' not in mapped_columns:
-                    mapped_columns['last_name'] = col
-            elif any(keyword in col_lower for keyword in ['email', 'e-mail', 'mail']):
-                if 'email' not in mapped_columns:
-                    mapped_columns['email'] = col
-            elif any(keyword in col_lower for keyword in ['telefon', 'phone', 'tel', 'mobile', 'komórka', 'komórki', 'gsm', 'numer']):
-                if 'phone' not in mapped_columns:
-                    mapped_columns['phone'] = col
-        
-        # Ustawienia domyślne jeśli nie znaleziono
-        if 'first_name' not in mapped_columns and len(columns) > 0:
-            mapped_columns['first_name'] = columns[0]
-        if 'last_name' not in mapped_columns and len(columns) > 1:
-            mapped_columns['last_name'] = columns[1]
-        
-        # Dodatkowe kolumny
-        basic_columns = set(mapped_columns.values())
-        extra_columns = [col for col in columns if col not in basic_columns]
+        mapped_columns, extra_columns = map_columns(df.columns.tolist())
         
         # Utwórz kampanię
         campaign = Campaign.objects.create(
@@ -424,78 +532,20 @@ def create_campaign(request):
         )
         
         # Dodaj odbiorców
-        recipients_created = 0
-        skipped_recipients = 0
+        rows = iter_recipient_rows(df, mapped_columns, extra_columns, message_type)
+        recipients_created, skipped_recipients, suppressed_recipients = ingest_recipients(campaign, rows)
         
-        for _, row in df.iterrows():
-            try:
-                # Podstawowe dane
-                first_name = str(row.get(mapped_columns.get('first_name', ''), '')).strip()
-                last_name = str(row.get(mapped_columns.get('last_name', ''), '')).strip()
-                email = str(row.get(mapped_columns.get('email', ''), '')).strip()
-                phone = str(row.get(mapped_columns.get('phone', ''), '')).strip()
-                
-                # Sprawdź czy mamy minimum dane
-                if not first_name and not last_name:
-                    skipped_recipients += 1
-                    continue
-                
-                # Walidacja email
-                if email and email != 'nan':
-                    email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-                    if not re.match(email_pattern, email):
-                        email = None
-                else:
-                    email = None
-                
-                # Walidacja telefonu
-                if phone and phone != 'nan':
-                    # Usuń wszystko oprócz cyfr, + i spacji
-                    phone = re.sub(r'[^\d\+\s\-\(\)]', '', phone)
-                    if len(phone.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')) < 9:
-                        phone = None
-                else:
-                    phone = None
-                
-                # Sprawdź czy mamy przynajmniej email lub telefon dla danego typu kampanii
-                if message_type == 'email' and not email:
-                    skipped_recipients += 1
-                    continue
-                elif message_type == 'sms' and not phone:
-                    skipped_recipients += 1
-                    continue
-                elif message_type == 'both' and not email and not phone:
-                    skipped_recipients += 1
-                    continue
-                
-                # Dodatkowe dane
-                extra_data = {}
-                for col in extra_columns:
-                    value = row.get(col, '')
-                    if pd.notna(value):
-                        extra_data[col] = str(value).strip()
-                
-                # Utwórz odbiorcę
-                recipient = Recipient.objects.create(
-                    campaign=campaign,
-                    first_name=first_name or 'Brak',
-                    last_name=last_name or 'Danych',
-                    email=email,
-                    phone=phone,
-                    extra_data=extra_data
-                )
-                recipients_created += 1
-                
-            except Exception as e:
-                logger.error(f"Error creating recipient: {str(e)}")
-                skipped_recipients += 1
-                continue
+        # Wyrenderuj treści od razu - brakujące zmienne widać przed wysyłką
+        render_summary = render_campaign(campaign)
+        refresh_campaign_estimate(campaign)
         
         return JsonResponse({
             'success': True,
             'campaign_id': str(campaign.uid),
             'recipients_created': recipients_created,
             'skipped_recipients': skipped_recipients,
+            'suppressed_recipients': suppressed_recipients,
+            'missing_variables': render_summary['missing'] if render_summary else {},
             'total_rows': len(df),
             'redirect_url': f'/campaign-status/{campaign.uid}/?created=1'
         })
@@ -505,6 +555,47 @@ def create_campaign(request):
         return JsonResponse({'success': False, 'error': f'Błąd serwera: {str(e)}'})
 
 
+@require_http_methods(["POST"])
+def update_recipients(request, campaign_id):
+    """AJAX endpoint do aktualizacji odbiorców kampanii z nowej wersji pliku (tylko różnice)"""
+    try:
+        if 'excel_file' not in request.FILES:
+            return JsonResponse({'success': False, 'error': 'Brak pliku'})
+        
+        excel_file = request.FILES['excel_file']
+        if not excel_file.name.lower().endswith(('.xlsx', '.xls')):
+            return JsonResponse({'success': False, 'error': 'Nieprawidłowy format pliku'})
+        
+        try:
+            df = read_workbook(excel_file)
+        except Exception as e:
+            return JsonResponse({'success': False, 'error': f'Błąd odczytu pliku Excel: {str(e)}'})
+        
+        mapped_columns, extra_columns = map_columns(df.columns.tolist())
+        
+        with transaction.atomic(using=router.db_for_write(Campaign)):
+            # Blokada kampanii - równoległa wysyłka nie wystartuje w trakcie podmiany listy
+            campaign = get_object_or_404(Campaign.objects.select_for_update(), uid=campaign_id)
+            if campaign.status != 'draft':
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Odbiorców można aktualizować tylko w kampanii, która nie jest wysyłana'
+                })
+            
+            rows = iter_recipient_rows(df, mapped_columns, extra_columns, campaign.message_type)
+            results = reimport_recipients(campaign, rows)
+            
+            if campaign.excel_columns != mapped_columns:
+                campaign.excel_columns = mapped_columns
+                Campaign.objects.filter(pk=campaign.pk).update(excel_columns=mapped_columns)
+        
+        return JsonResponse({'success': True, 'results': results, 'total_rows': len(df)})
+        
+    except Exception as e:
+        logger.error(f"Error in update_recipients: {str(e)}")
+        return JsonResponse({'success': False, 'error': f'Błąd serwera: {str(e)}'})
+
+
 @require_http_methods(["POST"])
 def send_campaign(request, campaign_id):
     """Endpoint do wysyłania kampanii"""
@@ -520,106 +611,40 @@ def send_campaign(request, campaign_id):
         if not pending_recipients.exists():
             return JsonResponse({'success': False, 'error': 'Brak odbiorców do wysłania'})
         
+        # Kampania planowana trafia tylko do kolejki - odbiorców wypuszcza scheduler (run_scheduler)
+        if campaign.is_scheduled:
+            if campaign.status == 'draft':
+                campaign.transition_to('queued', scheduled_at=campaign.scheduled_at or timezone.now())
+            return JsonResponse({
+                'success': True,
+                'scheduled': True,
+                'scheduled_at': campaign.scheduled_at.isoformat() if campaign.scheduled_at else None,
+                'results': {'sent': 0, 'failed': 0, 'skipped': 0},
+                'campaign_completed': False
+            })
+        
         # Utwórz instancję serwisu wysyłania
         sender = MessageSender()
         
-        # Rezultaty
-        results = {
-            'sent': 0,
-            'failed': 0,
-            'skipped': 0
-        }
+        # draft → queued → sending; jeśli ktoś inny już wysyła tę kampanię, przejście się nie uda
+        if campaign.status == 'draft':
+            campaign.transition_to('queued')
+        if not campaign.transition_to('sending'):
+            return JsonResponse({'success': False, 'error': 'Kampania jest już wysyłana'})
         
-        # Wysyłaj wiadomości
-        for recipient in pending_recipients:
-            try:
-                # Przygotuj zmienne do podstawienia
-                variables = recipient.get_message_variables()
-                
-                # Podstaw zmienne w treści wiadomości
-                message = campaign.message_content
-                for var_name, var_value in variables.items():
-                    if var_value:
-                        message = message.replace(f'{{{{{var_name}}}}}', str(var_value))
-                
-                # Wyślij wiadomość w zależności od typu kampanii
-                success = False
-                error_message = None
-                
-                if campaign.message_type == 'email' and recipient.email:
-                    success, error_message = sender.send_email(
-                        recipient.email, 
-                        campaign.name, 
-                        message
-                    )
-                elif campaign.message_type == 'sms' and recipient.phone:
-                    success, error_message = sender.send_sms(recipient.phone, message)
-                elif campaign.message_type == 'both':
-                    # Wysyłaj email i SMS
-                    email_success = False
-                    sms_success = False
-                    errors = []
-                    
-                    if recipient.email:
-                        email_success, email_error = sender.send_email(
-                            recipient.email, 
-                            f'{campaign.name}', 
-                            message
-                        )
-                        if not email_success and email_error:
-                            errors.append(f"Email: {email_error}")
-                    
-                    if recipient.phone:
-                        sms_success, sms_error = sender.send_sms(recipient.phone, message)
-                        if not sms_success and sms_error:
-                            errors.append(f"SMS: {sms_error}")
-                    
-                    success = email_success or sms_success
-                    error_message = '; '.join(errors) if errors else None
-                
-                # Aktualizuj status odbiorcy
-                if success:
-                    recipient.status = 'sent'
-                    recipient.sent_at = timezone.now()
-                    recipient.error_message = None
-                    results['sent'] += 1
-                else:
-                    recipient.status = 'failed'
-                    recipient.error_message = error_message or 'Nieznany błąd'
-                    results['failed'] += 1
-                
-                recipient.save()
-                
-                # Utwórz log wiadomości
-                if campaign.message_type in ['email', 'both'] and recipient.email:
-                    MessageLog.objects.create(
-                        recipient=recipient,
-                        message_type='email',
-                        final_message=message,
-                        success=success
-                    )
-                
-                if campaign.message_type in ['sms', 'both'] and recipient.phone:
-                    MessageLog.objects.create(
-                        recipient=recipient,
-                        message_type='sms',
-                        final_message=message,
-                        success=success
-                    )
-                
-            except Exception as e:
-                logger.error(f"Error sending to recipient {recipient.uid}: {str(e)}")
-                recipient.status = 'failed'
-                recipient.error_message = f'Błąd serwera: {str(e)}'
-                recipient.save()
-                results['failed'] += 1
-        
-        # Sprawdź czy kampania jest zakończona
-        remaining_pending = campaign.recipients.filter(status='pending').count()
-        if remaining_pending == 0:
-            campaign.is_completed = True
-            campaign.sent_at = timezone.now()
-            campaign.save()
+        try:
+            results, paused = dispatch_recipients(campaign, pending_recipients.select_related('contact'), sender)
+        finally:
+            # Zakończ wysyłkę - status kampanii zmienia się tylko tutaj, na ścieżce zapisu
+            finish_sending(campaign)
+        
+        if paused:
+            return JsonResponse({
+                'success': False,
+                'paused': True,
+                'error': f'Wysyłka wstrzymana: {paused}. Pozostali odbiorcy czekają na ponowienie.',
+                'results': results,
+            })
         
         return JsonResponse({
             'success': True,
@@ -632,31 +657,28 @@ def send_campaign(request, campaign_id):
         return JsonResponse({'success': False, 'error': f'Błąd serwera: {str(e)}'})
 
 
-def api_campaign_status(request, campaign_id):
-    """API endpoint dla real-time updates statusu kampanii"""
+async def api_campaign_status(request, campaign_id):
+    """API endpoint dla real-time updates statusu kampanii (async - odpytywany co kilka sekund przez wielu klientów)"""
     try:
-        campaign = get_object_or_404(Campaign, uid=campaign_id)
-        
-        # Pobierz aktualne statystyki
-        recipients = campaign.recipients.all()
-        stats = {
-            'total': recipients.count(),
-            'sent': recipients.filter(status='sent').count(),
-            'failed': recipients.filter(status='failed').count(),
-            'pending': recipients.filter(status='pending').count(),
-            'skipped': recipients.filter(status='skipped').count(),
-        }
-        
-        # Sprawdź czy kampania jest zakończona
-        if stats['pending'] == 0 and stats['total'] > 0 and not campaign.is_completed:
-            campaign.is_completed = True
-            campaign.save()
+        campaign = await Campaign.objects.filter(uid=campaign_id).afirst()
+        if campaign is None:
+            raise Http404('Kampania nie istnieje')
+        
+        # Pobierz aktualne statystyki - jedno zapytanie z agregacją warunkową
+        stats = await campaign.recipients.aaggregate(
+            total=Count('uid'),
+            sent=Count('uid', filter=Q(status='sent')),
+            failed=Count('uid', filter=Q(status='failed')),
+            pending=Count('uid', filter=Q(status='pending')),
+            skipped=Count('uid', filter=Q(status='skipped')),
+        )
         
         return JsonResponse({
             'success': True,
             'stats': stats,
             'campaign': {
                 'name': campaign.name,
+                'status': campaign.status,
                 'is_completed': campaign.is_completed,
                 'sent_at': campaign.sent_at.isoformat() if campaign.sent_at else None
             }
@@ -668,4 +690,32 @@ def api_campaign_status(request, campaign_id):
     
     
 def template(request):
-    return render(request, 'sender/template.html')
\ No newline at end of file
+    return render(request, 'sender/template.html')
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """Metryki procesu w formacie tekstowym Prometheusa"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    
+    return HttpResponse(REGISTRY.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_http_methods(["GET", "POST"])
+def query_profile(request):
+    """Raport profilera zapytań - ostatnie żądania i zestawienie per widok"""
+    if not profiling.is_enabled():
+        raise Http404
+    
+    if request.method == 'POST':
+        profiling.report.clear()
+        return redirect('query_profile')
+    
+    context = {
+        'entries': profiling.report.snapshot(),
+        'views': profiling.report.by_view(),
+        'history': profiling.PROFILER_HISTORY,
+    }
+    return render(request, 'sender/query_profile.html', context)